@@ -0,0 +1 @@
+python -m bench "$@"
@@ -0,0 +1,66 @@
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from corpus import DEFAULT_MIX, parse_mix, generate_corpus  # noqa: E402
+import suite  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m bench",
+        description="Benchmark the markdown parser, renderer and full builds"
+    )
+    parser.add_argument("--pages", type=int, default=200,
+                        help="Number of pages in the full build benchmark")
+    parser.add_argument("--blocks", type=int, default=20,
+                        help="Blocks per generated page")
+    parser.add_argument("--words", type=int, default=40,
+                        help="Average words per block")
+    parser.add_argument("--density", type=float, default=0.2,
+                        help="Probability of a word having inline markup")
+    parser.add_argument(
+        "--mix", type=parse_mix, default=DEFAULT_MIX,
+        help="Block type weights, e.g. paragraph=6,code=1,ordered_list=1"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="Worker processes for the full build")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", type=str,
+                        help="Only run benchmarks whose name contains this")
+    parser.add_argument("--skip-build", action="store_true",
+                        help="Only run the function benchmarks")
+    parser.add_argument("--save", type=str,
+                        help="Write the results as JSON to this path")
+    parser.add_argument("--compare", type=str,
+                        help="Compare against results saved with --save")
+    parser.add_argument(
+        "--generate", type=str, metavar="DIR",
+        help="Only write the synthetic content tree to DIR and exit"
+    )
+    args = parser.parse_args()
+    corpus_options = {
+        "seed": args.seed, "blocks": args.blocks, "words": args.words,
+        "block_mix": args.mix, "inline_density": args.density,
+    }
+
+    if args.generate:
+        paths = generate_corpus(args.generate, pages=args.pages,
+                                **corpus_options)
+        print(f"{len(paths)} pages written to {args.generate}")
+        return
+
+    report = suite.run(pages=args.pages, jobs=args.jobs, repeat=args.repeat,
+                       only=args.only, skip_build=args.skip_build,
+                       **corpus_options)
+    if args.save:
+        suite.save(report, args.save)
+        print(f"Results saved to {args.save}")
+    if args.compare:
+        suite.compare(report, args.compare)
+
+
+main()
@@ -0,0 +1,140 @@
+"""Reproducible synthetic markdown content for benchmarks.
+
+The same seed and parameters always produce byte-identical pages, so two
+benchmark runs on different commits parse exactly the same input.
+"""
+import os
+import random
+
+WORDS = (
+    "hobbit ring shire elf dwarf wizard mountain river forest road tower "
+    "king sword shield journey fellowship valley gate stone fire shadow "
+    "light star song horse bridge lake hall feast map door key tree leaf"
+).split()
+
+# relative weight of each block type in a page
+DEFAULT_MIX = {
+    "paragraph": 6,
+    "heading": 2,
+    "unordered_list": 2,
+    "ordered_list": 1,
+    "quote": 1,
+    "code": 1,
+}
+
+
+def parse_mix(text) -> dict:
+    """Parse a block mix like "paragraph=6,code=1" into a weight dict."""
+    mix = {}
+    for item in text.split(","):
+        block_type, _, weight = item.partition("=")
+        block_type = block_type.strip()
+        if block_type not in DEFAULT_MIX:
+            raise ValueError(f"Unknown block type in mix: {block_type}")
+        mix[block_type] = float(weight or 1)
+    return mix
+
+
+class PageGenerator:
+    """Generates markdown pages from a seeded random number generator.
+
+    words is the average number of words per block and inline_density the
+    probability that a word is wrapped in inline markup (bold, italic,
+    code, link or image).
+    """
+    def __init__(self, seed=0, blocks=20, words=40, block_mix=None,
+                 inline_density=0.2):
+        self.rng = random.Random(seed)
+        self.blocks = blocks
+        self.words = words
+        self.block_mix = block_mix or DEFAULT_MIX
+        self.inline_density = inline_density
+
+
+    def _word_count(self):
+        return max(1, int(self.rng.gauss(self.words, self.words / 4)))
+
+
+    def _plain(self, count):
+        return " ".join(self.rng.choice(WORDS) for _ in range(count))
+
+
+    def _inline(self, count):
+        words = []
+        for _ in range(count):
+            word = self.rng.choice(WORDS)
+            if self.rng.random() < self.inline_density:
+                markup = self.rng.randrange(5)
+                if markup == 0:
+                    word = f"**{word}**"
+                elif markup == 1:
+                    word = f"*{word}*"
+                elif markup == 2:
+                    word = f"`{word}`"
+                elif markup == 3:
+                    word = f"[{word}](https://example.com/{word})"
+                else:
+                    word = f"![{word}](/images/{word}.png)"
+            words.append(word)
+        return " ".join(words)
+
+
+    def _lines(self, count):
+        # split the block's words over a few lines
+        per_line = max(1, count // self.rng.randint(2, 6))
+        lines = []
+        while count > 0:
+            lines.append(self._inline(min(per_line, count)))
+            count -= per_line
+        return lines
+
+
+    def block(self, block_type):
+        count = self._word_count()
+        if block_type == "heading":
+            level = self.rng.randint(2, 6)
+            return f"{'#' * level} {self._inline(min(count, 8))}"
+        if block_type == "code":
+            # no inline markup, the parser also reads code blocks as inline
+            lines = [self._plain(max(1, count // 4)) for _ in range(4)]
+            return "```\n" + "\n".join(lines) + "\n```"
+        if block_type == "quote":
+            return "\n".join(f"> {line}" for line in self._lines(count))
+        if block_type == "unordered_list":
+            return "\n".join(f"- {line}" for line in self._lines(count))
+        if block_type == "ordered_list":
+            # ordered list items are sliced after "n. ", so stay under 10
+            lines = self._lines(count)[:9]
+            return "\n".join(f"{i + 1}. {line}" for i, line in enumerate(lines))
+        return "\n".join(self._lines(count))
+
+
+    def page(self) -> str:
+        block_types = list(self.block_mix)
+        weights = [self.block_mix[block_type] for block_type in block_types]
+        blocks = [f"# {self._plain(4).title()}"]
+        for block_type in self.rng.choices(block_types, weights,
+                                           k=self.blocks):
+            blocks.append(self.block(block_type))
+        return "\n\n".join(blocks) + "\n"
+
+
+def generate_corpus(dest_dir, pages=100, pages_per_dir=20, **options) -> list:
+    """Write a content tree of markdown pages and return their paths.
+
+    Pages are spread over subdirectories of pages_per_dir files each, so
+    the tree walk is exercised too. options are passed to PageGenerator.
+    """
+    generator = PageGenerator(**options)
+    paths = []
+    for i in range(pages):
+        if i == 0:
+            path = os.path.join(dest_dir, "index.md")
+        else:
+            path = os.path.join(dest_dir, f"section{i // pages_per_dir}",
+                                f"page{i}.md")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(generator.page())
+        paths.append(path)
+    return paths
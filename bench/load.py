@@ -0,0 +1,368 @@
+"""Load generator for server.py, replaying the urls of a generated site.
+
+Run with python -m bench.load. Requests are made from a single asyncio
+event loop over keep-alive connections, either by a fixed number of
+clients sending one request after the other (--concurrency) or at a fixed
+rate whatever the response times (--rate). In the latter, latency is
+measured from the time a request was due, so a server falling behind
+shows up in the percentiles instead of slowing the load down.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import platform
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from walk import walk_tree  # noqa: E402
+
+# compressed copies are requested through Accept-Encoding, not by name
+SKIPPED_SUFFIXES = (".gz", ".br", ".zst", ".tmp")
+# seconds a request may take before it counts as an error
+REQUEST_TIMEOUT = 10.0
+
+
+def collect_urls(public_dir) -> list:
+    """Return the url path of every file in public_dir, and of every
+    directory with an index.html, sorted."""
+    urls = []
+    for _, rel_dir, files in walk_tree(public_dir):
+        prefix = "/" + "".join(f"{part}/" for part in rel_dir.split(os.sep)
+                               if part)
+        for entry in files:
+            if entry.name.endswith(SKIPPED_SUFFIXES):
+                continue
+            urls.append(prefix + entry.name)
+            if entry.name == "index.html":
+                urls.append(prefix)
+    return sorted(urls)
+
+
+class Connection:
+    """A keep-alive HTTP/1.1 connection reading Content-Length bodies."""
+    def __init__(self, host, port, headers):
+        self.host = host
+        self.port = port
+        self.headers = headers
+        self.reader = None
+        self.writer = None
+
+
+    async def request(self, path) -> tuple:
+        """GET path and return (status, body bytes)."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        self.writer.write(
+            f"GET {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+            f"{self.headers}\r\n".encode()
+        )
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed by the server")
+        status = int(status_line.split()[1])
+        length = None
+        keep_alive = True
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name = name.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "connection" and value.strip().lower() == "close":
+                keep_alive = False
+        if length is None:
+            body = await self.reader.read()
+            keep_alive = False
+        else:
+            body = await self.reader.readexactly(length)
+        if not keep_alive:
+            self.close()
+        return status, len(body)
+
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+class LoadRun:
+    """Collects the outcome of every request of a run.
+
+    A request that takes longer than timeout seconds is given up on, its
+    connection closed, and counted as a TimeoutError.
+    """
+    def __init__(self, timeout=REQUEST_TIMEOUT):
+        self.timeout = timeout
+        self.latencies = []
+        self.statuses = {}
+        self.errors = {}
+        self.bytes = 0
+
+
+    async def timed_request(self, connection, path, due):
+        try:
+            status, body_bytes = await asyncio.wait_for(
+                connection.request(path), self.timeout
+            )
+        except (OSError, ValueError, IndexError, asyncio.TimeoutError,
+                asyncio.IncompleteReadError) as e:
+            # the connection may be half way through a response
+            connection.close()
+            name = type(e).__name__
+            self.errors[name] = self.errors.get(name, 0) + 1
+            return
+        self.latencies.append(time.perf_counter() - due)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.bytes += body_bytes
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1,
+                max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_closed(run, urls, host, port, headers, concurrency, duration,
+                     requests, rng):
+    # every client sends its next request as soon as it got a response
+    deadline = time.perf_counter() + duration
+    remaining = [requests]
+
+    async def client():
+        connection = Connection(host, port, headers)
+        try:
+            while time.perf_counter() < deadline:
+                if requests:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                await run.timed_request(connection, rng.choice(urls),
+                                        time.perf_counter())
+        finally:
+            connection.close()
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+
+
+async def run_open(run, urls, host, port, headers, concurrency, duration,
+                   requests, rate, rng):
+    # requests are due at a fixed rate and wait for one of the concurrency
+    # connections, which counts in their latency
+    pool = asyncio.Queue()
+    for _ in range(concurrency):
+        pool.put_nowait(Connection(host, port, headers))
+    total = requests or int(rate * duration)
+    start = time.perf_counter()
+    tasks = []
+
+    async def send(path, due):
+        connection = await pool.get()
+        try:
+            await run.timed_request(connection, path, due)
+        finally:
+            pool.put_nowait(connection)
+
+    for i in range(total):
+        due = start + i / rate
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(send(rng.choice(urls), due)))
+    await asyncio.gather(*tasks)
+    while not pool.empty():
+        pool.get_nowait().close()
+
+
+def run_load(urls, host="localhost", port=8888, concurrency=16, rate=None,
+             duration=10.0, requests=None, accept_encoding="gzip",
+             seed=0, timeout=REQUEST_TIMEOUT) -> dict:
+    """Send requests for random urls and return the results of the run.
+
+    With a rate, requests are sent at that many per second over up to
+    concurrency connections, otherwise concurrency clients send them back
+    to back. The run lasts duration seconds, or until requests requests
+    have been sent if given. Requests without a response after timeout
+    seconds count as errors.
+    """
+    rng = random.Random(seed)
+    headers = f"Accept-Encoding: {accept_encoding}\r\n" if accept_encoding else ""
+    run = LoadRun(timeout)
+    start = time.perf_counter()
+    if rate:
+        coroutine = run_open(run, urls, host, port, headers, concurrency,
+                             duration, requests, rate, rng)
+    else:
+        coroutine = run_closed(run, urls, host, port, headers, concurrency,
+                               duration, requests, rng)
+    asyncio.run(coroutine)
+    elapsed = time.perf_counter() - start
+    latencies = sorted(run.latencies)
+    completed = len(latencies)
+    failed_statuses = sum(count for status, count in run.statuses.items()
+                          if status >= 400)
+    return {
+        "requests": completed + sum(run.errors.values()),
+        "elapsed_s": elapsed,
+        "throughput_rps": completed / elapsed,
+        "throughput_mib_s": run.bytes / elapsed / (1024 * 1024),
+        "latency_ms": {
+            name: (value * 1000 if value is not None else None)
+            for name, value in [
+                ("p50", percentile(latencies, 0.50)),
+                ("p95", percentile(latencies, 0.95)),
+                ("p99", percentile(latencies, 0.99)),
+                ("max", latencies[-1] if latencies else None),
+            ]
+        },
+        "statuses": {str(status): count
+                     for status, count in sorted(run.statuses.items())},
+        "errors": failed_statuses + sum(run.errors.values()),
+        "connection_errors": run.errors,
+    }
+
+
+def print_results(results):
+    latency = results["latency_ms"]
+    print(f"{results['requests']} requests in {results['elapsed_s']:.2f}s: "
+          f"{results['throughput_rps']:.0f} req/s, "
+          f"{results['throughput_mib_s']:.2f} MiB/s")
+    if latency["p50"] is not None:
+        print(f"latency p50 {latency['p50']:.2f} ms, "
+              f"p95 {latency['p95']:.2f} ms, p99 {latency['p99']:.2f} ms, "
+              f"max {latency['max']:.2f} ms")
+    print(f"statuses {results['statuses']}, {results['errors']} errors "
+          f"{results['connection_errors'] or ''}")
+
+
+def compare(results, baseline_path):
+    """Print how a run changed against a saved one."""
+    with open(baseline_path, 'r') as f:
+        baseline = json.load(f)
+    if baseline["meta"]["params"] != results["meta"]["params"]:
+        print("warning: the baseline was run with different parameters")
+    old = baseline["results"]
+    new = results["results"]
+    print(f"\n{'metric':<20} {'baseline':>12} {'current':>12} {'change':>8}")
+    rows = [("throughput req/s", old["throughput_rps"], new["throughput_rps"])]
+    rows += [(f"latency {name} ms", old["latency_ms"][name],
+              new["latency_ms"][name]) for name in ("p50", "p95", "p99")]
+    rows.append(("errors", old["errors"], new["errors"]))
+    for name, before, after in rows:
+        if before is None or after is None:
+            continue
+        change = f"{after / before - 1:>+8.1%}" if before else ""
+        print(f"{name:<20} {before:>12.2f} {after:>12.2f} {change}")
+
+
+def wait_for_port(host, port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m bench.load",
+        description="Load test server.py with the urls of a generated site"
+    )
+    parser.add_argument("--public", type=str, default="public",
+                        help="Generated site whose files are requested")
+    parser.add_argument("--host", type=str, default="localhost")
+    parser.add_argument("--port", type=int, default=8888)
+    parser.add_argument("--concurrency", "-c", type=int, default=16,
+                        help="Number of clients, or of connections with "
+                             "--rate")
+    parser.add_argument("--rate", type=float,
+                        help="Send this many requests per second instead of "
+                             "as fast as the clients can")
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="Seconds the run lasts")
+    parser.add_argument("--requests", type=int,
+                        help="Stop after this many requests")
+    parser.add_argument("--accept-encoding", type=str, default="gzip",
+                        help="Accept-Encoding header sent, empty for none")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT,
+                        help="Seconds before a request counts as an error")
+    parser.add_argument(
+        "--spawn", action="store_true",
+        help="Start server.py --production on --public for the run"
+    )
+    parser.add_argument("--server-args", type=str, default="",
+                        help="Extra arguments of the spawned server")
+    parser.add_argument("--save", type=str,
+                        help="Write the results as JSON to this path")
+    parser.add_argument("--compare", type=str,
+                        help="Compare against results saved with --save")
+    args = parser.parse_args()
+
+    urls = collect_urls(args.public)
+    if not urls:
+        sys.exit(f"No files to request in {args.public}, build the site first")
+    server = None
+    if args.spawn:
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT_DIR, "server.py"),
+             "--production", "--dir", args.public, "--port", str(args.port)]
+            + args.server_args.split(),
+            stdout=subprocess.DEVNULL,
+        )
+    try:
+        wait_for_port(args.host, args.port)
+        print(f"Requesting {len(urls)} urls from {args.host}:{args.port}")
+        results = run_load(urls, args.host, args.port, args.concurrency,
+                           args.rate, args.duration, args.requests,
+                           args.accept_encoding, args.seed, args.timeout)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    print_results(results)
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "urls": len(urls),
+            "params": {
+                "concurrency": args.concurrency, "rate": args.rate,
+                "duration": args.duration, "requests": args.requests,
+                "accept_encoding": args.accept_encoding,
+                "timeout": args.timeout, "server_args": args.server_args,
+            },
+        },
+        "results": results,
+    }
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or ".", exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=1)
+        print(f"Results saved to {args.save}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""Micro benchmarks of the parser and renderer, and full build benchmarks."""
+import gc
+import io
+import os
+import sys
+import json
+import time
+import timeit
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from contextlib import redirect_stdout
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import markdown  # noqa: E402
+from astcache import dump_tree, load_tree  # noqa: E402
+from blockcache import BlockCache  # noqa: E402
+from textnode import TextNode  # noqa: E402
+from corpus import PageGenerator, generate_corpus  # noqa: E402
+
+TEMPLATE = "<html><title>{{ Title }}</title><body>{{ Content }}</body></html>"
+
+
+def measure(func, repeat=5, min_time=0.2) -> dict:
+    """Time func like timeit does and return the best and mean seconds per call."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    timings = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "best_s": min(timings),
+        "mean_s": sum(timings) / len(timings),
+        "calls": number * repeat,
+    }
+
+
+def measure_memory(func) -> dict:
+    """Return the peak and retained memory of one call to func.
+
+    Peak and retained sizes come from tracemalloc; allocated_blocks is the
+    number of memory blocks the result keeps alive, counted separately since
+    tracemalloc allocates blocks of its own.
+    """
+    gc.collect()
+    blocks_before = sys.getallocatedblocks()
+    result = func()
+    allocated_blocks = sys.getallocatedblocks() - blocks_before
+    del result
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        result = func()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "peak_kib": (peak - before) / 1024,
+        "retained_kib": (current - before) / 1024,
+        "allocated_blocks": allocated_blocks,
+    }
+
+
+def memory_benchmarks(page) -> dict:
+    """Return name -> callable whose memory use is measured."""
+    html_node = markdown.markdown_to_html_node(page)
+    return {
+        "text_to_textnode": lambda: [
+            markdown.text_to_textnode(block)
+            for block in markdown.markdown_to_blocks(page)
+        ],
+        "markdown_to_html_node": lambda: markdown.markdown_to_html_node(page),
+        "ParentNode.to_html": html_node.to_html,
+        "render_html": lambda: markdown.render_html(page),
+    }
+
+
+def micro_benchmarks(page) -> dict:
+    """Return name -> zero argument callable for every public function."""
+    blocks = markdown.markdown_to_blocks(page)
+    paragraphs = [block for block in blocks
+                  if markdown.block_to_block_type(block) == "paragraph"]
+    inline_text = " ".join(paragraphs).replace("\n", " ")
+    html_node = markdown.markdown_to_html_node(page)
+    # filled on the first call, so it measures a build where every block
+    # was rendered before
+    cache = BlockCache()
+    tree_data = dump_tree(html_node)
+
+    def text_nodes():
+        # split_nodes_image and split_nodes_link modify the nodes they are
+        # given, so every call starts from fresh ones
+        return [TextNode(paragraph, "text") for paragraph in paragraphs]
+
+    def delimiter_passes():
+        nodes = markdown.split_nodes_delimiter(text_nodes(), "**", "bold")
+        nodes = markdown.split_nodes_delimiter(nodes, "*", "italic")
+        return markdown.split_nodes_delimiter(nodes, "`", "code")
+
+    return {
+        "split_nodes_delimiter": delimiter_passes,
+        "split_nodes_image": lambda: markdown.split_nodes_image(text_nodes()),
+        "split_nodes_link": lambda: markdown.split_nodes_link(text_nodes()),
+        "text_to_textnode": lambda: markdown.text_to_textnode(inline_text),
+        "text_to_textnode[split]": lambda: markdown.text_to_textnode(
+            inline_text, tokenizer="split"
+        ),
+        "markdown_to_blocks": lambda: markdown.markdown_to_blocks(page),
+        "block_to_block_type": lambda: [
+            markdown.block_to_block_type(block) for block in blocks
+        ],
+        "markdown_to_html_node": lambda: markdown.markdown_to_html_node(page),
+        "ParentNode.to_html": html_node.to_html,
+        "render_html": lambda: markdown.render_html(page),
+        "render_html[block cache]": lambda: markdown.render_html(
+            page, cache=cache
+        ),
+        "dump_tree": lambda: dump_tree(html_node),
+        "load_tree": lambda: load_tree(tree_data),
+    }
+
+
+def build_benchmarks(tmp_dir, pages, jobs, corpus_options) -> dict:
+    """Time a full build of a generated corpus and a no-op rebuild of it."""
+    import main
+    from manifest import BuildManifest
+
+    content = os.path.join(tmp_dir, "content")
+    public = os.path.join(tmp_dir, "public")
+    template = os.path.join(tmp_dir, "template.html")
+    generate_corpus(content, pages=pages, **corpus_options)
+    with open(template, 'w') as f:
+        f.write(TEMPLATE)
+    results = {}
+    for name, use_manifest in [("build", False), ("rebuild_unchanged", True)]:
+        manifest = None
+        if use_manifest:
+            manifest = BuildManifest(os.path.join(tmp_dir, "manifest.json"))
+            manifest.start_build(template)
+            with redirect_stdout(io.StringIO()):
+                main.generate_pages_recursive(content, template, public,
+                                              manifest, jobs=jobs)
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            if manifest is not None:
+                manifest.start_build(template)
+            errors = main.generate_pages_recursive(content, template, public,
+                                                   manifest, jobs=jobs)
+        elapsed = time.perf_counter() - start
+        if errors:
+            raise RuntimeError(f"benchmark build failed: {errors[0][1]}")
+        results[f"{name}[{pages} pages, jobs={jobs}]"] = {
+            "best_s": elapsed, "mean_s": elapsed, "calls": 1,
+            "pages_per_s": pages / elapsed,
+        }
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+            text=True, check=True, cwd=os.path.dirname(SRC_DIR),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(pages=200, jobs=1, repeat=5, only=None, skip_build=False,
+        **corpus_options) -> dict:
+    """Run the suite and return the results with the parameters used."""
+    page = PageGenerator(**corpus_options).page()
+    results = {}
+    for name, func in micro_benchmarks(page).items():
+        if only and only not in name:
+            continue
+        results[name] = measure(func, repeat=repeat)
+        print(f"{name:<40} {results[name]['best_s'] * 1e6:>12.1f} us")
+    memory = {}
+    for name, func in memory_benchmarks(page).items():
+        if only and only not in name and only != "memory":
+            continue
+        memory[name] = measure_memory(func)
+        print(f"{'memory ' + name:<40} {memory[name]['peak_kib']:>12.1f} KiB "
+              f"peak, {memory[name]['allocated_blocks']} blocks kept")
+    if not skip_build and (not only or "build" in only):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            build_results = build_benchmarks(tmp_dir, pages, jobs,
+                                              corpus_options)
+        for name, result in build_results.items():
+            print(f"{name:<40} {result['best_s'] * 1e3:>12.1f} ms "
+                  f"({result['pages_per_s']:.0f} pages/s)")
+        results.update(build_results)
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "page_bytes": len(page.encode()),
+            "params": dict(corpus_options, pages=pages, jobs=jobs,
+                           repeat=repeat),
+        },
+        "results": results,
+        "memory": memory,
+    }
+
+
+def save(report, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=1)
+
+
+def compare(report, baseline_path):
+    """Print how every result changed against a saved report."""
+    with open(baseline_path, 'r') as f:
+        baseline = json.load(f)
+    if baseline["meta"]["params"] != report["meta"]["params"]:
+        print("warning: the baseline was run with different parameters")
+    print(f"\n{'benchmark':<40} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in report["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        ratio = result["best_s"] / old["best_s"]
+        print(f"{name:<40} {old['best_s'] * 1e3:>10.3f}ms "
+              f"{result['best_s'] * 1e3:>10.3f}ms {ratio - 1:>+8.1%}")
+    for name, result in report.get("memory", {}).items():
+        old = baseline.get("memory", {}).get(name)
+        if old is None:
+            continue
+        ratio = result["peak_kib"] / old["peak_kib"]
+        print(f"{'peak ' + name:<40} {old['peak_kib']:>9.1f}KiB "
+              f"{result['peak_kib']:>9.1f}KiB {ratio - 1:>+8.1%}")
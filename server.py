@@ -1,20 +1,1094 @@
 import os
+import sys
+import json
+import stat
+import time
+import errno
+import bisect
+import select
+import socket
+import fnmatch
+import hashlib
 import argparse
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+import threading
+import traceback
+import selectors
+import email.utils
+from io import BytesIO
+from functools import partial
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.server import (
+    HTTPServer, SimpleHTTPRequestHandler, ThreadingHTTPServer
+)
+from urllib.parse import unquote
 
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src")
 
-def run(
-    server_class=HTTPServer,
-    handler_class=SimpleHTTPRequestHandler,
-    port=8888,
-    directory=None,
-):
-    if directory:  # Change the current working directory if directory is specified
-        os.chdir(directory)
+FILE_CACHE_SIZE = 64 * 1024 * 1024
+FILE_CACHE_MAX_FILE_SIZE = 1024 * 1024
+FD_CACHE_SIZE = 128
+THREADS = 32
+# seconds an idle keep-alive connection is kept open
+KEEP_ALIVE_TIMEOUT = 15
+# seconds a thread waits on a client stalled in the middle of a request
+READ_TIMEOUT = 15
+COPY_CHUNK_SIZE = 64 * 1024
+SENDFILE_CHUNK_SIZE = 8 * 1024 * 1024
+METRICS_PATH = "/__metrics"
+# upper bounds in seconds of the buckets of the request duration histogram
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# extension -> class of path the metrics are broken down by
+PATH_CLASSES = {
+    ".html": "page", ".htm": "page",
+    ".css": "asset", ".js": "asset", ".mjs": "asset", ".json": "asset",
+    ".png": "image", ".jpg": "image", ".jpeg": "image", ".gif": "image",
+    ".svg": "image", ".webp": "image", ".avif": "image", ".ico": "image",
+}
+# errors of os.sendfile meaning it can't be used for this pair of files
+SENDFILE_UNSUPPORTED = {errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK,
+                        errno.EOPNOTSUPP}
+# (Content-Encoding, suffix) of the compressed copies written by
+# main.py --compress, in order of preference
+PRECOMPRESSED = [("br", ".br"), ("zstd", ".zst"), ("gzip", ".gz")]
+PRECOMPRESSED_EXTENSIONS = (".html", ".css", ".js", ".mjs", ".json", ".svg",
+                            ".txt", ".xml")
+# (url path pattern, Cache-Control value), the first matching pattern wins.
+# Pages aren't fingerprinted, so they are revalidated on every navigation,
+# which their ETag makes cheap.
+CACHE_CONTROL = [
+    ("*.html", "no-cache"),
+    ("*/", "no-cache"),
+    ("/images/*", "public, max-age=86400"),
+    ("*", "public, max-age=3600"),
+]
+
+
+def parse_cache_control(value) -> tuple:
+    """Parse a "pattern=Cache-Control value" command line argument."""
+    pattern, sep, cache_control = value.partition("=")
+    if not sep or not pattern or not cache_control:
+        raise argparse.ArgumentTypeError(
+            f"expected PATTERN=VALUE, got {value!r}"
+        )
+    return pattern, cache_control
+
+
+def accepted_encodings(accept_encoding) -> set:
+    """Return the content codings an Accept-Encoding header accepts."""
+    accepted = set()
+    rejected = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        (accepted if quality > 0 else rejected).add(coding)
+    if "*" in accepted:
+        accepted.update(encoding for encoding, _ in PRECOMPRESSED
+                        if encoding not in rejected)
+    return accepted
+
+
+def content_etag(data) -> str:
+    return f'"{hashlib.sha256(data).hexdigest()[:32]}"'
+
+
+def stat_etag(mtime, size) -> str:
+    # for files too big to be hashed on every change
+    return f'"{mtime:x}-{size:x}"'
+
+
+class CachedFile:
+    __slots__ = ("data", "mtime", "size", "etag")
+
+    def __init__(self, data, mtime, size, etag):
+        self.data = data
+        self.mtime = mtime
+        self.size = size
+        self.etag = etag
+
+
+class FileCache:
+    """Thread safe LRU cache of file contents, bounded by their total size.
+
+    An entry is only returned while the file keeps the modification time
+    and size it was read with, so edited files are read again. Files
+    bigger than max_file_size are never cached.
+    """
+    def __init__(self, max_size=FILE_CACHE_SIZE,
+                 max_file_size=FILE_CACHE_MAX_FILE_SIZE):
+        self.max_size = max_size
+        self.max_file_size = max_file_size
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+
+    def get(self, path):
+        """Return the CachedFile of path, or None if it isn't a regular
+        file small enough to be cached."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        with self.lock:
+            entry = self.entries.get(path)
+            if (entry is not None and entry.mtime == st.st_mtime_ns
+                and entry.size == st.st_size):
+                self.entries.move_to_end(path)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        if st.st_size > self.max_file_size:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                # the metadata of the file actually read, in case it was
+                # replaced since the stat above
+                st = os.fstat(f.fileno())
+                data = f.read()
+        except OSError:
+            return None
+        entry = CachedFile(data, st.st_mtime_ns, len(data), content_etag(data))
+        with self.lock:
+            old = self.entries.pop(path, None)
+            if old is not None:
+                self.size -= old.size
+            self.entries[path] = entry
+            self.size += entry.size
+            while self.size > self.max_size:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted.size
+        return entry
+
+
+class OpenFile:
+    """A file descriptor kept open by FDCache, shared by every request
+    sending the file.
+
+    Reads only go through os.sendfile and os.pread, which take an explicit
+    offset, so requests in different threads don't disturb each other.
+    close() gives the descriptor back to the cache.
+    """
+    __slots__ = ("fd", "ino", "mtime", "size", "users", "evicted", "cache")
+
+    def __init__(self, fd, st, cache):
+        self.fd = fd
+        self.ino = st.st_ino
+        self.mtime = st.st_mtime_ns
+        self.size = st.st_size
+        self.users = 0
+        self.evicted = False
+        self.cache = cache
+
+
+    def close(self):
+        self.cache.release(self)
+
+
+class FDCache:
+    """Thread safe LRU cache of open file descriptors, for the files too big
+    for the FileCache.
+
+    A descriptor is reused for as long as the file keeps its inode,
+    modification time and size. Evicted descriptors are closed once the
+    last request using them is done.
+    """
+    def __init__(self, max_open=FD_CACHE_SIZE):
+        self.max_open = max_open
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+
+    def acquire(self, path):
+        """Return an OpenFile of path to close() after use, or None if it
+        isn't a regular file that can be opened."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        with self.lock:
+            entry = self.entries.get(path)
+            if (entry is not None and entry.ino == st.st_ino
+                and entry.mtime == st.st_mtime_ns and entry.size == st.st_size):
+                self.entries.move_to_end(path)
+                entry.users += 1
+                self.hits += 1
+                return entry
+            self.misses += 1
+        try:
+            fd = os.open(path, os.O_RDONLY | getattr(os, "O_CLOEXEC", 0))
+        except OSError:
+            return None
+        st = os.fstat(fd)
+        if not stat.S_ISREG(st.st_mode):
+            os.close(fd)
+            return None
+        entry = OpenFile(fd, st, self)
+        entry.users = 1
+        with self.lock:
+            self._evict(self.entries.pop(path, None))
+            self.entries[path] = entry
+            while len(self.entries) > self.max_open:
+                self._evict(self.entries.popitem(last=False)[1])
+        return entry
+
+
+    def release(self, entry):
+        with self.lock:
+            entry.users -= 1
+            if entry.evicted and entry.users == 0:
+                os.close(entry.fd)
+
+
+    def _evict(self, entry):
+        # called with the lock held
+        if entry is None:
+            return
+        entry.evicted = True
+        if entry.users == 0:
+            os.close(entry.fd)
+
+
+    def close(self):
+        with self.lock:
+            while self.entries:
+                self._evict(self.entries.popitem()[1])
+
+
+def path_class(url_path) -> str:
+    if url_path == METRICS_PATH:
+        return "metrics"
+    if url_path.endswith("/"):
+        return "page"
+    return PATH_CLASSES.get(os.path.splitext(url_path)[1].lower(), "other")
+
+
+class Metrics:
+    """Request counters, latency histograms and gauges of a server, written
+    in the Prometheus text format by render()."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        # (status, path class) -> requests
+        self.requests = {}
+        # path class -> bytes of response bodies
+        self.bytes_sent = {}
+        # path class -> [count per bucket and +Inf, sum of durations]
+        self.durations = {}
+
+
+    def request_started(self):
+        with self.lock:
+            self.in_flight += 1
+
+
+    def request_finished(self, status, kind, body_bytes, duration):
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, duration)
+        with self.lock:
+            self.in_flight -= 1
+            key = (status, kind)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.bytes_sent[kind] = self.bytes_sent.get(kind, 0) + body_bytes
+            histogram = self.durations.get(kind)
+            if histogram is None:
+                histogram = self.durations[kind] = [
+                    [0] * (len(LATENCY_BUCKETS) + 1), 0.0
+                ]
+            histogram[0][bucket] += 1
+            histogram[1] += duration
+
+
+    def render(self, file_cache=None, fd_cache=None) -> str:
+        with self.lock:
+            requests = sorted(self.requests.items())
+            bytes_sent = sorted(self.bytes_sent.items())
+            durations = sorted((kind, list(counts), total)
+                               for kind, (counts, total)
+                               in self.durations.items())
+            in_flight = self.in_flight
+        lines = [
+            "# HELP ssg_http_requests_total Requests handled, by status and "
+            "path class.",
+            "# TYPE ssg_http_requests_total counter",
+        ]
+        for (status, kind), count in requests:
+            lines.append(f'ssg_http_requests_total{{status="{status}",'
+                         f'path_class="{kind}"}} {count}')
+        lines += [
+            "# HELP ssg_http_response_bytes_total Bytes of response bodies "
+            "sent, by path class.",
+            "# TYPE ssg_http_response_bytes_total counter",
+        ]
+        for kind, count in bytes_sent:
+            lines.append(
+                f'ssg_http_response_bytes_total{{path_class="{kind}"}} {count}'
+            )
+        lines += [
+            "# HELP ssg_http_request_duration_seconds Time to answer a "
+            "request, by path class.",
+            "# TYPE ssg_http_request_duration_seconds histogram",
+        ]
+        for kind, counts, total in durations:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f'ssg_http_request_duration_seconds_bucket'
+                             f'{{path_class="{kind}",le="{bound}"}} '
+                             f'{cumulative}')
+            lines.append(f'ssg_http_request_duration_seconds_sum'
+                         f'{{path_class="{kind}"}} {total}')
+            lines.append(f'ssg_http_request_duration_seconds_count'
+                         f'{{path_class="{kind}"}} {cumulative}')
+        lines += [
+            "# HELP ssg_http_requests_in_flight Requests being answered.",
+            "# TYPE ssg_http_requests_in_flight gauge",
+            f"ssg_http_requests_in_flight {in_flight}",
+        ]
+        for name, cache in [("file_cache", file_cache), ("fd_cache", fd_cache)]:
+            if cache is None:
+                continue
+            lookups = cache.hits + cache.misses
+            lines += [
+                f"# TYPE ssg_{name}_hits_total counter",
+                f"ssg_{name}_hits_total {cache.hits}",
+                f"# TYPE ssg_{name}_misses_total counter",
+                f"ssg_{name}_misses_total {cache.misses}",
+                f"# TYPE ssg_{name}_hit_ratio gauge",
+                f"ssg_{name}_hit_ratio "
+                f"{cache.hits / lookups if lookups else 0.0}",
+                f"# TYPE ssg_{name}_entries gauge",
+                f"ssg_{name}_entries {len(cache.entries)}",
+            ]
+        if file_cache is not None:
+            lines += [
+                "# TYPE ssg_file_cache_bytes gauge",
+                f"ssg_file_cache_bytes {file_cache.size}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+class AccessLog:
+    """Writes one JSON object per request to a file, "-" for stderr."""
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        if path == "-":
+            self.file = sys.stderr
+        else:
+            self.file = open(path, 'a', buffering=1)
+
+
+    def write(self, record):
+        line = json.dumps(record) + "\n"
+        with self.lock:
+            self.file.write(line)
+
+
+    def close(self):
+        if self.file is not sys.stderr:
+            self.file.close()
+
+
+class ThreadPoolHTTPServer(HTTPServer):
+    """HTTPServer handling connections in a fixed pool of threads.
+
+    A connection only gets a thread once a request can be read from it.
+    New and idle keep-alive connections wait in a selector, watched by a
+    single thread, and idle ones are closed after keep_alive_timeout
+    seconds, so clients keeping connections open can't starve the pool.
+    """
+    def __init__(self, server_address, handler_class, threads=THREADS,
+                 file_cache=None, cache_control=CACHE_CONTROL,
+                 fd_cache=None, access_log=None,
+                 keep_alive_timeout=KEEP_ALIVE_TIMEOUT):
+        super().__init__(server_address, handler_class)
+        self.file_cache = file_cache
+        self.fd_cache = fd_cache or FDCache()
+        self.cache_control = cache_control
+        self.metrics = Metrics()
+        self.access_log = access_log
+        self.keep_alive_timeout = keep_alive_timeout
+        self.executor = ThreadPoolExecutor(max_workers=threads,
+                                           thread_name_prefix="http")
+        # connections handed to the idle thread, which registers them
+        self._parked = deque()
+        self._wakeup_read, self._wakeup_write = socket.socketpair()
+        self._wakeup_write.setblocking(False)
+        self._closing = False
+        self._idle_thread = threading.Thread(target=self._watch_idle,
+                                             name="http-idle", daemon=True)
+        self._idle_thread.start()
+
+
+    def process_request(self, request, client_address):
+        self.park(request, client_address)
+
+
+    def process_request_thread(self, request, client_address):
+        handler = None
+        try:
+            handler = self.RequestHandlerClass(request, client_address, self)
+        except Exception:
+            self.handle_error(request, client_address)
+        if handler is not None and not handler.close_connection:
+            self.park(request, client_address)
+        else:
+            self.shutdown_request(request)
+
+
+    def park(self, request, client_address):
+        """Wait for the next request of a connection without a thread."""
+        self._parked.append((request, client_address))
+        self._wake()
+
+
+    def _wake(self):
+        try:
+            self._wakeup_write.send(b"\0")
+        except OSError:
+            # already woken up, or closed
+            pass
+
+
+    def _watch_idle(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self._wakeup_read, selectors.EVENT_READ)
+        # socket -> (client address, deadline), and (deadline, socket) in
+        # the order they were parked, which is also the order they expire
+        idle = {}
+        deadlines = deque()
+        try:
+            while not self._closing:
+                timeout = None
+                if deadlines:
+                    timeout = max(0, deadlines[0][0] - time.monotonic())
+                for key, _ in selector.select(timeout):
+                    if key.fileobj is self._wakeup_read:
+                        self._wakeup_read.recv(4096)
+                        continue
+                    request = key.fileobj
+                    selector.unregister(request)
+                    client_address, _ = idle.pop(request)
+                    try:
+                        self.executor.submit(self.process_request_thread,
+                                             request, client_address)
+                    except RuntimeError:
+                        # the pool was shut down
+                        self.shutdown_request(request)
+                now = time.monotonic()
+                while self._parked:
+                    request, client_address = self._parked.popleft()
+                    deadline = now + self.keep_alive_timeout
+                    try:
+                        selector.register(request, selectors.EVENT_READ)
+                    except (ValueError, OSError):
+                        # closed by the client in the meantime
+                        self.shutdown_request(request)
+                        continue
+                    idle[request] = (client_address, deadline)
+                    deadlines.append((deadline, request))
+                while deadlines and deadlines[0][0] <= now:
+                    deadline, request = deadlines.popleft()
+                    # skip the connections that were reused since
+                    if idle.get(request, (None, None))[1] == deadline:
+                        selector.unregister(request)
+                        del idle[request]
+                        self.shutdown_request(request)
+        finally:
+            for request in idle:
+                self.shutdown_request(request)
+            selector.close()
+
+
+    def server_close(self):
+        super().server_close()
+        self._closing = True
+        self._wake()
+        self._idle_thread.join()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for request, _ in self._parked:
+            self.shutdown_request(request)
+        self._wakeup_read.close()
+        self._wakeup_write.close()
+        self.fd_cache.close()
+        if self.access_log is not None:
+            self.access_log.close()
+
+
+class CachingRequestHandler(SimpleHTTPRequestHandler):
+    """Serves files from the server's FileCache over HTTP/1.1 keep-alive.
+
+    Responses carry an ETag, Last-Modified and the Cache-Control policy of
+    their path, conditional requests are answered with 304 and a single
+    byte range can be requested. Every request is counted in the server's
+    Metrics, served on METRICS_PATH, and written to its AccessLog if it
+    has one.
+    """
+    protocol_version = "HTTP/1.1"
+    timeout = READ_TIMEOUT
+    # headers and body are separate writes, which Nagle's algorithm would
+    # hold back until the client acknowledges the first one
+    disable_nagle_algorithm = True
+    # (offset, length) of the part of the file returned by send_head to send
+    body_range = None
+    status = None
+    content_length = 0
+
+
+    def handle(self):
+        # the requests the client already sent, then the connection goes
+        # back to the server to wait for the next one
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self.request_pending():
+            self.handle_one_request()
+
+
+    def request_pending(self) -> bool:
+        """Whether more of the next request can be read without waiting."""
+        self.connection.setblocking(False)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+
+    def do_GET(self):
+        self.measure(super().do_GET)
+
+
+    def do_HEAD(self):
+        self.measure(super().do_HEAD)
+
+
+    def measure(self, handle):
+        metrics = self.server.metrics
+        start = time.perf_counter()
+        metrics.request_started()
+        self.status = None
+        self.content_length = 0
+        url_path = self.path.split("?", 1)[0].split("#", 1)[0]
+        try:
+            if url_path == METRICS_PATH:
+                self.send_metrics()
+            else:
+                handle()
+        finally:
+            duration = time.perf_counter() - start
+            body_bytes = 0
+            if self.command != "HEAD" and self.status != HTTPStatus.NOT_MODIFIED:
+                body_bytes = self.content_length
+            # no status when the connection failed before the response
+            metrics.request_finished(str(self.status or "aborted"),
+                                     path_class(url_path), body_bytes,
+                                     duration)
+            if self.server.access_log is not None:
+                self.server.access_log.write({
+                    "time": self.log_date_time_string(),
+                    "client": self.client_address[0],
+                    "method": self.command,
+                    "path": self.path,
+                    "status": self.status,
+                    "bytes": body_bytes,
+                    "duration_ms": round(duration * 1000, 3),
+                    "user_agent": self.headers.get("User-Agent"),
+                })
+
+
+    def send_metrics(self):
+        body = self.server.metrics.render(self.server.file_cache,
+                                          self.server.fd_cache).encode()
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-type",
+                         "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+
+    def send_response(self, code, message=None):
+        self.status = int(code)
+        super().send_response(code, message)
+
+
+    def send_header(self, keyword, value):
+        if keyword == "Content-Length":
+            self.content_length = int(value)
+        super().send_header(keyword, value)
+
+
+    def log_request(self, code='-', size='-'):
+        # replaced by the metrics and the structured access log
+        pass
+
+
+    def send_head(self):
+        self.body_range = None
+        url_path = self.path.split("?", 1)[0].split("#", 1)[0]
+        path = self.translate_path(self.path)
+        if url_path.endswith("/"):
+            for index in ("index.html", "index.htm"):
+                if os.path.isfile(os.path.join(path, index)):
+                    path = os.path.join(path, index)
+                    break
+            else:
+                # listed by SimpleHTTPRequestHandler, or a 404
+                return super().send_head()
+        elif os.path.isdir(path):
+            # redirected to the path with a trailing slash
+            return super().send_head()
+        encoding, file_path, varies = self.precompressed(path)
+        source, size, mtime_ns, etag = self.open_file(file_path)
+        if source is None:
+            return super().send_head()
+        if encoding is not None:
+            # each encoding is a representation of its own
+            etag = f'{etag[:-1]}-{encoding}"'
+        mtime = mtime_ns // 10**9
+        if self.not_modified(etag, mtime):
+            source.close()
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_validators(url_path, etag, mtime, varies)
+            self.end_headers()
+            return None
+        byte_range = self.requested_range(size, etag, mtime)
+        if byte_range == ():
+            source.close()
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+        if byte_range is None:
+            self.send_response(HTTPStatus.OK)
+            start, end = 0, size - 1
+        else:
+            self.send_response(HTTPStatus.PARTIAL_CONTENT)
+            start, end = byte_range
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.body_range = (start, end - start + 1)
+        self.send_header("Content-type", self.guess_type(path))
+        if encoding is not None:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_validators(url_path, etag, mtime, varies)
+        self.end_headers()
+        return source
+
+
+    def precompressed(self, path) -> tuple:
+        """Pick the compressed copy of path to send, if there is one the
+        client accepts.
+
+        Returns (Content-Encoding or None, path of the file to send, whether
+        the response depends on Accept-Encoding). Copies whose mtime isn't
+        the one of path are stale and ignored.
+        """
+        if not path.endswith(PRECOMPRESSED_EXTENSIONS):
+            return None, path, False
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None, path, False
+        accepted = accepted_encodings(self.headers.get("Accept-Encoding", ""))
+        varies = False
+        for encoding, suffix in PRECOMPRESSED:
+            try:
+                if os.stat(path + suffix).st_mtime_ns != mtime:
+                    continue
+            except OSError:
+                continue
+            varies = True
+            if encoding in accepted:
+                return encoding, path + suffix, True
+        return None, path, varies
+
+
+    def open_file(self, path) -> tuple:
+        """Return (source, size, mtime in ns, ETag) of the file at path, all
+        None if it isn't a regular file that can be read.
+
+        source is a BytesIO of the content of small files, from the
+        FileCache, and an OpenFile of the FDCache for the others.
+        """
+        cache = self.server.file_cache
+        entry = cache.get(path) if cache is not None else None
+        if entry is not None:
+            return BytesIO(entry.data), entry.size, entry.mtime, entry.etag
+        open_file = self.server.fd_cache.acquire(path)
+        if open_file is None:
+            return None, None, None, None
+        return (open_file, open_file.size, open_file.mtime,
+                stat_etag(open_file.mtime, open_file.size))
+
+
+    def send_validators(self, url_path, etag, mtime, varies=False):
+        if varies:
+            self.send_header("Vary", "Accept-Encoding")
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", self.date_time_string(mtime))
+        for pattern, cache_control in self.server.cache_control:
+            if fnmatch.fnmatchcase(url_path, pattern):
+                self.send_header("Cache-Control", cache_control)
+                break
+
+
+    def not_modified(self, etag, mtime) -> bool:
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is None:
+            return self.not_modified_since(mtime)
+        # GET uses the weak comparison, a W/ prefix doesn't matter
+        tags = {tag.strip().removeprefix("W/")
+                for tag in if_none_match.split(",")}
+        return "*" in tags or etag in tags
+
+
+    def not_modified_since(self, mtime) -> bool:
+        if ("If-Modified-Since" not in self.headers
+            or "If-None-Match" in self.headers):
+            return False
+        try:
+            since = email.utils.parsedate_to_datetime(
+                self.headers["If-Modified-Since"]
+            )
+        except (TypeError, IndexError, OverflowError, ValueError):
+            return False
+        if since is None or since.tzinfo is None:
+            return False
+        return mtime <= since.timestamp()
+
+
+    def requested_range(self, size, etag, mtime):
+        """Return the (first, last) byte of the range requested, () if it
+        can't be satisfied or None to send the whole file.
+
+        Only single ranges are served, a request for several ranges gets
+        the whole file like a request for none.
+        """
+        value = self.headers.get("Range")
+        if value is None or not value.startswith("bytes="):
+            return None
+        if_range = self.headers.get("If-Range")
+        if if_range is not None and if_range not in (
+            etag, self.date_time_string(mtime)
+        ):
+            return None
+        first, sep, last = value[len("bytes="):].strip().partition("-")
+        if not sep or "," in last:
+            return None
+        try:
+            if first == "":
+                suffix_length = int(last)
+                if suffix_length <= 0:
+                    return ()
+                start, end = max(0, size - suffix_length), size - 1
+            else:
+                start = int(first)
+                end = int(last) if last else start
+                if start < 0 or end < start:
+                    return None
+        except ValueError:
+            return None
+        if start >= size:
+            return ()
+        if not last:
+            end = size - 1
+        return start, min(end, size - 1)
+
+
+    def copyfile(self, source, outputfile):
+        if self.body_range is None:
+            # a directory listing
+            return super().copyfile(source, outputfile)
+        offset, length = self.body_range
+        if isinstance(source, OpenFile):
+            self.send_file(source.fd, offset, length)
+            return
+        # the cached bytes themselves, getvalue() doesn't copy them
+        data = source.getvalue()
+        if offset == 0 and length == len(data):
+            outputfile.write(data)
+        else:
+            outputfile.write(memoryview(data)[offset:offset + length])
+
+
+    def send_file(self, fd, offset, length):
+        """Send length bytes of the file fd from offset with os.sendfile,
+        falling back to copying them when it can't be used."""
+        sock = self.connection
+        poller = None
+        while length > 0:
+            try:
+                sent = os.sendfile(sock.fileno(), fd, offset,
+                                   min(length, SENDFILE_CHUNK_SIZE))
+            except BlockingIOError:
+                # the socket has a timeout, which makes it non-blocking
+                if poller is None:
+                    poller = select.poll()
+                    poller.register(sock, select.POLLOUT)
+                timeout = sock.gettimeout()
+                if not poller.poll(None if timeout is None
+                                   else timeout * 1000):
+                    raise TimeoutError("timed out sending file")
+                continue
+            except (AttributeError, OSError) as e:
+                if (isinstance(e, OSError)
+                    and e.errno not in SENDFILE_UNSUPPORTED):
+                    raise
+                return self.copy_file_range(fd, offset, length)
+            if sent == 0:
+                # the file was truncated, the response can't be completed
+                self.close_connection = True
+                return
+            offset += sent
+            length -= sent
+
+
+    def copy_file_range(self, fd, offset, length):
+        while length > 0:
+            chunk = os.pread(fd, min(COPY_CHUNK_SIZE, length), offset)
+            if not chunk:
+                self.close_connection = True
+                return
+            self.wfile.write(chunk)
+            offset += len(chunk)
+            length -= len(chunk)
+
+
+def dir_mtime(path):
+    """Return the modification time of the directory path, or None."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class PageRenderer:
+    """Renders the pages of a content directory when they are requested.
+
+    Pages are found by the url main.py would write them to, and the html is
+    kept in memory until the markdown or the template file changes. With
+    ast_cache_dir, the parsed trees are also kept on disk, so that a page
+    whose markdown didn't change isn't parsed again when the template
+    changes or the server restarts.
+    """
+    def __init__(self, content_dir="content", template_path="template.html",
+                 ast_cache_dir=None):
+        # the build modules are only needed in this mode
+        if SRC_DIR not in sys.path:
+            sys.path.insert(0, SRC_DIR)
+        import markdown
+        from main import collect_pages
+        from template import Template
+        from walk import walk_tree
+
+        self.markdown = markdown
+        self.collect_pages = collect_pages
+        self.Template = Template
+        self.walk_tree = walk_tree
+        self.ast_cache = None
+        if ast_cache_dir is not None:
+            from astcache import ASTCache
+            self.ast_cache = ASTCache(ast_cache_dir)
+        self.ast_lock = threading.Lock()
+        self.content_dir = content_dir
+        self.template_path = template_path
+        self.template = None
+        self.template_mtime = None
+        self.lock = threading.Lock()
+        # url path -> markdown path, scanned when first needed
+        self.pages = None
+        # directory -> modification time when pages was scanned
+        self.dir_mtimes = {}
+        # url path -> (markdown mtime, template mtime, html bytes)
+        self.cache = {}
+
+
+    def scan(self):
+        # before the pages, so that a change made during the scan is seen
+        # by the next content_changed()
+        dir_mtimes = {self.content_dir: dir_mtime(self.content_dir)}
+        for dir_path, _, _ in self.walk_tree(self.content_dir):
+            dir_mtimes[dir_path] = dir_mtime(dir_path)
+        pages = {}
+        for from_path, dest_path in self.collect_pages(self.content_dir, ""):
+            pages["/" + dest_path.replace(os.sep, "/")] = from_path
+        self.dir_mtimes = dir_mtimes
+        self.pages = pages
+
+
+    def content_changed(self) -> bool:
+        """Whether a file may have been added to or removed from the content
+        directory since the last scan, going by the directory mtimes."""
+        return any(dir_mtime(dir_path) != mtime
+                   for dir_path, mtime in self.dir_mtimes.items())
+
+
+    def source_path(self, url_path):
+        """Return the markdown path of the page at url_path, or None."""
+        if self.pages is None or (url_path not in self.pages
+                                  and url_path.endswith(".html")
+                                  and self.content_changed()):
+            # a page may have been added since the last scan
+            self.scan()
+        return self.pages.get(url_path)
+
+
+    def load_template(self):
+        mtime = os.stat(self.template_path).st_mtime_ns
+        with self.lock:
+            if mtime != self.template_mtime:
+                self.template = self.Template.from_file(self.template_path)
+                self.template_mtime = mtime
+            return self.template, mtime
+
+
+    def render(self, url_path):
+        """Return the html of the page at url_path as bytes, or None if there
+        is no such page. Errors of the build are raised."""
+        from_path = self.source_path(url_path)
+        if from_path is None:
+            return None
+        try:
+            source_mtime = os.stat(from_path).st_mtime_ns
+        except FileNotFoundError:
+            self.scan()
+            self.cache.pop(url_path, None)
+            return None
+        template, template_mtime = self.load_template()
+        cached = self.cache.get(url_path)
+        if cached is not None and cached[:2] == (source_mtime, template_mtime):
+            return cached[2]
+        with open(from_path, 'r') as f:
+            md_contents = f.read()
+        title = self.markdown.extract_title(md_contents)
+        if self.ast_cache is None:
+            content = self.markdown.render_html(md_contents)
+        else:
+            with self.ast_lock:
+                node = self.ast_cache.markdown_to_html_node(md_contents)
+            content = node.to_html()
+        html = template.render(Title=title, Content=content).encode()
+        self.cache[url_path] = (source_mtime, template_mtime, html)
+        return html
+
+
+class OnDemandRequestHandler(SimpleHTTPRequestHandler):
+    """Serves pages rendered by the server's PageRenderer and the other files
+    from the static directory it is given."""
+    def send_head(self):
+        url_path = unquote(self.path.split("?", 1)[0].split("#", 1)[0])
+        page_path = url_path + "index.html" if url_path.endswith("/") else url_path
+        try:
+            html = self.server.renderer.render(page_path)
+        except Exception:
+            self.send_page(HTTPStatus.INTERNAL_SERVER_ERROR,
+                           traceback.format_exc().encode(),
+                           "text/plain; charset=utf-8")
+            return None
+        if html is None:
+            # a static file is served as it is, without looking for a page
+            # in a directory of the same name
+            if (not url_path.endswith("/")
+                and not os.path.isfile(self.translate_path(url_path))
+                and self.server.renderer.source_path(url_path + "/index.html")):
+                self.send_response(HTTPStatus.MOVED_PERMANENTLY)
+                self.send_header("Location", url_path + "/")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+            return super().send_head()
+        self.send_page(HTTPStatus.OK, html, "text/html")
+        return None
+
+
+    def send_page(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+
+def make_server(port=8888, directory=None, production=False,
+                threads=THREADS, cache_size=FILE_CACHE_SIZE,
+                cache_control=CACHE_CONTROL, access_log=None,
+                on_demand=False, content_dir="content",
+                template_path="template.html", ast_cache_dir=None):
+    """Return a server for directory (the current directory by default).
+
+    The default is the single threaded HTTPServer with
+    SimpleHTTPRequestHandler. production serves with a pool of threads,
+    keep-alive connections, an in-memory file cache and the cache_control
+    policies instead, and logs requests as JSON lines to the access_log
+    path, if any. on_demand renders the pages of content_dir with
+    template_path as they are requested, and serves the other files from
+    directory, the static files. Their parsed trees are cached in
+    ast_cache_dir, if any.
+    """
     server_address = ("", port)
-    httpd = server_class(server_address, handler_class)
-    print(f"Serving HTTP on http://localhost:{port} from directory '{directory}'...")
-    httpd.serve_forever()
+    if on_demand:
+        handler = partial(OnDemandRequestHandler, directory=directory)
+        server = ThreadingHTTPServer(server_address, handler)
+        server.renderer = PageRenderer(content_dir, template_path,
+                                       ast_cache_dir)
+        return server
+    if not production:
+        handler = partial(SimpleHTTPRequestHandler, directory=directory)
+        return HTTPServer(server_address, handler)
+    handler = partial(CachingRequestHandler, directory=directory)
+    return ThreadPoolHTTPServer(server_address, handler, threads=threads,
+                                file_cache=FileCache(cache_size),
+                                cache_control=cache_control,
+                                access_log=access_log and AccessLog(access_log))
+
+
+def run(port=8888, directory=None, **options):
+    httpd = make_server(port, directory, **options)
+    mode = "development"
+    if options.get("production"):
+        mode = "production"
+    elif options.get("on_demand"):
+        mode = "render on demand"
+    print(f"Serving HTTP on http://localhost:{port} from directory '{directory}' "
+          f"({mode} mode)...")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        renderer = getattr(httpd, "renderer", None)
+        if renderer is not None and renderer.ast_cache is not None:
+            cache = renderer.ast_cache
+            print(f"Parsed tree cache: {cache.hits} hits, "
+                  f"{cache.misses} misses")
 
 
 if __name__ == "__main__":
@@ -23,6 +1097,52 @@ if __name__ == "__main__":
         "--dir", type=str, help="Directory to serve files from", default="."
     )
     parser.add_argument("--port", type=int, help="Port to serve HTTP on", default=8888)
+    parser.add_argument(
+        "--on-demand", action="store_true",
+        help="Render the pages of --content when they are requested, without "
+             "a build, and serve the static files from --dir"
+    )
+    parser.add_argument(
+        "--content", type=str, default="content",
+        help="Markdown pages rendered with --on-demand"
+    )
+    parser.add_argument(
+        "--template", type=str, default="template.html",
+        help="Template of the pages rendered with --on-demand"
+    )
+    parser.add_argument(
+        "--ast-cache", action="store_true",
+        help="Keep the parsed pages of --on-demand in .ast_cache, so that "
+             "unchanged pages aren't parsed again"
+    )
+    parser.add_argument(
+        "--production", action="store_true",
+        help="Serve with a thread pool, keep-alive and an in-memory file cache"
+    )
+    parser.add_argument(
+        "--threads", type=int, default=THREADS,
+        help="Number of threads serving connections in production mode"
+    )
+    parser.add_argument(
+        "--cache-size", type=int, default=FILE_CACHE_SIZE // (1024 * 1024),
+        help="Size of the file cache in MiB in production mode"
+    )
+    parser.add_argument(
+        "--cache-control", type=parse_cache_control, action="append",
+        default=[], metavar="PATTERN=VALUE",
+        help="Cache-Control header of the url paths matching PATTERN in "
+             "production mode, checked before the defaults (repeatable)"
+    )
+    parser.add_argument(
+        "--access-log", type=str, metavar="PATH",
+        help="Log every request as a line of JSON to PATH, - for stderr, in "
+             "production mode"
+    )
     args = parser.parse_args()
 
-    run(port=args.port, directory=args.dir)
+    run(port=args.port, directory=args.dir, production=args.production,
+        threads=args.threads, cache_size=args.cache_size * 1024 * 1024,
+        cache_control=args.cache_control + CACHE_CONTROL,
+        access_log=args.access_log, on_demand=args.on_demand,
+        content_dir=args.content, template_path=args.template,
+        ast_cache_dir=".ast_cache" if args.ast_cache else None)
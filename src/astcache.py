@@ -0,0 +1,196 @@
+import hashlib
+import marshal
+import os
+import markdown
+from htmlnode import FrozenLeafNode, LeafNode, ParentNode
+from manifest import GENERATOR_VERSION
+from textnode import _text_leaf
+
+AST_CACHE_DIR = ".ast_cache"
+AST_CACHE_SIZE = 64 * 1024 * 1024
+# bump whenever the serialized form of a tree changes
+AST_FORMAT_VERSION = 1
+
+# record kinds of the serialized form
+_PARENT = 0
+_LEAF = 1
+_FROZEN_LEAF = 2
+
+
+def dump_tree(node) -> bytes:
+    """Serialize a tree of html nodes to bytes, see load_tree.
+
+    The tree is flattened into a list of records in preorder, one per node:
+    (kind, tag, props, number of children) for parents and
+    (kind, tag, value, props) for leaves, which marshal writes and reads
+    much faster than pickle would the nodes themselves.
+    """
+    records = []
+    append = records.append
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ParentNode):
+            children = node.children or ()
+            append((_PARENT, node.tag, node.props, len(children)))
+            stack.extend(reversed(children))
+        elif isinstance(node, FrozenLeafNode):
+            append((_FROZEN_LEAF, node.tag, node.value, None))
+        elif isinstance(node, LeafNode):
+            append((_LEAF, node.tag, node.value, node.props))
+        else:
+            raise TypeError(f"can't serialize {type(node).__name__}")
+    return marshal.dumps((AST_FORMAT_VERSION, records))
+
+
+def load_tree(data):
+    """Rebuild the tree serialized by dump_tree.
+
+    Raises ValueError if data wasn't written by this version of dump_tree.
+    """
+    try:
+        version, records = marshal.loads(data)
+    except (EOFError, TypeError, ValueError):
+        raise ValueError("invalid serialized tree")
+    if version != AST_FORMAT_VERSION:
+        raise ValueError(f"unsupported serialized tree version {version}")
+    roots = []
+    # [children list being filled, number of children still to come]
+    stack = [[roots, 1]]
+    try:
+        for kind, tag, a, b in records:
+            siblings = stack[-1]
+            if kind == _PARENT:
+                node = ParentNode(tag, [], a)
+            elif kind == _FROZEN_LEAF:
+                node = _text_leaf(tag, a)
+            else:
+                node = LeafNode(tag, a, b)
+            siblings[0].append(node)
+            siblings[1] -= 1
+            if siblings[1] == 0:
+                stack.pop()
+            if kind == _PARENT and b:
+                stack.append([node.children, b])
+    except (IndexError, TypeError, ValueError):
+        raise ValueError("invalid serialized tree")
+    if stack:
+        raise ValueError("invalid serialized tree")
+    return roots[0]
+
+
+class ASTCache:
+    """Parsed markdown trees stored on disk, keyed by the source they came from.
+
+    Each tree is kept in its own file named after the hash of the markdown
+    and the generator version, so a tree is never loaded for another source
+    or by a parser that would build a different one. Files of other
+    versions are simply never read again. Once the cache grows past
+    max_bytes, the least recently used files are deleted.
+    """
+    def __init__(self, directory=AST_CACHE_DIR, max_bytes=AST_CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # total size of the files, computed when first needed
+        self._size = None
+
+
+    def path_for(self, markdown_text) -> str:
+        digest = hashlib.sha256(
+            f"{GENERATOR_VERSION}:{AST_FORMAT_VERSION}\n".encode()
+        )
+        digest.update(markdown_text.encode())
+        return os.path.join(self.directory, f"{digest.hexdigest()}.ast")
+
+
+    def get(self, markdown_text):
+        """Return the cached tree of markdown_text, or None."""
+        path = self.path_for(markdown_text)
+        try:
+            with open(path, 'rb') as f:
+                node = load_tree(f.read())
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        # the modification time orders the files for eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return node
+
+
+    def put(self, markdown_text, node):
+        data = dump_tree(node)
+        path = self.path_for(markdown_text)
+        os.makedirs(self.directory, exist_ok=True)
+        if self._size is None:
+            self._size = self._scan_size()
+        # a tree stored again replaces its file
+        try:
+            self._size -= os.path.getsize(path)
+        except FileNotFoundError:
+            pass
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._size += len(data)
+        if self._size > self.max_bytes:
+            self.prune()
+
+
+    def markdown_to_html_node(self, markdown_text):
+        """markdown.markdown_to_html_node, parsing only sources not cached."""
+        node = self.get(markdown_text)
+        if node is None:
+            node = markdown.markdown_to_html_node(markdown_text)
+            self.put(markdown_text, node)
+        return node
+
+
+    def _entries(self) -> list:
+        try:
+            with os.scandir(self.directory) as it:
+                return [
+                    (entry.stat().st_mtime_ns, entry.stat().st_size,
+                     entry.path)
+                    for entry in it if entry.name.endswith(".ast")
+                ]
+        except FileNotFoundError:
+            return []
+
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+
+    def prune(self, max_bytes=None) -> int:
+        """Delete the least recently used trees until the cache takes at
+        most max_bytes, or 90% of the bound set on the cache. Returns the
+        number of files deleted."""
+        if max_bytes is None:
+            # leave some room so that every new tree doesn't prune again
+            max_bytes = self.max_bytes * 9 // 10
+        entries = sorted(self._entries())
+        size = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, file_size, path in entries:
+            if size <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+            removed += 1
+        self._size = size
+        return removed
+
+
+    def __repr__(self):
+        return (f"ASTCache({self.directory!r}, {self.hits} hits, "
+                f"{self.misses} misses)")
@@ -0,0 +1,122 @@
+import json
+import os
+from collections import OrderedDict
+from manifest import GENERATOR_VERSION
+
+BLOCK_CACHE_PATH = ".block_cache.json"
+BLOCK_CACHE_SIZE = 4096
+
+
+class BlockCache:
+    """Least recently used cache of the html rendered for markdown blocks.
+
+    Entries are keyed by the text of the block itself, so identical blocks
+    are rendered once no matter which page they appear on. The number of
+    entries is bounded by max_entries, evicting the least recently used
+    block first. A saved cache is only loaded back by the generator version
+    that wrote it.
+    """
+    def __init__(self, max_entries=BLOCK_CACHE_SIZE, path=BLOCK_CACHE_PATH):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # entries added since the last export_state, to send across
+        # processes, once track_added was called
+        self._added = None
+
+
+    @classmethod
+    def load(cls, path=BLOCK_CACHE_PATH, max_entries=BLOCK_CACHE_SIZE):
+        cache = cls(max_entries, path)
+        if not os.path.exists(path):
+            return cache
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            # a corrupt cache only costs rendering the blocks again
+            return cache
+        if data.get("version") != GENERATOR_VERSION:
+            return cache
+        # saved from least to most recently used
+        for block, html in data.get("entries", [])[-max_entries:]:
+            cache.entries[block] = html
+        return cache
+
+
+    def save(self):
+        data = {
+            "version": GENERATOR_VERSION,
+            "entries": list(self.entries.items()),
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+
+    def get(self, block):
+        """Return the html of block, or None if it isn't cached."""
+        html = self.entries.get(block)
+        if html is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(block)
+        self.hits += 1
+        return html
+
+
+    def put(self, block, html):
+        self._insert(block, html)
+        if self._added is not None:
+            self._added[block] = html
+
+
+    def _insert(self, block, html):
+        self.entries[block] = html
+        self.entries.move_to_end(block)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+    def track_added(self):
+        """Keep the entries put from now on for export_state, in a copy of
+        the cache used by another process. Otherwise they are only kept in
+        the bounded entries."""
+        self._added = {}
+
+
+    def export_state(self) -> dict:
+        """Return the counters and the new entries since track_added and
+        clear them, to send across processes."""
+        state = {"hits": self.hits, "misses": self.misses,
+                 "entries": self._added or {}}
+        self.hits = 0
+        self.misses = 0
+        if self._added is not None:
+            self._added = {}
+        return state
+
+
+    def merge(self, state):
+        self.hits += state["hits"]
+        self.misses += state["misses"]
+        for block, html in state["entries"].items():
+            self._insert(block, html)
+
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self.entries),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+    def __repr__(self):
+        return (f"BlockCache({len(self.entries)}/{self.max_entries} entries, "
+                f"{self.hits} hits, {self.misses} misses)")
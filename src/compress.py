@@ -0,0 +1,121 @@
+import gzip
+import os
+from concurrent.futures import ThreadPoolExecutor
+from walk import walk_tree
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# outputs worth compressing, the others (images...) are compressed already
+COMPRESSIBLE_EXTENSIONS = (".html", ".css", ".js", ".mjs", ".json", ".svg",
+                           ".txt", ".xml")
+# smaller files don't gain enough to pay for the extra file
+MIN_COMPRESS_SIZE = 256
+
+
+def _gzip(data):
+    # mtime=0 keeps the output the same for the same input
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def available_encoders() -> dict:
+    """Return suffix -> compress function for every encoding available.
+
+    gzip always is, brotli and zstd only if their module is installed.
+    """
+    encoders = {".gz": _gzip}
+    if brotli is not None:
+        encoders[".br"] = lambda data: brotli.compress(data, quality=11)
+    if zstandard is not None:
+        encoders[".zst"] = zstandard.ZstdCompressor(level=19).compress
+    return encoders
+
+
+def is_compressible(path) -> bool:
+    return path.endswith(COMPRESSIBLE_EXTENSIONS)
+
+
+def is_up_to_date(path, compressed_path) -> bool:
+    """Return whether compressed_path was written from path as it is now.
+
+    Compressed files get the mtime of their source, so any other mtime
+    means the source changed since.
+    """
+    try:
+        return (os.stat(compressed_path).st_mtime_ns
+                == os.stat(path).st_mtime_ns)
+    except FileNotFoundError:
+        return False
+
+
+def compress_file(path, encoders, keep=frozenset()) -> list:
+    """Write the compressed siblings of path that are out of date, except
+    the ones in keep.
+
+    Returns the paths written.
+    """
+    written = []
+    st = os.stat(path)
+    data = None
+    for suffix, compress in encoders.items():
+        compressed_path = path + suffix
+        if (os.path.normpath(compressed_path) in keep
+                or is_up_to_date(path, compressed_path)):
+            continue
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+        tmp_path = f"{compressed_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(compress(data))
+        os.utime(tmp_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(tmp_path, compressed_path)
+        written.append(compressed_path)
+    return written
+
+
+def compress_outputs(dest_dir, jobs=1, encoders=None, keep=()) -> list:
+    """Write compressed siblings (index.html.gz...) of the text files in
+    dest_dir, only for the files that changed since they were last
+    compressed, and remove the siblings of files that no longer exist.
+
+    keep lists files that are outputs of their own, such as the static
+    files of the manifest's assets: a compressed file among them is never
+    removed or overwritten. Files are compressed in jobs threads: zlib,
+    brotli and zstd release the GIL while they compress. Returns the paths
+    written.
+    """
+    if encoders is None:
+        encoders = available_encoders()
+    keep = {os.path.normpath(path) for path in keep}
+    sources = []
+    for _, _, files in walk_tree(dest_dir):
+        sizes = {entry.name: entry.stat().st_size for entry in files}
+        for entry in files:
+            if is_compressible(entry.name):
+                if sizes[entry.name] >= MIN_COMPRESS_SIZE:
+                    sources.append(entry.path)
+                continue
+            # a compressed sibling whose source is gone or too small now
+            source_name, suffix = os.path.splitext(entry.name)
+            if (suffix in encoders and is_compressible(source_name)
+                and sizes.get(source_name, 0) < MIN_COMPRESS_SIZE
+                and os.path.normpath(entry.path) not in keep):
+                os.remove(entry.path)
+                print(f"stale compressed file removed: '{entry.path}'")
+    written = []
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        for paths in executor.map(
+            lambda path: compress_file(path, encoders, keep), sources
+        ):
+            written.extend(paths)
+    if written:
+        print(f"Compressed {len(written)} files "
+              f"({', '.join(suffix for suffix in encoders)})")
+    return written
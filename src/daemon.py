@@ -0,0 +1,347 @@
+"""Build daemon keeping the generator warm between builds.
+
+python src/daemon.py serve starts a process that loads the modules, the
+compiled template, the build manifest and a block cache once, then builds
+the site whenever asked over a Unix domain socket. The other commands
+(build, rebuild, status, stop) are a thin client of that socket: they only
+import what they need to send one request, so they return as soon as the
+build does instead of paying for interpreter and module startup first.
+
+Requests and responses are single JSON lines. Requests are handled one at
+a time, so builds never overlap.
+"""
+import io
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import socketserver
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import redirect_stderr, redirect_stdout
+
+SOCKET_PATH = ".build_daemon.sock"
+# generous, a full build of a large site can take a while
+CLIENT_TIMEOUT = 600.0
+# seconds a client has to send its request, the daemon waits for no one else
+# meanwhile
+REQUEST_TIMEOUT = 10.0
+
+
+class BuildDaemon:
+    """Builds the site on request, keeping everything warm in between."""
+    def __init__(self, content_dir="content", static_dir="static",
+                 template_path="template.html", dest_dir="public",
+                 manifest_path=None, jobs=1, block_cache=False):
+        # imported here so that the client doesn't pay for them, and before
+        # the first request so that it doesn't either
+        from blockcache import BlockCache
+        from main import (generate_pages_recursive, make_worker_pool,
+                          update_outputs)
+        from manifest import BuildManifest, MANIFEST_PATH
+        from sync import sync_static
+        from template import Template
+        self.generate_pages_recursive = generate_pages_recursive
+        self.make_worker_pool = make_worker_pool
+        self.update_outputs = update_outputs
+        self.sync_static = sync_static
+        self.Template = Template
+        self.content_dir = content_dir
+        self.static_dir = static_dir
+        self.dest_dir = dest_dir
+        self.jobs = jobs
+        self.manifest = BuildManifest.load(manifest_path or MANIFEST_PATH)
+        self.template = Template.from_file(template_path)
+        self._template_mtime = os.stat(template_path).st_mtime_ns
+        # kept in memory either way, saved to disk with block_cache
+        self.cache = (BlockCache.load() if block_cache else BlockCache())
+        self.persist_cache = block_cache
+        # worker processes shared by every build, started by the first one
+        self._executor = None
+        self.started = time.time()
+        self.builds = 0
+        self.last_build = None
+
+
+    def handle(self, request) -> dict:
+        """Run one request and return the response to send back."""
+        command = request.get("command")
+        if command == "status":
+            return self.status()
+        if command not in ("build", "rebuild"):
+            return {"ok": False, "error": f"unknown command {command!r}"}
+        output = io.StringIO()
+        start = time.perf_counter()
+        try:
+            with redirect_stdout(output), redirect_stderr(output):
+                if command == "build":
+                    errors = self.build(force=request.get("force", False))
+                else:
+                    errors = self.rebuild(request.get("paths", []))
+        except Exception as e:
+            return {"ok": False, "error": f"{type(e).__name__}: {e}",
+                    "output": output.getvalue()}
+        self.builds += 1
+        self.last_build = {
+            "command": command,
+            "duration_ms": (time.perf_counter() - start) * 1000,
+            "errors": len(errors),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        return {"ok": not errors, "output": output.getvalue(),
+                "errors": errors, "duration_ms": self.last_build["duration_ms"]}
+
+
+    def _reload_template(self):
+        mtime = os.stat(self.template.path).st_mtime_ns
+        if mtime != self._template_mtime:
+            self.template = self.Template.from_file(self.template.path)
+            self._template_mtime = mtime
+
+
+    def executor(self):
+        """Return the pool of worker processes, or None with a single job."""
+        if self.jobs > 1 and self._executor is None:
+            self._executor = self.make_worker_pool(self.jobs, self.cache)
+        return self._executor
+
+
+    def close(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+
+    def _with_pool(self, run):
+        # a worker that died (killed, out of memory...) breaks the whole
+        # pool for good, so it is replaced and the build tried once more
+        try:
+            return run()
+        except BrokenProcessPool:
+            print("A worker process died, restarting the worker pool")
+            self.close(wait=False)
+            return run()
+
+
+    def build(self, force=False) -> list:
+        """Incremental build of the whole site, like main.py does."""
+        return self._with_pool(lambda: self._build(force))
+
+
+    def _build(self, force):
+        self._reload_template()
+        self.manifest.assets = self.sync_static(self.static_dir,
+                                                self.dest_dir,
+                                                self.manifest.assets)
+        self.manifest.start_build(self.template.path, force=force)
+        errors = self.generate_pages_recursive(
+            self.content_dir, self.template, self.dest_dir, self.manifest,
+            jobs=self.jobs, cache=self.cache, executor=self.executor()
+        )
+        for dest_path in self.manifest.prune():
+            print(f"Removed page without source: {dest_path}")
+        self.manifest.save()
+        if self.persist_cache:
+            self.cache.save()
+        return errors
+
+
+    def rebuild(self, paths) -> list:
+        """Update only the outputs of the changed paths, like --watch does.
+
+        Returns the pages that failed, like build.
+        """
+        # clients send absolute paths, pages are known by paths relative to
+        # the daemon unless it was given absolute directories
+        if not os.path.isabs(self.content_dir):
+            paths = [os.path.relpath(path) for path in paths]
+        return self._with_pool(lambda: self._rebuild(paths))
+
+
+    def _rebuild(self, paths):
+        self.template, errors = self.update_outputs(
+            paths, self.template, self.manifest, self.content_dir,
+            self.static_dir, self.dest_dir, jobs=self.jobs, cache=self.cache,
+            executor=self.executor()
+        )
+        self._template_mtime = os.stat(self.template.path).st_mtime_ns
+        if self.persist_cache:
+            self.cache.save()
+        return errors
+
+
+    def status(self) -> dict:
+        return {
+            "ok": True,
+            "pid": os.getpid(),
+            "cwd": os.getcwd(),
+            "uptime_s": time.time() - self.started,
+            "builds": self.builds,
+            "last_build": self.last_build,
+            "pages": len(self.manifest.pages),
+            "block_cache": self.cache.stats(),
+        }
+
+
+class DaemonRequestHandler(socketserver.StreamRequestHandler):
+    timeout = REQUEST_TIMEOUT
+
+    def handle(self):
+        try:
+            line = self.rfile.readline()
+        except TimeoutError:
+            # a stuck client, the next ones are waiting
+            return
+        if not line:
+            # a connection only checking that the daemon is alive
+            return
+        try:
+            request = json.loads(line)
+        except ValueError:
+            response = {"ok": False, "error": "invalid request"}
+        else:
+            if request.get("command") == "stop":
+                response = {"ok": True}
+                # shutdown() waits for serve_forever to return, which it
+                # only does once this request is handled
+                threading.Thread(target=self.server.shutdown).start()
+            else:
+                response = self.server.daemon.handle(request)
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class DaemonServer(socketserver.UnixStreamServer):
+    """Serves the requests of one BuildDaemon, one request at a time."""
+    def __init__(self, socket_path, daemon):
+        self.daemon = daemon
+        claim_socket(socket_path)
+        super().__init__(socket_path, DaemonRequestHandler)
+
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.remove(self.server_address)
+        except FileNotFoundError:
+            pass
+
+
+def claim_socket(socket_path):
+    """Remove the socket left by a daemon that died, or raise if another
+    daemon still listens on it."""
+    if not os.path.exists(socket_path):
+        return
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.remove(socket_path)
+        return
+    raise OSError(f"a build daemon is already listening on {socket_path}")
+
+
+def send_request(request, socket_path=SOCKET_PATH,
+                 timeout=CLIENT_TIMEOUT) -> dict:
+    """Send one request to the daemon and return its response.
+
+    Raises OSError if no daemon listens on socket_path.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError("the build daemon closed the connection")
+    return json.loads(line)
+
+
+def serve(args):
+    daemon = BuildDaemon(args.content, args.static, args.template, args.dest,
+                         args.manifest, jobs=args.jobs or os.cpu_count() or 1,
+                         block_cache=args.block_cache)
+    try:
+        server = DaemonServer(args.socket, daemon)
+    except OSError as e:
+        sys.exit(str(e))
+    print(f"Build daemon listening on {args.socket}, pid {os.getpid()}")
+    if args.build:
+        response = daemon.handle({"command": "build"})
+        print(response.get("output", ""), end="")
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            daemon.close()
+    if daemon.persist_cache:
+        daemon.cache.save()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Warm build daemon of the static site generator"
+    )
+    parser.add_argument("--socket", type=str, default=SOCKET_PATH,
+                        help="Path of the Unix socket of the daemon")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser(
+        "serve", help="Run the daemon in the foreground"
+    )
+    serve_parser.add_argument("--content", type=str, default="content")
+    serve_parser.add_argument("--static", type=str, default="static")
+    serve_parser.add_argument("--template", type=str, default="template.html")
+    serve_parser.add_argument("--dest", type=str, default="public")
+    serve_parser.add_argument("--manifest", type=str,
+                              help="Path of the build manifest")
+    serve_parser.add_argument("--jobs", "-j", type=int, default=1,
+                              help="Processes rendering pages (0 for one "
+                                   "per CPU)")
+    serve_parser.add_argument("--block-cache", action="store_true",
+                              help="Load and save the block cache, which is "
+                                   "otherwise kept in memory only")
+    serve_parser.add_argument("--build", action="store_true",
+                              help="Build once before serving requests")
+    build_parser = commands.add_parser("build", help="Build the site")
+    build_parser.add_argument("--force", action="store_true",
+                              help="Regenerate every page")
+    rebuild_parser = commands.add_parser(
+        "rebuild", help="Update the outputs of the given changed files"
+    )
+    rebuild_parser.add_argument("paths", nargs="+")
+    commands.add_parser("status", help="Print the state of the daemon")
+    commands.add_parser("stop", help="Stop the daemon")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args)
+        return
+    request = {"command": args.command}
+    if args.command == "build":
+        request["force"] = args.force
+    elif args.command == "rebuild":
+        request["paths"] = [os.path.abspath(path) for path in args.paths]
+    try:
+        response = send_request(request, args.socket)
+    except OSError as e:
+        sys.exit(f"No build daemon on {args.socket} ({e}), start one with "
+                 f"python src/daemon.py serve")
+    if args.command == "status":
+        print(json.dumps(response, indent=1))
+        return
+    print(response.get("output", ""), end="")
+    for from_path, error in response.get("errors", []):
+        print(f"\nError while generating {from_path}:\n{error}",
+              file=sys.stderr)
+    if "error" in response:
+        sys.exit(response["error"])
+    if response.get("errors"):
+        sys.exit(f"{len(response['errors'])} pages failed to generate")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import os
+import tempfile
+
+
+class TempDirMixin:
+    """Gives every test of a unittest.TestCase a fresh temporary directory.
+
+    The directory is self.tmp, removed after tearDown, and files are
+    created in it with write(). Mix it in before unittest.TestCase and call
+    super().setUp() first thing in setUp.
+    """
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+
+    def path(self, *parts) -> str:
+        return os.path.join(self.tmp.name, *parts)
+
+
+    def write(self, name, text) -> str:
+        """Write text to name, relative to the directory, creating the
+        directories it is in, and return its path."""
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+
+    def read(self, name) -> str:
+        with open(self.path(name), 'r') as f:
+            return f.read()
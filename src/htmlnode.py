@@ -1,4 +1,10 @@
+# number of fragments ParentNode.iter_html joins into each chunk it yields
+HTML_CHUNK_PARTS = 512
+
+
 class HTMLNode:
+    __slots__ = ("tag", "value", "children", "props")
+
     def __init__(self, tag=None, value=None, children=None, props=None):
         self.tag = tag
         self.value = value
@@ -7,15 +13,25 @@ class HTMLNode:
 
 
     def to_html(self):
+        return "".join(self.iter_html())
+
+
+    def iter_html(self):
+        """Yield the html of the node as a sequence of string chunks."""
         raise NotImplementedError
 
 
+    def write_html(self, f):
+        """Stream the html of the node into the file-like object f."""
+        f.writelines(self.iter_html())
+
+
     def props_to_html(self):
-        html=""
-        if self.props:
-            for prop, value in self.props.items():
-                html += f' {prop}="{value}"'
-        return html
+        if not self.props:
+            return ""
+        return "".join(
+            f' {prop}="{value}"' for prop, value in self.props.items()
+        )
 
 
     def __repr__(self):
@@ -28,6 +44,8 @@ class HTMLNode:
 
 
 class LeafNode(HTMLNode):
+    __slots__ = ()
+
     def __init__(self, tag=None, value=None, props=None):
         super().__init__(tag=tag, value=value, props=props)
 
@@ -41,19 +59,75 @@ class LeafNode(HTMLNode):
         return f"<{self.tag}{props_html}>{self.value}</{self.tag}>"
 
 
+    def iter_html(self):
+        yield self.to_html()
+
+
+class FrozenLeafNode(LeafNode):
+    """A LeafNode that can't be modified, so one instance can be shared.
+
+    Used for leaves that occur over and over, such as short runs of plain
+    or bold text, instead of allocating a new node for each occurrence.
+    """
+    __slots__ = ()
+
+    def __init__(self, tag=None, value=None):
+        for name, attr_value in [("tag", tag), ("value", value),
+                                 ("children", None), ("props", None)]:
+            object.__setattr__(self, name, attr_value)
+
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+
+    def __reduce__(self):
+        return (FrozenLeafNode, (self.tag, self.value))
+
+
 class ParentNode(HTMLNode):
+    __slots__ = ()
+
     def __init__(self, tag=None, children=None, props=None):
         super().__init__(tag=tag, children=children, props=props)
 
 
-    def to_html(self):
+    def open_tag(self):
         if not self.tag:
             raise ValueError("ParentNode must have a tag")
         if not self.children:
-            return ValueError("ParentNode must have at least one child")
-        props_html = self.props_to_html()
-        children_html = ""
-        for child in self.children:
-            children_html += child.to_html()
-        return f"<{self.tag}{props_html}>{children_html}</{self.tag}>"
+            raise ValueError("ParentNode must have at least one child")
+        return f"<{self.tag}{self.props_to_html()}>"
+
 
+    def iter_html(self):
+        # an explicit stack of (tag, remaining children) instead of
+        # recursion, so deeply nested trees don't hit the recursion limit.
+        # Fragments are joined into chunks of HTML_CHUNK_PARTS before being
+        # yielded, which keeps the per-fragment cost close to a list append.
+        parts = [self.open_tag()]
+        append = parts.append
+        stack = [(self.tag, iter(self.children))]
+        while stack:
+            tag, children = stack[-1]
+            for child in children:
+                if isinstance(child, ParentNode):
+                    append(child.open_tag())
+                    stack.append((child.tag, iter(child.children)))
+                    break
+                if isinstance(child, LeafNode):
+                    append(child.to_html())
+                else:
+                    parts.extend(child.iter_html())
+            else:
+                stack.pop()
+                append(f"</{tag}>")
+            if len(parts) >= HTML_CHUNK_PARTS:
+                yield "".join(parts)
+                parts.clear()
+        if parts:
+            yield "".join(parts)
@@ -1,75 +1,531 @@
 import os
+import sys
 import shutil
+import argparse
+import traceback
+from functools import partial
+from contextlib import ExitStack, nullcontext, suppress
+from concurrent.futures import ProcessPoolExecutor
 import markdown
+from blockcache import BlockCache, BLOCK_CACHE_PATH, BLOCK_CACHE_SIZE
+from compress import available_encoders, compress_outputs
+from manifest import BuildManifest, MANIFEST_PATH
+from pipeline import StreamingPipeline, MEMORY_BUDGET
+from profiler import Profiler, NULL_PROFILER
+from shard import (Shard, load_timings, merge_shards, parse_shard,
+                   shard_manifest_path, shard_output_dir)
+from sync import sync_static
+from template import Template
+from watch import RESCAN, make_watcher
+from walk import walk_tree
 
 def main():
-    copy_to_public("static")
-    generate_pages_recursive("content", "template.html", "public")
-
-
-def copy_to_public(dir, first_iter=True):
-    if first_iter:
-        if os.path.exists("public"):
-            shutil.rmtree("public")
-            print(f"old public dir cleared")
-        os.mkdir("public")
-    dir_items = os.listdir(path=dir)
-    # for path in directories:
-    for item in dir_items:
-        full_path = os.path.join(dir, item)
-        new_path = full_path.split("/", maxsplit=1)
-        new_path[0] = "public"
-        new_path = "/".join(new_path)
-        if os.path.isfile(full_path):
-            shutil.copy(full_path, new_path)
-            print(f"file copied from '{full_path}' to '{new_path}'")
-        # if path is directory recurse
-        else:
-            if not os.path.exists(new_path):
-                os.mkdir(new_path)
-                print(f"new dir created: {new_path}")
-            copy_to_public(full_path, first_iter=False)
-    return
+    parser = argparse.ArgumentParser(description="Static site generator")
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Regenerate every page even if its inputs did not change"
+    )
+    parser.add_argument(
+        "--manifest", type=str, default=MANIFEST_PATH,
+        help="Path of the build manifest used for incremental builds"
+    )
+    parser.add_argument(
+        "--checksum", action="store_true",
+        help="Compare static files by content hash instead of mtime"
+    )
+    parser.add_argument(
+        "--jobs", "-j", type=int, default=1,
+        help="Number of processes used to render pages (0 for one per CPU)"
+    )
+    parser.add_argument(
+        "--watch", action="store_true",
+        help="Keep running and rebuild the outputs of files as they change"
+    )
+    parser.add_argument(
+        "--block-cache", action="store_true",
+        help="Reuse the html of blocks already rendered, on any page and "
+             f"across builds (kept in {BLOCK_CACHE_PATH})"
+    )
+    parser.add_argument(
+        "--block-cache-size", type=int, default=BLOCK_CACHE_SIZE,
+        help="Number of blocks kept by --block-cache"
+    )
+    parser.add_argument(
+        "--compress", action="store_true",
+        help="Write compressed copies of the text files in public/ ("
+             f"{', '.join(available_encoders())} here) for the server to "
+             "send to clients that accept them"
+    )
+    parser.add_argument(
+        "--stream", action="store_true",
+        help="Render pages through a pipeline of threads in bounded memory, "
+             "reading and rendering large pages in chunks"
+    )
+    parser.add_argument(
+        "--memory-budget", type=int, default=MEMORY_BUDGET // (1024 * 1024),
+        help="MiB of memory the page text held by the --stream pipeline "
+             "may take at once"
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="Time every build stage and write build_profile.json and "
+             "build_trace.json (Chrome trace events)"
+    )
+    parser.add_argument(
+        "--profile-top", type=int, default=10,
+        help="Number of slowest pages printed with --profile"
+    )
+    parser.add_argument(
+        "--shard", type=shard_arg, metavar="I/N",
+        help="Build only the pages of shard I out of N, into public.shard-I-of-N"
+    )
+    parser.add_argument(
+        "--shard-plan", type=str, metavar="PROFILE",
+        help="Balance --shard by the page times of a build_profile.json "
+             "instead of splitting pages by the hash of their path"
+    )
+    parser.add_argument(
+        "--merge-shards", type=int, metavar="N",
+        help="Combine the outputs of shards 1 to N into public and exit"
+    )
+    args = parser.parse_args()
+    if args.shard and args.watch:
+        parser.error("--watch rebuilds the whole site, it can't be sharded")
+    if args.stream and (args.jobs != 1 or args.profile):
+        parser.error("--stream renders in one process and can't be combined "
+                     "with --jobs or --profile")
+    if args.merge_shards:
+        problems = merge_shards(args.merge_shards, "public",
+                                collect_pages("content", "public"),
+                                args.manifest)
+        for problem in problems:
+            print(problem, file=sys.stderr)
+        if problems:
+            sys.exit(f"{len(problems)} problems while merging shards")
+        return
+    jobs = args.jobs or os.cpu_count() or 1
+    profiler = Profiler() if args.profile else None
+    cache = None
+    if args.block_cache:
+        cache = BlockCache.load(max_entries=args.block_cache_size)
 
+    dest_dir_path = "public"
+    manifest_path = args.manifest
+    shard = None
+    if args.shard:
+        timings = None
+        if args.shard_plan:
+            timings = load_timings(args.shard_plan, "content")
+        shard = Shard(*args.shard, timings=timings)
+        dest_dir_path = shard_output_dir(dest_dir_path, *args.shard)
+        manifest_path = shard_manifest_path(*args.shard, args.manifest)
+        # even a shard without pages has an output for --merge-shards
+        os.makedirs(dest_dir_path, exist_ok=True)
 
-def generate_page(from_path, template_path, dest_path):
-    print(f"Generating page from {from_path} to {dest_path} using {template_path}")
-    with open(from_path, 'r') as f:
-        md_contents = f.read()
+    stream = None
+    if args.stream:
+        try:
+            stream = StreamingPipeline("template.html",
+                                       args.memory_budget * 1024 * 1024,
+                                       cache=cache)
+        except ValueError as e:
+            sys.exit(f"Can't stream pages: {e}")
 
-    with open(template_path, 'r') as f:
-        template_contents = f.read()
+    manifest = BuildManifest.load(manifest_path)
+    # static files are the same for every shard, only the first copies them
+    if shard is None or shard.index == 1:
+        manifest.assets = sync_static("static", dest_dir_path,
+                                      manifest.assets, checksum=args.checksum)
+    manifest.start_build("template.html", force=args.force)
+    errors = generate_pages_recursive("content", "template.html",
+                                      dest_dir_path, manifest, jobs=jobs,
+                                      profiler=profiler, cache=cache,
+                                      shard=shard, stream=stream)
+    for dest_path in manifest.prune():
+        print(f"Removed page without source: {dest_path}")
+    manifest.save()
+    if stream is not None:
+        print(f"Stream: page text in flight took at most "
+              f"{stream.budget.peak / (1024 * 1024):.1f} MiB "
+              f"(budget {args.memory_budget} MiB)")
+    if args.compress:
+        compress_outputs(dest_dir_path, jobs=jobs, keep=manifest.assets)
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Block cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.0%}), {stats['entries']} blocks kept")
+        cache.save()
+    if profiler is not None:
+        profiler.print_report(top=args.profile_top)
+        profiler.write_json("build_profile.json")
+        profiler.write_chrome_trace("build_trace.json")
+        print("Profile written to build_profile.json and build_trace.json")
+    if args.watch:
+        report_errors(errors)
+        watch_and_rebuild(manifest, "template.html", jobs=jobs, cache=cache,
+                          compress=args.compress)
+    elif errors:
+        report_errors(errors)
+        sys.exit(f"{len(errors)} pages failed to generate")
 
-    title = markdown.extract_title(md_contents)
-    html_content = markdown.markdown_to_html_node(md_contents).to_html()
 
-    html_file_content = (template_contents.replace("{{ Title }}", title)
-                                          .replace("{{ Content }}", html_content)
-    )
+def shard_arg(text):
+    try:
+        return parse_shard(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def report_errors(errors):
+    for from_path, error in errors:
+        print(f"\nError while generating {from_path}:\n{error}",
+              file=sys.stderr)
+
+
+def load_template(template) -> Template:
+    """Accept either a template path or an already compiled Template."""
+    if isinstance(template, Template):
+        return template
+    return Template.from_file(template)
+
+
+def generate_page(from_path, template, dest_path, profiler=NULL_PROFILER,
+                  cache=None):
+    template = load_template(template)
+    profiler.page = from_path
+    with profiler.stage("page"):
+        with profiler.stage("read"):
+            with open(from_path, 'r') as f:
+                md_contents = f.read()
+
+        # parsing and serialization are fused, see markdown.render_html, and
+        # the html is streamed into the file as it is rendered, so this
+        # stage includes the template fill and the "write" stage
+        with profiler.stage("render"):
+            title = markdown.extract_title(md_contents)
+            html_content = markdown.iter_render_html(md_contents, cache=cache)
+            if template.slots.count("Content") > 1:
+                # an iterator can only fill one slot
+                html_content = "".join(html_content)
+
+            dest_dir = os.path.dirname(dest_path)
+            os.makedirs(dest_dir, exist_ok=True)
+
+            # written next to the destination and moved in place, so a page
+            # that fails half way doesn't leave a truncated file behind
+            tmp_path = f"{dest_path}.tmp"
+            try:
+                with open(tmp_path, 'w') as f:
+                    out = profiler.writer(f)
+                    template.write(out, Title=title, Content=html_content)
+                    # what is still buffered is written here, not on close
+                    out.flush()
+            except BaseException:
+                # open() may have failed before creating it
+                with suppress(FileNotFoundError):
+                    os.remove(tmp_path)
+                raise
+            os.replace(tmp_path, dest_path)
+
+
+def collect_pages(dir_path_content, dest_dir_path) -> list:
+    """Return the (source, destination) path pairs of every markdown page."""
+    pages = []
+    for _, rel_dir, files in walk_tree(dir_path_content):
+        dest_dir = dest_dir_path
+        if rel_dir:
+            dest_dir = os.path.join(dest_dir_path, *[
+                part.replace("md", "html") for part in rel_dir.split(os.sep)
+            ])
+        for entry in files:
+            if entry.name.endswith(".md"):
+                pages.append((entry.path, os.path.join(
+                    dest_dir, entry.name.replace("md", "html")
+                )))
+    return pages
 
-    dest_dir = os.path.dirname(dest_path)
-    if not os.path.exists(dest_dir):
-        os.makedirs(dest_dir)
 
-    with open(dest_path, 'w') as f:
-        f.write(html_file_content)
+# the compiled template, profiler and block cache of a worker process, set
+# once by _init_worker instead of being pickled along with every page
+_worker_template = None
+_worker_profiler = None
+_worker_cache = None
+_worker_stack = ExitStack()
 
 
-def generate_pages_recursive(dir_path_content, template_path, dest_dir_path):
-    dir_items = os.listdir(path=dir_path_content)
-    # for path in directories:
-    for item in dir_items:
-        full_path = os.path.join(dir_path_content, item)
-        new_path = os.path.join(dest_dir_path, item.replace("md", "html"))
-        if full_path.endswith(".md"):
-            generate_page(full_path, template_path, new_path)
-        # if path is directory recurse
+def _init_worker(template, profile=False, cache=None):
+    global _worker_template, _worker_profiler, _worker_cache
+    _worker_template = template
+    _worker_cache = cache
+    if cache is not None:
+        cache.track_added()
+    if profile:
+        _worker_profiler = Profiler()
+        _worker_stack.enter_context(_worker_profiler.instrument(markdown))
+
+
+def _generate_page_job(from_path, dest_path, template=None, profiler=None,
+                       cache=None):
+    # runs in a worker process, so errors are returned instead of raised to
+    # let the parent report the failures of every page at once. Profiling
+    # data and new cache entries are sent back with the result to be merged
+    # in the parent.
+    template = template or _worker_template
+    profiler = profiler or _worker_profiler
+    cache = cache or _worker_cache
+    error = None
+    try:
+        generate_page(from_path, template, dest_path,
+                      profiler or NULL_PROFILER, cache)
+    except Exception:
+        error = traceback.format_exc()
+    profile_state = cache_state = None
+    if profiler is _worker_profiler and profiler is not None:
+        profile_state = profiler.export_state()
+    if cache is _worker_cache and cache is not None:
+        cache_state = cache.export_state()
+    return error, profile_state, cache_state
+
+
+def make_worker_pool(jobs, cache=None) -> ProcessPoolExecutor:
+    """Return a pool of jobs worker processes that generate_pages can reuse
+    for build after build, each starting from a copy of cache."""
+    return ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                               initargs=(None, False, cache))
+
+
+def generate_pages(pages, template, jobs=1, profiler=None,
+                   cache=None, executor=None) -> list:
+    """Generate every (source, destination) pair in pages.
+
+    The template is compiled once and shared by every page. With jobs > 1
+    the pages are rendered in a pool of worker processes, each starting
+    from a copy of cache, or in executor, a pool made by make_worker_pool,
+    if given. Progress is printed in the order of pages either way.
+    Returns a list of (source, traceback) tuples for the pages that failed.
+    """
+    template = load_template(template)
+    errors = []
+    total = len(pages)
+    if jobs > 1 and total > 1:
+        with ExitStack() as stack:
+            job = _generate_page_job
+            if executor is None:
+                executor = stack.enter_context(ProcessPoolExecutor(
+                    max_workers=jobs, initializer=_init_worker,
+                    initargs=(template, profiler is not None, cache)
+                ))
+            else:
+                # the workers outlive the build, and the template with it
+                job = partial(_generate_page_job, template=template)
+            results = executor.map(
+                job,
+                [from_path for from_path, _ in pages],
+                [dest_path for _, dest_path in pages],
+                chunksize=max(1, total // (jobs * 4)),
+            )
+            _report_progress(pages, results, template.path, errors, profiler,
+                             cache)
+    else:
+        instrumented = (profiler.instrument(markdown) if profiler
+                        else nullcontext())
+        with instrumented:
+            results = (
+                _generate_page_job(from_path, dest_path, template, profiler,
+                                   cache)
+                for from_path, dest_path in pages
+            )
+            _report_progress(pages, results, template.path, errors, profiler)
+    return errors
+
+
+def _report_progress(pages, results, template_path, errors, profiler=None,
+                     cache=None):
+    total = len(pages)
+    for i, ((from_path, dest_path), (error, profile_state, cache_state)) in (
+        enumerate(zip(pages, results))
+    ):
+        if profile_state is not None:
+            profiler.merge(profile_state)
+        if cache_state is not None:
+            cache.merge(cache_state)
+        if error is None:
+            print(f"[{i + 1}/{total}] Generated page from {from_path} "
+                  f"to {dest_path} using {template_path}")
         else:
-            if not os.path.exists(new_path):
-                os.mkdir(new_path)
-                print(f"new dir created: {new_path}")
-            generate_pages_recursive(full_path, template_path, new_path)
-    return
+            print(f"[{i + 1}/{total}] Failed to generate page from {from_path}")
+            errors.append((from_path, error))
+
+
+def generate_pages_recursive(dir_path_content, template_path, dest_dir_path,
+                             manifest=None, jobs=1, profiler=None,
+                             cache=None, shard=None, stream=None,
+                             executor=None) -> list:
+    walk_stage = nullcontext()
+    if profiler is not None:
+        profiler.page = None
+        walk_stage = profiler.stage("walk")
+    with walk_stage:
+        pages = collect_pages(dir_path_content, dest_dir_path)
+    if shard is not None:
+        pages = shard.select(pages, dir_path_content)
+    if manifest is not None:
+        changed = [page for page in pages if manifest.needs_build(*page)]
+        if len(changed) < len(pages):
+            print(f"Skipping {len(pages) - len(changed)} unchanged pages")
+        pages = changed
+    if stream is not None:
+        errors = stream.run(pages)
+    else:
+        errors = generate_pages(pages, template_path, jobs=jobs,
+                                profiler=profiler, cache=cache,
+                                executor=executor)
+    if manifest is not None:
+        failed = {from_path for from_path, _ in errors}
+        for from_path, dest_path in pages:
+            if from_path not in failed:
+                manifest.record(from_path, dest_path)
+    return errors
+
+
+def page_destination(from_path, dir_path_content, dest_dir_path) -> str:
+    """Return the output path of a markdown page, like collect_pages does."""
+    parts = os.path.relpath(from_path, dir_path_content).split(os.sep)
+    return os.path.join(dest_dir_path,
+                        *[part.replace("md", "html") for part in parts])
+
+
+def rebuild_changed(changed, template, manifest, dir_path_content="content",
+                    static_dir="static", dest_dir_path="public"):
+    """Update only the outputs affected by the changed file paths.
+
+    A template change re-renders every page, a static file is copied or
+    deleted on its own and a markdown file re-renders just its page.
+    Returns the template, recompiled if it changed.
+    """
+    template, errors = update_outputs(changed, template, manifest,
+                                      dir_path_content, static_dir,
+                                      dest_dir_path)
+    report_errors(errors)
+    return template
+
+
+def update_outputs(changed, template, manifest, dir_path_content="content",
+                   static_dir="static", dest_dir_path="public", jobs=1,
+                   cache=None, compress=False, executor=None) -> tuple:
+    """rebuild_changed, returning (template, errors) instead of printing
+    the errors.
+
+    jobs, cache and executor are used like in generate_pages, and compress
+    updates the compressed copies of the outputs like main.py --compress.
+    RESCAN among the changed paths runs a whole incremental build instead.
+    """
+    changed = {path if path == RESCAN else os.path.normpath(path)
+               for path in changed}
+    errors = []
+    if RESCAN in changed:
+        manifest.assets = sync_static(static_dir, dest_dir_path,
+                                      manifest.assets)
+    if RESCAN in changed or os.path.normpath(template.path) in changed:
+        template = Template.from_file(template.path)
+        manifest.start_build(template.path)
+        errors = generate_pages_recursive(dir_path_content, template,
+                                          dest_dir_path, manifest, jobs=jobs,
+                                          cache=cache, executor=executor)
+        for dest_path in manifest.prune():
+            print(f"Removed page without source: {dest_path}")
+        changed.discard(os.path.normpath(template.path))
+    if RESCAN in changed:
+        changed = set()
+    for path in sorted(changed):
+        if _is_inside(path, static_dir):
+            _rebuild_static(path, manifest, static_dir, dest_dir_path)
+        elif _is_inside(path, dir_path_content):
+            errors.extend(_rebuild_content(path, template, manifest,
+                                           dir_path_content, dest_dir_path,
+                                           cache))
+    manifest.save()
+    if compress:
+        compress_outputs(dest_dir_path, jobs=jobs, keep=manifest.assets)
+    return template, errors
+
+
+def _is_inside(path, dir_path):
+    return path.startswith(os.path.normpath(dir_path) + os.sep)
+
+
+def _rebuild_static(path, manifest, static_dir, dest_dir_path):
+    dest_path = os.path.join(dest_dir_path, os.path.relpath(path, static_dir))
+    if os.path.isfile(path):
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        shutil.copy2(path, dest_path)
+        print(f"file copied from '{path}' to '{dest_path}'")
+        if dest_path not in manifest.assets:
+            manifest.assets.append(dest_path)
+        return
+    # a deleted file or directory: drop every asset that was under it
+    prefix = dest_path + os.sep
+    for asset in list(manifest.assets):
+        if asset == dest_path or asset.startswith(prefix):
+            manifest.assets.remove(asset)
+            if os.path.exists(asset):
+                os.remove(asset)
+                print(f"stale file removed: '{asset}'")
+
+
+def _rebuild_content(path, template, manifest, dir_path_content,
+                     dest_dir_path, cache=None) -> list:
+    if os.path.isfile(path):
+        if not path.endswith(".md"):
+            return []
+        dest_path = page_destination(path, dir_path_content, dest_dir_path)
+        if not manifest.needs_build(path, dest_path):
+            return []
+        errors = generate_pages([(path, dest_path)], template, cache=cache)
+        if not errors:
+            manifest.record(path, dest_path)
+        return errors
+    # a deleted page or directory of pages
+    prefix = path + os.sep
+    for source_path in list(manifest.pages):
+        if source_path == path or source_path.startswith(prefix):
+            dest_path = manifest.remove_page(source_path)
+            if dest_path is not None:
+                print(f"Removed page without source: {dest_path}")
+    return []
+
+
+def watch_and_rebuild(manifest, template_path, dir_path_content="content",
+                      static_dir="static", dest_dir_path="public", jobs=1,
+                      cache=None, compress=False):
+    template = Template.from_file(template_path)
+    watcher = make_watcher([dir_path_content, static_dir], [template_path])
+    print(f"Watching {dir_path_content}, {static_dir} and {template_path} "
+          f"for changes with {type(watcher).__name__}, press Ctrl+C to stop")
+    try:
+        while True:
+            changed = watcher.wait()
+            if not changed:
+                continue
+            # a failed rebuild (a template deleted or renamed midway...) is
+            # reported and retried on the next change, it doesn't end --watch
+            try:
+                template, errors = update_outputs(
+                    changed, template, manifest, dir_path_content, static_dir,
+                    dest_dir_path, jobs=jobs, cache=cache, compress=compress
+                )
+            except Exception:
+                print(f"\nRebuild failed:\n{traceback.format_exc()}",
+                      file=sys.stderr)
+                continue
+            report_errors(errors)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        if cache is not None:
+            cache.save()
 
 
-main()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+
+# bump whenever a change to the generator alters the html it produces, so
+# that every page gets rebuilt on the next run
+GENERATOR_VERSION = "1"
+MANIFEST_PATH = ".build_manifest.json"
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BuildManifest:
+    """Records the inputs of the last build so unchanged pages can be skipped.
+
+    For every generated page the manifest stores the hash of its markdown
+    source and its destination path. The template hash and the generator
+    version apply to all pages: when either changes, every page is stale.
+    The static files copied by the last build are kept in assets.
+    """
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.version = None
+        self.template_hash = None
+        self.pages = {}
+        self.assets = []
+        self._seen = set()
+        self._pending_hashes = {}
+
+
+    @classmethod
+    def load(cls, path=MANIFEST_PATH):
+        manifest = cls(path)
+        if not os.path.exists(path):
+            return manifest
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            # a corrupt manifest only costs a full rebuild
+            return manifest
+        manifest.version = data.get("version")
+        manifest.template_hash = data.get("template")
+        manifest.pages = data.get("pages", {})
+        manifest.assets = data.get("assets", [])
+        return manifest
+
+
+    def save(self):
+        data = {
+            "version": self.version,
+            "template": self.template_hash,
+            "pages": self.pages,
+            "assets": sorted(self.assets),
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+    def start_build(self, template_path, force=False):
+        template_hash = hash_file(template_path)
+        if (force
+            or self.version != GENERATOR_VERSION
+            or self.template_hash != template_hash
+        ):
+            # keep the destinations around so pruning still works, but drop
+            # the hashes so that every page counts as changed
+            for entry in self.pages.values():
+                entry["hash"] = None
+        self.version = GENERATOR_VERSION
+        self.template_hash = template_hash
+        self._seen = set()
+        self._pending_hashes = {}
+
+
+    def needs_build(self, source_path, dest_path) -> bool:
+        self._seen.add(source_path)
+        source_hash = hash_file(source_path)
+        self._pending_hashes[source_path] = source_hash
+        entry = self.pages.get(source_path)
+        if entry is None:
+            return True
+        return (entry["hash"] != source_hash
+                or entry["dest"] != dest_path
+                or not os.path.exists(dest_path))
+
+
+    def record(self, source_path, dest_path):
+        source_hash = self._pending_hashes.pop(source_path, None)
+        if source_hash is None:
+            source_hash = hash_file(source_path)
+        self._seen.add(source_path)
+        self.pages[source_path] = {"hash": source_hash, "dest": dest_path}
+
+
+    def prune(self) -> list:
+        """Remove pages whose source was not seen in the current build.
+
+        Deletes the generated file of each such page and returns the list of
+        removed destination paths.
+        """
+        removed = []
+        for source_path in sorted(set(self.pages) - self._seen):
+            dest_path = self.remove_page(source_path)
+            if dest_path is not None:
+                removed.append(dest_path)
+        return removed
+
+
+    def remove_page(self, source_path):
+        """Forget a page and delete its generated file.
+
+        Returns the removed destination path, or None if there was none.
+        """
+        entry = self.pages.pop(source_path, None)
+        self._seen.discard(source_path)
+        if entry is None or not os.path.exists(entry["dest"]):
+            return None
+        os.remove(entry["dest"])
+        return entry["dest"]
@@ -1,6 +1,6 @@
 import re
 from typing import List, Tuple
-from htmlnode import HTMLNode, ParentNode
+from htmlnode import HTML_CHUNK_PARTS, HTMLNode, LeafNode, ParentNode
 from textnode import TextNode, text_node_to_html_node
 
 
@@ -113,7 +113,7 @@ def split_nodes_link(old_nodes: List[TextNode | str]) -> List[TextNode]:
     return new_nodes
 
 
-def text_to_textnode(text):
+def text_to_textnode_split(text):
     raw_text_nodes = [TextNode(text, "text")]
     bold_nodes = split_nodes_delimiter(raw_text_nodes, "**", "bold")
     italic_bold_nodes = split_nodes_delimiter(bold_nodes, "*", "italic")
@@ -124,66 +124,208 @@ def text_to_textnode(text):
     return link_image_code_italic_bold_nodes
 
 
+DELIMITER_PATTERN = re.compile(r"\*\*|\*|`")
+IMAGE_PATTERN = re.compile(r"!\[(.*?)\]\((.*?)\)")
+LINK_PATTERN = re.compile(r"(?<!!)\[(.*?)\]\((.*?)\)")
+
+
+def _append_links(text, tokens):
+    if not text:
+        return
+    start = 0
+    for match in LINK_PATTERN.finditer(text):
+        if match.start() > start:
+            tokens.append((text[start:match.start()], "text", None))
+        tokens.append((match.group(1), "link", match.group(2)))
+        start = match.end()
+    if start < len(text):
+        tokens.append((text[start:], "text", None))
+
+
+def _append_images_and_links(text, tokens):
+    # like split_nodes_image followed by split_nodes_link: links are only
+    # searched for in the text between images
+    if not text:
+        return
+    start = 0
+    for match in IMAGE_PATTERN.finditer(text):
+        _append_links(text[start:match.start()], tokens)
+        tokens.append((match.group(1), "image", match.group(2)))
+        start = match.end()
+    _append_links(text[start:], tokens)
+
+
+def scan_inline(text) -> List[Tuple[str, str, str | None]]:
+    """Tokenize inline markdown into (text, text_type, url) tuples.
+
+    The split chain of text_to_textnode_split applies "**" to the whole
+    text, then "*" to the text between bold spans, then "`" to the text
+    between italic spans, and only then looks for images and links in what
+    is left. This scanner walks the delimiters once while tracking which of
+    those nested spans it is in, so it produces the same tokens, and raises
+    the same errors, in linear time.
+    """
+    nodes = []
+    in_bold = in_italic = in_code = False
+    bold_count = 0
+    unclosed_italic = unclosed_code = False
+    start = 0
+    for match in DELIMITER_PATTERN.finditer(text):
+        delimiter = match.group()
+        if delimiter == "**":
+            bold_count += 1
+            if in_bold:
+                if match.start() > start:
+                    nodes.append((text[start:match.start()], "bold", None))
+            elif in_italic:
+                unclosed_italic = True
+            elif in_code:
+                unclosed_code = True
+            else:
+                _append_images_and_links(text[start:match.start()], nodes)
+            in_bold = not in_bold
+            in_italic = in_code = False
+        elif in_bold:
+            continue
+        elif delimiter == "*":
+            if in_italic:
+                if match.start() > start:
+                    nodes.append((text[start:match.start()], "italic", None))
+            elif in_code:
+                unclosed_code = True
+            else:
+                _append_images_and_links(text[start:match.start()], nodes)
+            in_italic = not in_italic
+            in_code = False
+        elif in_italic:
+            continue
+        else:
+            if in_code:
+                if match.start() > start:
+                    nodes.append((text[start:match.start()], "code", None))
+            else:
+                _append_images_and_links(text[start:match.start()], nodes)
+            in_code = not in_code
+        start = match.end()
+    if in_italic:
+        unclosed_italic = True
+    elif in_code:
+        unclosed_code = True
+    elif not in_bold:
+        _append_images_and_links(text[start:], nodes)
+
+    # the split chain reports "**" before "*" before "`"
+    for unclosed, delimiter in [(bold_count % 2 != 0, "**"),
+                                (unclosed_italic, "*"),
+                                (unclosed_code, "`")]:
+        if unclosed:
+            raise ValueError(
+                f'Invalid markdown syntax: delimiter: "{delimiter}" '
+                'is unclosed in: "{node.text}"'
+            )
+    return nodes
+
+
+def text_to_textnode_scan(text):
+    """Single pass equivalent of text_to_textnode_split, see scan_inline."""
+    return [TextNode(*token) for token in scan_inline(text)]
+
+
+# implementations selectable through text_to_textnode
+INLINE_TOKENIZERS = {
+    "scan": text_to_textnode_scan,
+    "split": text_to_textnode_split,
+}
+
+
+def text_to_textnode(text, tokenizer="scan"):
+    return INLINE_TOKENIZERS[tokenizer](text)
+
+
+HEADING_PREFIXES = ("# ", "## ", "### ", "#### ", "##### ", "###### ")
+
+
+def iter_block_lines(lines):
+    """Group an iterable of lines into blocks, yielding each as its lines.
+
+    Blocks are separated by empty lines and trimmed of surrounding
+    whitespace, like markdown_to_blocks does with "\n\n" and strip(). Lines
+    may keep their trailing newline, so an open file can be passed directly.
+    """
+    block = []
+    for line in lines:
+        if line.endswith("\n"):
+            line = line[:-1]
+        if line:
+            block.append(line)
+        elif block:
+            yield from _trim_block(block)
+            block = []
+    if block:
+        yield from _trim_block(block)
+
+
+def _trim_block(block):
+    # the line based equivalent of block.strip(): drop blank lines at both
+    # ends, then strip the first and last remaining line
+    start = 0
+    end = len(block)
+    while start < end and block[start].strip() == "":
+        start += 1
+    while end > start and block[end - 1].strip() == "":
+        end -= 1
+    if start == end:
+        return
+    block = block[start:end]
+    block[0] = block[0].lstrip()
+    block[-1] = block[-1].rstrip()
+    yield block
+
+
 def markdown_to_blocks(markdown):
-    blocks = markdown.split("\n\n")
-    new_blocks = []
-    for block in blocks:
-        block = block.strip().strip("\n")
-        if block:
-            new_blocks.append(block)
+    return ["\n".join(block) for block in iter_block_lines(markdown.split("\n"))]
 
-    return new_blocks
 
+def classify_block_lines(lines):
+    """Return the block type of a block given as a list of its lines.
 
-def block_to_block_type(block):
-    if (block.startswith("# ")
-        or block.startswith("## ")
-        or block.startswith("### ")
-        or block.startswith("#### ")
-        or block.startswith("##### ")
-        or block.startswith("###### ")
-    ):
+    Quote, unordered and ordered list are all checked in the same scan.
+    """
+    first = lines[0]
+    if first.startswith(HEADING_PREFIXES):
         return "heading"
 
-    if block.startswith("```") and block.endswith("```"):
+    if first.startswith("```") and lines[-1].endswith("```"):
         return "code"
 
-    is_quote=False
-    for line in block.split("\n"):
-        if line.startswith(">"):
-            is_quote = True
-        else:
+    is_quote = is_ul = is_ol = True
+    for n, line in enumerate(lines, start=1):
+        if is_quote and not line.startswith(">"):
             is_quote = False
-            break
+        if is_ul and not line.startswith(("* ", "- ")):
+            is_ul = False
+        if is_ol and not line.startswith(f"{n}. "):
+            is_ol = False
+        if not (is_quote or is_ul or is_ol):
+            return "paragraph"
     if is_quote:
         return "quote"
-
-    is_ul = False
-    for line in block.split("\n"):
-        if line.startswith("* ") or line.startswith("- "):
-            is_ul = True
-        else:
-            is_ul = False
-            break
     if is_ul:
         return "unordered_list"
+    return "ordered_list"
 
-    is_ol = False
-    n = 1
-    for line in block.split("\n"):
-        if line.startswith(f"{n}. "):
-            is_ol = True
-            n += 1
-        else:
-            is_ol = False
-            break
-    if is_ol:
-        return "ordered_list"
 
-    return "paragraph"
+def block_to_block_type(block):
+    return classify_block_lines(block.split("\n"))
+
 
+def iter_blocks(lines):
+    """Yield the (block, block_type) pairs of an iterable of markdown lines."""
+    for block_lines in iter_block_lines(lines):
+        yield "\n".join(block_lines), classify_block_lines(block_lines)
 
-def heading_block_to_html_node(heading_block):
+
+def heading_level_and_content(heading_block):
     level = 0
     content_start_index = 0
     for i in range(len(heading_block)):
@@ -191,14 +333,32 @@ def heading_block_to_html_node(heading_block):
             content_start_index = i + 1
             break
         level += 1
-    content = heading_block[content_start_index:]
+    return level, heading_block[content_start_index:]
+
+
+def code_block_content(code_block):
+    return code_block.strip("```\n")
+
+
+def quote_block_content(quote_block):
+    return "\n".join([line[1:] for line in quote_block.split("\n")])
+
+
+def list_block_items(list_block, block_type):
+    # unordered items start with "* " or "- ", ordered ones with "n. "
+    marker_length = 2 if block_type == "unordered_list" else 3
+    return [item[marker_length:] for item in list_block.split("\n")]
+
+
+def heading_block_to_html_node(heading_block):
+    level, content = heading_level_and_content(heading_block)
     text_nodes = text_to_textnode(content)
     html_children = [text_node_to_html_node(node) for node in text_nodes]
     return ParentNode(tag=f"h{level}", children=html_children)
 
 
 def code_block_to_html_node(code_block):
-    content = code_block.strip("```\n")
+    content = code_block_content(code_block)
     text_nodes = text_to_textnode(content)
     html_children = [text_node_to_html_node(node) for node in text_nodes]
     return ParentNode(
@@ -209,14 +369,14 @@ def code_block_to_html_node(code_block):
 
 
 def quote_block_to_html_node(quote_block):
-    content = "\n".join([line[1:] for line in quote_block.split("\n")])
+    content = quote_block_content(quote_block)
     text_nodes = text_to_textnode(content)
     html_children = [text_node_to_html_node(node) for node in text_nodes]
     return ParentNode(tag="quoteblock", children=html_children)
 
 
 def ul_block_to_html_node(ul_block):
-    items = [item[2:] for item in ul_block.split("\n")]
+    items = list_block_items(ul_block, "unordered_list")
     items_text_nodes = [text_to_textnode(item) for item in items]
     html_items = [
         ParentNode(tag="li", children=[
@@ -227,7 +387,7 @@ def ul_block_to_html_node(ul_block):
 
 
 def ol_block_to_html_node(ol_block):
-    items = [item[3:] for item in ol_block.split("\n")]
+    items = list_block_items(ol_block, "ordered_list")
     items_text_nodes = [text_to_textnode(item) for item in items]
     html_items = [
         ParentNode(tag="li", children=[
@@ -244,33 +404,156 @@ def paragraph_block_to_html_node(paragraph_block):
     return ParentNode(tag="p", children=html_children)
 
 
-def markdown_to_html_node(markdown) -> HTMLNode:
-    block_types_to_functions = {
-        "heading": heading_block_to_html_node,
-        "code": code_block_to_html_node,
-        "quote": quote_block_to_html_node,
-        "unordered_list": ul_block_to_html_node,
-        "ordered_list": ol_block_to_html_node,
-        "paragraph": paragraph_block_to_html_node
-
-    }
-    blocks = markdown_to_blocks(markdown)
-    blocks_with_types = []
-    for block in blocks:
-        block_type = block_to_block_type(block)
-        blocks_with_types.append((block, block_type))
+BLOCK_TYPES_TO_FUNCTIONS = {
+    "heading": heading_block_to_html_node,
+    "code": code_block_to_html_node,
+    "quote": quote_block_to_html_node,
+    "unordered_list": ul_block_to_html_node,
+    "ordered_list": ol_block_to_html_node,
+    "paragraph": paragraph_block_to_html_node
+}
+
+
+def markdown_to_html_node(markdown, cache=None) -> HTMLNode:
+    """Parse markdown, given as a string or as an iterable of lines.
+
+    With a BlockCache, blocks already rendered before are looked up instead
+    of parsed, and every block comes back as a leaf holding its html.
+    """
+    lines = markdown.split("\n") if isinstance(markdown, str) else markdown
     html_nodes = []
-    for block in blocks_with_types:
-        html_nodes.append(block_types_to_functions[block[1]](block[0]))
+    for block, block_type in iter_blocks(lines):
+        if cache is None:
+            html_nodes.append(BLOCK_TYPES_TO_FUNCTIONS[block_type](block))
+            continue
+        html = cache.get(block)
+        if html is None:
+            node = BLOCK_TYPES_TO_FUNCTIONS[block_type](block)
+            try:
+                html = node.to_html()
+            except ValueError:
+                # left for the whole tree to fail on, as it does uncached
+                html_nodes.append(node)
+                continue
+            cache.put(block, html)
+        html_nodes.append(LeafNode(None, html))
 
     return ParentNode(tag="div", children=html_nodes)
 
+INLINE_TAGS = {"bold": "b", "italic": "i", "code": "code"}
+LIST_TAGS = {"unordered_list": "ul", "ordered_list": "ol"}
+
+
+def _append_inline_html(text, parts) -> bool:
+    # appends what text_node_to_html_node(...).to_html() would give for
+    # every inline token, returning False if there were none
+    tokens = scan_inline(text)
+    for token_text, text_type, url in tokens:
+        if text_type == "text":
+            parts.append(token_text)
+        elif text_type == "link":
+            parts.append(f'<a href="{url}">{token_text}</a>')
+        elif text_type == "image":
+            parts.append(f'<img src="{url}" alt="{token_text}"></img>')
+        else:
+            tag = INLINE_TAGS[text_type]
+            parts.append(f"<{tag}>{token_text}</{tag}>")
+    return bool(tokens)
+
+
+def _append_block_html(block, block_type, parts) -> bool:
+    # appends the html of one block, returning False if an element of it
+    # ended up without children
+    if block_type == "heading":
+        level, content = heading_level_and_content(block)
+        parts.append(f"<h{level}>")
+        has_content = _append_inline_html(content, parts)
+        parts.append(f"</h{level}>")
+    elif block_type == "code":
+        parts.append("<pre><code>")
+        has_content = _append_inline_html(code_block_content(block), parts)
+        parts.append("</code></pre>")
+    elif block_type == "quote":
+        parts.append("<quoteblock>")
+        has_content = _append_inline_html(quote_block_content(block), parts)
+        parts.append("</quoteblock>")
+    elif block_type in LIST_TAGS:
+        parts.append(f"<{LIST_TAGS[block_type]}>")
+        has_content = True
+        for item in list_block_items(block, block_type):
+            parts.append("<li>")
+            has_content &= _append_inline_html(item, parts)
+            parts.append("</li>")
+        parts.append(f"</{LIST_TAGS[block_type]}>")
+    else:
+        parts.append("<p>")
+        has_content = _append_inline_html(block, parts)
+        parts.append("</p>")
+    return has_content
+
+
+def render_block_html(block, block_type, parts, cache=None) -> bool:
+    """Append the html of one block to parts, looking it up in cache, a
+    BlockCache, before rendering it. Returns False if an element of the
+    block ended up without children, which render_html raises for."""
+    if cache is None:
+        return _append_block_html(block, block_type, parts)
+    html = cache.get(block)
+    if html is not None:
+        parts.append(html)
+        return True
+    start = len(parts)
+    if not _append_block_html(block, block_type, parts):
+        return False
+    cache.put(block, "".join(parts[start:]))
+    return True
+
+
+def render_html(markdown, cache=None) -> str:
+    """Render markdown straight to html, without building a node tree.
+
+    The output is identical to markdown_to_html_node(markdown).to_html(),
+    including the ValueError raised for elements that end up without
+    children. Use markdown_to_html_node to transform the tree before
+    rendering it. Blocks found in cache, a BlockCache, are not parsed again.
+    """
+    return "".join(iter_render_html(markdown, cache))
+
+
+def iter_render_html(markdown, cache=None):
+    """Yield the html of render_html(markdown) as a sequence of string
+    chunks, rendering the blocks as the chunks are consumed.
+
+    The ValueError of render_html is raised after the html of every block
+    was yielded, so whatever was written of it has to be thrown away.
+    """
+    lines = markdown.split("\n") if isinstance(markdown, str) else markdown
+    parts = ["<div>"]
+    has_content = True
+    blocks = 0
+    for block, block_type in iter_blocks(lines):
+        has_content &= render_block_html(block, block_type, parts, cache)
+        blocks += 1
+        if len(parts) >= HTML_CHUNK_PARTS:
+            yield "".join(parts)
+            parts.clear()
+    # the tree only fails once it is serialized, after every block parsed
+    if not has_content or not blocks:
+        raise ValueError("ParentNode must have at least one child")
+    parts.append("</div>")
+    yield "".join(parts)
+
+
 def extract_title(markdown):
-    first_block = markdown_to_blocks(markdown)[0].split("\n")[0]
+    return title_from_block(next(iter_block_lines(markdown.split("\n")), [""]))
+
+
+def title_from_block(block_lines):
+    """Return the title of a page from its first block, given as its lines."""
+    first_block = block_lines[0]
     if not first_block.startswith("# "):
         raise ValueError(
         "Markdown file does not have a header (line starting with # in the beginning"
     )
     title = first_block[2:]
     return title
-
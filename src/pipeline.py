@@ -0,0 +1,318 @@
+"""Page generation as a streaming pipeline in bounded memory.
+
+Pages go through four stages, each in its own thread and connected by
+bounded queues: the reader reads markdown files line by line and groups
+their blocks into chunks, the parser joins and classifies the blocks, the
+renderer turns them into html and the writer streams that html into the
+template. No stage ever holds a whole page, so a huge page costs no more
+memory than a small one, and a stage that falls behind blocks the ones
+before it instead of letting chunks pile up.
+"""
+import os
+import queue
+import sys
+import threading
+import traceback
+import markdown
+from template import Template
+
+MEMORY_BUDGET = 64 * 1024 * 1024
+# pages larger than this are read and rendered in several chunks
+CHUNK_SIZE = 1024 * 1024
+# chunks waiting between two stages, on top of the memory budget
+QUEUE_SIZE = 16
+
+
+class MemoryBudget:
+    """Bytes of page text in flight between the stages of a pipeline.
+
+    Sizes are those of the str objects holding the text, as sys.getsizeof
+    counts them, so the overhead of every line and the wider characters of
+    non-ASCII text are charged too.
+
+    Only the reader waits for room, with reserve(): the stages after it add
+    what they produce with grow(), which never blocks, and the writer
+    releases everything once it wrote a chunk. Stages further down the
+    pipeline always make progress that way, so it can't deadlock on its own
+    budget. A chunk larger than the whole budget is let through once
+    nothing else is in flight, and every chunk once the budget is
+    abandoned, after a stage failed.
+    """
+    def __init__(self, max_size=MEMORY_BUDGET):
+        self.max_size = max_size
+        self.used = 0
+        self.peak = 0
+        self.abandoned = False
+        self._condition = threading.Condition()
+
+
+    def reserve(self, size):
+        with self._condition:
+            self._condition.wait_for(
+                lambda: (self.abandoned or self.used == 0
+                         or self.used + size <= self.max_size)
+            )
+            self._add(size)
+
+
+    def grow(self, size):
+        with self._condition:
+            self._add(size)
+
+
+    def _add(self, size):
+        self.used += size
+        self.peak = max(self.peak, self.used)
+
+
+    def release(self, size):
+        with self._condition:
+            self.used -= size
+            self._condition.notify_all()
+
+
+    def abandon(self):
+        with self._condition:
+            self.abandoned = True
+            self._condition.notify_all()
+
+
+    def __repr__(self):
+        return (f"MemoryBudget({self.used}/{self.max_size} used, "
+                f"peak {self.peak})")
+
+
+class Chunk:
+    """Consecutive blocks of one page, passed from stage to stage."""
+    def __init__(self, number, page, title=None, blocks=(), size=0,
+                 last=True):
+        # position of the page in the build, counting from 1
+        self.number = number
+        self.page = page
+        self.title = title
+        # lines of every block, then (block, block_type) pairs once parsed
+        self.blocks = blocks
+        # bytes reserved in the budget for this chunk
+        self.size = size
+        self.last = last
+        self.html = None
+        self.error = None
+
+
+class StreamingPipeline:
+    """Generates pages like main.generate_pages, in bounded memory.
+
+    memory_budget bounds the bytes of markdown and html in flight at once,
+    give or take the html of one chunk and the objects a stage makes while
+    working on a chunk. The template must have a
+    single {{ Content }} slot, which the html of a page is streamed into.
+    Blocks found in cache, a BlockCache, are not rendered again.
+    """
+    def __init__(self, template, memory_budget=MEMORY_BUDGET,
+                 chunk_size=None, cache=None):
+        if not isinstance(template, Template):
+            template = Template.from_file(template)
+        # fails now rather than on every page
+        template.split("Content")
+        self.template = template
+        self.budget = MemoryBudget(memory_budget)
+        # several chunks fit in the budget, to keep every stage busy
+        self.chunk_size = chunk_size or max(1, min(CHUNK_SIZE,
+                                                   memory_budget // 8))
+        self.cache = cache
+        self.total = 0
+        self.errors = []
+        # exception that ended a stage thread, raised again by run()
+        self.failure = None
+
+
+    def run(self, pages) -> list:
+        """Generate every (source, destination) pair in pages, printing
+        progress in their order. Returns a list of (source, traceback)
+        tuples for the pages that failed. An exception that ends a stage,
+        rather than a page, stops the pipeline and is raised here."""
+        self.total = len(pages)
+        self.errors = []
+        self.failure = None
+        if self.budget.abandoned:
+            # left unbalanced by the run that failed
+            self.budget = MemoryBudget(self.budget.max_size)
+        parse_queue = queue.Queue(QUEUE_SIZE)
+        render_queue = queue.Queue(QUEUE_SIZE)
+        write_queue = queue.Queue(QUEUE_SIZE)
+        stages = [
+            threading.Thread(target=self._run_stage,
+                             args=(self._parse, parse_queue, render_queue)),
+            threading.Thread(target=self._run_stage,
+                             args=(self._render, render_queue, write_queue)),
+            threading.Thread(target=self._run_stage,
+                             args=(self._write, write_queue, None)),
+        ]
+        for stage in stages:
+            stage.start()
+        try:
+            for number, page in enumerate(pages, start=1):
+                if self.failure is not None:
+                    break
+                try:
+                    self._read(number, page, parse_queue)
+                except Exception:
+                    chunk = Chunk(number, page)
+                    chunk.error = traceback.format_exc()
+                    parse_queue.put(chunk)
+        finally:
+            # every stage passes the end on to the next one
+            parse_queue.put(None)
+            for stage in stages:
+                stage.join()
+        if self.failure is not None:
+            raise self.failure
+        return self.errors
+
+
+    def _run_stage(self, stage, chunks, out):
+        # a stage that fails keeps draining its input, so that the stages
+        # before it never block on a full queue, and always passes the end
+        # on to the next one
+        try:
+            stage(chunks, out)
+        except BaseException as e:
+            if self.failure is None:
+                self.failure = e
+            # the reader may wait for budget a dropped chunk won't release
+            self.budget.abandon()
+            for _ in iter(chunks.get, None):
+                pass
+        finally:
+            if out is not None:
+                out.put(None)
+
+
+    def _read(self, number, page, out):
+        blocks = []
+        size = 0
+        title = None
+        with open(page[0], 'r') as f:
+            for block_lines in markdown.iter_block_lines(f):
+                if title is None:
+                    # before any block is parsed, like generate_page does
+                    title = markdown.title_from_block(block_lines)
+                blocks.append(block_lines)
+                size += (sys.getsizeof(block_lines)
+                         + sum(map(sys.getsizeof, block_lines)))
+                if size >= self.chunk_size:
+                    self._send(out, Chunk(number, page, title, blocks, size,
+                                          last=False))
+                    blocks = []
+                    size = 0
+        if title is None:
+            markdown.title_from_block([""])
+        self._send(out, Chunk(number, page, title, blocks, size))
+
+
+    def _send(self, out, chunk):
+        self.budget.reserve(chunk.size)
+        out.put(chunk)
+
+
+    def _parse(self, chunks, out):
+        for chunk in iter(chunks.get, None):
+            if chunk.error is None:
+                try:
+                    chunk.blocks = [
+                        ("\n".join(lines), markdown.classify_block_lines(lines))
+                        for lines in chunk.blocks
+                    ]
+                except Exception:
+                    chunk.error = traceback.format_exc()
+            out.put(chunk)
+
+
+    def _render(self, chunks, out):
+        number = None
+        for chunk in iter(chunks.get, None):
+            parts = []
+            if chunk.number != number:
+                number = chunk.number
+                failed = False
+                has_content = True
+                block_count = 0
+                parts.append("<div>")
+            if chunk.error is not None:
+                failed = True
+            elif not failed:
+                try:
+                    for block, block_type in chunk.blocks:
+                        has_content &= markdown.render_block_html(
+                            block, block_type, parts, self.cache
+                        )
+                    block_count += len(chunk.blocks)
+                    # like render_html, once every block is rendered
+                    if chunk.last and (not has_content or not block_count):
+                        raise ValueError(
+                            "ParentNode must have at least one child"
+                        )
+                    if chunk.last:
+                        parts.append("</div>")
+                    chunk.html = "".join(parts)
+                    html_size = sys.getsizeof(chunk.html)
+                    self.budget.grow(html_size)
+                    chunk.size += html_size
+                except Exception:
+                    failed = True
+                    chunk.error = traceback.format_exc()
+            chunk.blocks = None
+            out.put(chunk)
+
+
+    def _write(self, chunks, out=None):
+        number = None
+        f = None
+        tail = None
+        try:
+            for chunk in iter(chunks.get, None):
+                from_path, dest_path = chunk.page
+                tmp_path = f"{dest_path}.tmp"
+                if chunk.number != number:
+                    number = chunk.number
+                    failed = False
+                if not failed and chunk.error is None:
+                    try:
+                        if f is None:
+                            os.makedirs(os.path.dirname(dest_path),
+                                        exist_ok=True)
+                            head, tail = self.template.split(
+                                "Content", Title=chunk.title
+                            )
+                            # moved in place once complete, like generate_page
+                            f = open(tmp_path, 'w')
+                            f.write(head)
+                        f.write(chunk.html)
+                        if chunk.last:
+                            f.write(tail)
+                            f.close()
+                            f = None
+                            os.replace(tmp_path, dest_path)
+                    except Exception:
+                        chunk.error = traceback.format_exc()
+                if chunk.error is not None and not failed:
+                    failed = True
+                    if f is not None:
+                        f.close()
+                        f = None
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    print(f"[{number}/{self.total}] Failed to generate page "
+                          f"from {from_path}")
+                    self.errors.append((from_path, chunk.error))
+                elif chunk.last and not failed:
+                    print(f"[{number}/{self.total}] Generated page from "
+                          f"{from_path} to {dest_path} using "
+                          f"{self.template.path}")
+                self.budget.release(chunk.size)
+        except BaseException:
+            # the pipeline stops, without a page left half written
+            if f is not None:
+                f.close()
+                os.remove(f.name)
+            raise
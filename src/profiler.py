@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import inspect
+import functools
+from contextlib import contextmanager, nullcontext
+
+# functions of the markdown module that are timed on every call while a
+# profiler is instrumenting it, keyed by the stage they are reported as
+MARKDOWN_STAGES = {
+    "iter_block_lines": "markdown_to_blocks",
+    "classify_block_lines": "block_to_block_type",
+    "scan_inline": "inline",
+}
+
+
+class Profiler:
+    """Times the stages of a build, per page and in aggregate.
+
+    Coarse stages (a whole page, reading, writing...) are timed with the
+    stage() context manager and also kept as trace events. Functions that
+    run many times per page are timed through instrument() and only summed
+    per page, so that a big build doesn't produce millions of events.
+    Stage times are inclusive: "render" contains "inline" and the others.
+    """
+    def __init__(self):
+        self.page = None
+        self.pid = os.getpid()
+        self.events = []
+        # page -> stage -> [total ns, calls]
+        self.pages = {}
+
+
+    def _add(self, stage, duration, calls=1):
+        totals = self.pages.setdefault(self.page, {})
+        if stage in totals:
+            totals[stage][0] += duration
+            totals[stage][1] += calls
+        else:
+            totals[stage] = [duration, calls]
+
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter_ns() - start
+            self._add(name, duration)
+            self.events.append({
+                "name": name, "ph": "X", "pid": self.pid, "tid": 0,
+                "ts": start / 1000, "dur": duration / 1000,
+                "args": {"page": self.page},
+            })
+
+
+    def timed(self, stage, func):
+        if inspect.isgeneratorfunction(func):
+            return self._timed_generator(stage, func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._add(stage, time.perf_counter_ns() - start)
+        return wrapper
+
+
+    def _timed_generator(self, stage, func):
+        # a generator runs as it is consumed, so every step is timed and the
+        # steps of one call add up to a single call of the stage
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            generator = func(*args, **kwargs)
+            calls = 1
+            while True:
+                start = time.perf_counter_ns()
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    self._add(stage, time.perf_counter_ns() - start, calls)
+                    return
+                self._add(stage, time.perf_counter_ns() - start, calls)
+                calls = 0
+                yield item
+        return wrapper
+
+
+    @contextmanager
+    def instrument(self, module, stages=MARKDOWN_STAGES):
+        """Time the given functions of module until the context exits."""
+        originals = {name: getattr(module, name) for name in stages}
+        for name, stage in stages.items():
+            setattr(module, name, self.timed(stage, originals[name]))
+        try:
+            yield self
+        finally:
+            for name, func in originals.items():
+                setattr(module, name, func)
+
+
+    def writer(self, f):
+        """Return f with its writes timed as the "write" stage."""
+        return TimedWriter(self, f)
+
+
+    def export_state(self) -> dict:
+        """Return the collected data and clear it, to send across processes."""
+        state = {"events": self.events, "pages": self.pages}
+        self.events = []
+        self.pages = {}
+        return state
+
+
+    def merge(self, state):
+        self.events.extend(state["events"])
+        for page, stages in state["pages"].items():
+            totals = self.pages.setdefault(page, {})
+            for stage, (duration, calls) in stages.items():
+                if stage in totals:
+                    totals[stage][0] += duration
+                    totals[stage][1] += calls
+                else:
+                    totals[stage] = [duration, calls]
+
+
+    def summary(self) -> dict:
+        """Return stage -> {"total_ms", "calls"} summed over all pages."""
+        summary = {}
+        for stages in self.pages.values():
+            for stage, (duration, calls) in stages.items():
+                entry = summary.setdefault(stage, {"total_ms": 0.0, "calls": 0})
+                entry["total_ms"] += duration / 1e6
+                entry["calls"] += calls
+        return summary
+
+
+    def slowest_pages(self, n=10) -> list:
+        """Return the n (page, milliseconds) pairs with the longest "page" stage."""
+        timings = [
+            (page, stages["page"][0] / 1e6)
+            for page, stages in self.pages.items() if "page" in stages
+        ]
+        timings.sort(key=lambda timing: timing[1], reverse=True)
+        return timings[:n]
+
+
+    def write_json(self, path):
+        data = {
+            "stages": self.summary(),
+            "pages": {
+                str(page): {
+                    stage: {"total_ms": duration / 1e6, "calls": calls}
+                    for stage, (duration, calls) in stages.items()
+                }
+                for page, stages in self.pages.items()
+            },
+        }
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=1)
+
+
+    def write_chrome_trace(self, path):
+        """Write the events in the Trace Event Format read by chrome://tracing
+        and Perfetto."""
+        with open(path, 'w') as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+
+
+    def print_report(self, top=10):
+        print("\nStage                  total ms      calls")
+        summary = self.summary()
+        for stage in sorted(summary, key=lambda s: -summary[s]["total_ms"]):
+            entry = summary[stage]
+            print(f"{stage:<20} {entry['total_ms']:>10.2f} {entry['calls']:>10}")
+        slowest = self.slowest_pages(top)
+        if slowest:
+            print(f"\nSlowest {len(slowest)} pages:")
+            for page, duration in slowest:
+                print(f"{duration:>10.2f} ms  {page}")
+
+
+class TimedWriter:
+    """Wraps a text file for Profiler.writer.
+
+    Only the writes themselves are timed, not the production of the
+    fragments given to writelines, which may be rendered as they are
+    consumed. All the writes to the file add up to a single call.
+    """
+    def __init__(self, profiler, f):
+        self.profiler = profiler
+        self.f = f
+        self.calls = 1
+
+
+    def _time(self, func, *args):
+        start = time.perf_counter_ns()
+        try:
+            return func(*args)
+        finally:
+            self.profiler._add("write", time.perf_counter_ns() - start,
+                               self.calls)
+            self.calls = 0
+
+
+    def write(self, text):
+        return self._time(self.f.write, text)
+
+
+    def writelines(self, lines):
+        for line in lines:
+            self._time(self.f.write, line)
+
+
+    def flush(self):
+        self._time(self.f.flush)
+
+
+class NullProfiler:
+    """Stands in for Profiler when profiling is off, at almost no cost."""
+    page = None
+
+    def stage(self, name):
+        return nullcontext()
+
+
+    def writer(self, f):
+        return f
+
+
+NULL_PROFILER = NullProfiler()
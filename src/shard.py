@@ -0,0 +1,184 @@
+import os
+import json
+import filecmp
+import hashlib
+from manifest import BuildManifest, MANIFEST_PATH
+from sync import sync_file
+from walk import walk_tree
+
+
+def parse_shard(text) -> tuple:
+    """Parse "i/N" into (i, N), shards being numbered from 1 to N."""
+    index, sep, count = text.partition("/")
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise ValueError(f"expected a shard like 2/4, got {text!r}")
+    if not sep or count < 1 or not 1 <= index <= count:
+        raise ValueError(f"expected a shard like 2/4, got {text!r}")
+    return index, count
+
+
+def shard_output_dir(dest_dir_path, index, count) -> str:
+    return f"{dest_dir_path}.shard-{index}-of-{count}"
+
+
+def shard_manifest_path(index, count, manifest_path=MANIFEST_PATH) -> str:
+    root, ext = os.path.splitext(manifest_path)
+    return f"{root}.shard-{index}-of-{count}{ext}"
+
+
+def stable_hash(rel_path) -> int:
+    # unlike hash(), the same on every machine and every run
+    rel_path = rel_path.replace(os.sep, "/")
+    return int.from_bytes(hashlib.sha256(rel_path.encode()).digest()[:8], "big")
+
+
+def load_timings(profile_path, dir_path_content) -> dict:
+    """Return relative page path -> milliseconds from the build_profile.json
+    written by main.py --profile."""
+    with open(profile_path, 'r') as f:
+        pages = json.load(f)["pages"]
+    timings = {}
+    for from_path, stages in pages.items():
+        if "page" in stages:
+            rel_path = os.path.relpath(from_path, dir_path_content)
+            timings[rel_path] = stages["page"]["total_ms"]
+    return timings
+
+
+def plan_shards(rel_paths, count, timings) -> dict:
+    """Assign every relative page path to a shard, balancing build time.
+
+    Pages are handed out from the slowest to the fastest, each to the
+    shard with the least time so far. Pages missing from timings are
+    assumed to take the average time of the others. The plan only depends
+    on its arguments, so every host computes the same one.
+    """
+    known = [timings[path] for path in rel_paths if path in timings]
+    default = sum(known) / len(known) if known else 1.0
+    costs = sorted(((timings.get(path, default), path) for path in rel_paths),
+                   key=lambda cost: (-cost[0], cost[1]))
+    loads = [0.0] * count
+    plan = {}
+    for cost, path in costs:
+        shard = min(range(count), key=lambda i: (loads[i], i))
+        loads[shard] += cost
+        plan[path] = shard
+    return plan
+
+
+class Shard:
+    """Selects the pages built by shard index of count.
+
+    Without timings a page goes to the shard given by a stable hash of its
+    path relative to the content directory. With the timings of a previous
+    build, pages are balanced by build time with plan_shards.
+    """
+    def __init__(self, index, count, timings=None):
+        self.index = index
+        self.count = count
+        self.timings = timings
+
+
+    def select(self, pages, dir_path_content) -> list:
+        rel_paths = [os.path.relpath(from_path, dir_path_content)
+                     for from_path, _ in pages]
+        if self.timings is None:
+            shards = [stable_hash(path) % self.count for path in rel_paths]
+        else:
+            plan = plan_shards(rel_paths, self.count, self.timings)
+            shards = [plan[path] for path in rel_paths]
+        return [page for page, shard in zip(pages, shards)
+                if shard == self.index - 1]
+
+
+    def __repr__(self):
+        return f"Shard({self.index}/{self.count})"
+
+
+def merge_shards(count, dest_dir_path, expected_pages,
+                 manifest_path=MANIFEST_PATH) -> list:
+    """Combine the outputs and manifests of shards 1 to count.
+
+    Files are copied from every shard directory into dest_dir_path, only if
+    they changed, and the shard manifests are merged into the manifest at
+    manifest_path with their paths moved to dest_dir_path. expected_pages
+    is the list of (source, destination) pairs of the whole site. Returns a
+    list of problems: shards missing or built with another template, files
+    written differently by two shards and expected pages no shard built.
+    Nothing is changed unless there are none.
+    """
+    problems = []
+    for index in range(1, count + 1):
+        shard_dir = shard_output_dir(dest_dir_path, index, count)
+        shard_manifest = shard_manifest_path(index, count, manifest_path)
+        if not os.path.isdir(shard_dir) or not os.path.exists(shard_manifest):
+            problems.append(f"shard {index}/{count} has no output in "
+                            f"{shard_dir} or no manifest {shard_manifest}")
+    if problems:
+        return problems
+
+    # everything is checked before the first file is written
+    origins = {}
+    merged = BuildManifest.load(manifest_path)
+    previous_pages = merged.pages
+    previous_assets = merged.assets
+    merged.pages = {}
+    merged.assets = []
+    # (generator version, template hash) of the first shard
+    reference = None
+    for index in range(1, count + 1):
+        shard_dir = shard_output_dir(dest_dir_path, index, count)
+        shard_manifest = shard_manifest_path(index, count, manifest_path)
+        for _, rel_dir, files in walk_tree(shard_dir):
+            for entry in files:
+                rel_path = os.path.join(rel_dir, entry.name)
+                if rel_path not in origins:
+                    origins[rel_path] = entry.path
+                elif not filecmp.cmp(origins[rel_path], entry.path,
+                                     shallow=False):
+                    problems.append(f"{rel_path} differs between "
+                                    f"{origins[rel_path]} and {entry.path}")
+        manifest = BuildManifest.load(shard_manifest)
+        if reference is None:
+            reference = (manifest.version, manifest.template_hash)
+            merged.version, merged.template_hash = reference
+        elif (manifest.version, manifest.template_hash) != reference:
+            problems.append(f"shard {index}/{count} was built with another "
+                            f"template or generator version")
+        for source_path, entry in manifest.pages.items():
+            dest_path = os.path.join(
+                dest_dir_path, os.path.relpath(entry["dest"], shard_dir)
+            )
+            merged.pages[source_path] = {"hash": entry["hash"],
+                                         "dest": dest_path}
+        merged.assets.extend(
+            os.path.join(dest_dir_path, os.path.relpath(asset, shard_dir))
+            for asset in manifest.assets
+        )
+    for source_path, dest_path in expected_pages:
+        if (source_path not in merged.pages
+                or os.path.relpath(dest_path, dest_dir_path) not in origins):
+            problems.append(f"no shard built {source_path}")
+    if problems:
+        return problems
+
+    for rel_path, shard_path in origins.items():
+        dest_path = os.path.join(dest_dir_path, rel_path)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        sync_file(shard_path, dest_path)
+    merged.assets = sorted(set(merged.assets))
+    # outputs of an earlier build that no shard produced this time
+    merged_dests = {entry["dest"] for entry in merged.pages.values()}
+    for source_path in sorted(set(previous_pages) - set(merged.pages)):
+        dest_path = previous_pages[source_path]["dest"]
+        if dest_path not in merged_dests and os.path.exists(dest_path):
+            os.remove(dest_path)
+            print(f"Removed page without source: {dest_path}")
+    for asset in sorted(set(previous_assets) - set(merged.assets)):
+        if os.path.exists(asset):
+            os.remove(asset)
+            print(f"stale file removed: '{asset}'")
+    merged.save()
+    return problems
@@ -0,0 +1,63 @@
+import os
+import shutil
+from manifest import hash_file
+from walk import walk_tree
+
+
+def files_differ(src_path, dest_path, checksum=False) -> bool:
+    """Tell whether dest_path is missing or out of date with src_path.
+
+    Files are compared by size and modification time, like rsync does. With
+    checksum=True, files of the same size are compared by content hash
+    instead, which catches changes that kept the mtime.
+    """
+    try:
+        dest_stat = os.stat(dest_path)
+    except FileNotFoundError:
+        return True
+    src_stat = os.stat(src_path)
+    if src_stat.st_size != dest_stat.st_size:
+        return True
+    if checksum:
+        return hash_file(src_path) != hash_file(dest_path)
+    # whole seconds, since not every filesystem keeps sub-second mtimes
+    return int(src_stat.st_mtime) != int(dest_stat.st_mtime)
+
+
+def sync_file(src_path, dest_path, checksum=False) -> bool:
+    """Copy src_path to dest_path if it changed, returning whether it did."""
+    if not files_differ(src_path, dest_path, checksum):
+        return False
+    shutil.copy2(src_path, dest_path)
+    print(f"file copied from '{src_path}' to '{dest_path}'")
+    return True
+
+
+def sync_static(src_dir, dest_dir, previous=(), checksum=False) -> list:
+    """Make the files of src_dir present and up to date in dest_dir.
+
+    Only new or changed files are copied, with their mtime preserved, so
+    unchanged files keep their timestamps. previous is the list returned by
+    the last sync: files in it that no longer exist in src_dir are deleted
+    from dest_dir. Returns the destination paths of all synced files.
+    """
+    synced = []
+    _sync_dir(src_dir, dest_dir, checksum, synced)
+    current = set(synced)
+    for dest_path in sorted(previous):
+        if dest_path not in current and os.path.exists(dest_path):
+            os.remove(dest_path)
+            print(f"stale file removed: '{dest_path}'")
+    return synced
+
+
+def _sync_dir(src_dir, dest_dir, checksum, synced):
+    for dir_path, rel_dir, files in walk_tree(src_dir):
+        new_dir = os.path.join(dest_dir, rel_dir) if rel_dir else dest_dir
+        if not os.path.exists(new_dir):
+            os.makedirs(new_dir)
+            print(f"new dir created: {new_dir}")
+        for entry in files:
+            new_path = os.path.join(new_dir, entry.name)
+            sync_file(entry.path, new_path, checksum)
+            synced.append(new_path)
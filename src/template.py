@@ -0,0 +1,87 @@
+import re
+
+SLOT_PATTERN = re.compile(r"\{\{ *(\w+) *\}\}")
+
+
+class Template:
+    """A page template split once into literal fragments and named slots.
+
+    "<title>{{ Title }}</title>" compiles to the fragments "<title>" and
+    "</title>" around the slot "Title". Rendering joins the fragments with
+    the slot values, so the template text is never searched or copied again.
+    Instances are plain picklable objects and can be sent to worker
+    processes.
+    """
+    def __init__(self, text, path=None):
+        self.path = path
+        self.fragments = []
+        self.slots = []
+        # the original text of every slot, used for slots without a value
+        self.placeholders = []
+        start = 0
+        for match in SLOT_PATTERN.finditer(text):
+            self.fragments.append(text[start:match.start()])
+            self.slots.append(match.group(1))
+            self.placeholders.append(match.group(0))
+            start = match.end()
+        self.fragments.append(text[start:])
+
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'r') as f:
+            return cls(f.read(), path=path)
+
+
+    def render(self, **values) -> str:
+        parts = [self.fragments[0]]
+        for i, slot in enumerate(self.slots):
+            parts.append(values.get(slot, self.placeholders[i]))
+            parts.append(self.fragments[i + 1])
+        return "".join(parts)
+
+
+    def write(self, f, **values):
+        """Stream the rendered template into the file-like object f.
+
+        Values may be strings or iterables of string fragments, such as
+        HTMLNode.iter_html(), which are written as they are produced. An
+        iterable can only be consumed once, so it should fill a single slot.
+        """
+        f.write(self.fragments[0])
+        for i, slot in enumerate(self.slots):
+            value = values.get(slot, self.placeholders[i])
+            if isinstance(value, str):
+                f.write(value)
+            else:
+                f.writelines(value)
+            f.write(self.fragments[i + 1])
+
+
+    def split(self, slot, **values) -> tuple:
+        """Render the template around slot, returning the (head, tail) text
+        that goes before and after its value, so that the value can be
+        written in pieces in between.
+
+        Raises ValueError unless the template has the slot exactly once.
+        """
+        if self.slots.count(slot) != 1:
+            raise ValueError(f"{self.path or 'the template'} must have "
+                             f"exactly one {{{{ {slot} }}}} slot")
+        index = self.slots.index(slot)
+        return (self._fill(0, index, values),
+                self._fill(index + 1, len(self.slots), values))
+
+
+    def _fill(self, start, end, values) -> str:
+        # fragments start to end, with the values of slots start to end - 1
+        # between them
+        parts = [self.fragments[start]]
+        for i in range(start, end):
+            parts.append(values.get(self.slots[i], self.placeholders[i]))
+            parts.append(self.fragments[i + 1])
+        return "".join(parts)
+
+
+    def __repr__(self):
+        return f"Template({self.path}, slots={self.slots})"
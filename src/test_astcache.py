@@ -0,0 +1,100 @@
+import os
+import sys
+import unittest
+from astcache import ASTCache, dump_tree, load_tree
+from fixtures import TempDirMixin
+from htmlnode import FrozenLeafNode, LeafNode, ParentNode
+from markdown import markdown_to_html_node
+
+MARKDOWN = """# Title
+
+Some **bold** and a [link](/url) with ![image](/img.png)
+
+* one
+* two
+"""
+
+
+class TestSerialization(unittest.TestCase):
+    def test_round_trip(self):
+        node = markdown_to_html_node(MARKDOWN)
+        loaded = load_tree(dump_tree(node))
+        self.assertEqual(loaded.to_html(), node.to_html())
+        heading_text = loaded.children[0].children[0]
+        self.assertIsInstance(heading_text, FrozenLeafNode)
+        link = loaded.children[1].children[3]
+        self.assertEqual(type(link), LeafNode)
+        self.assertEqual(link.props, {"href": "/url"})
+
+
+    def test_deep_tree(self):
+        node = LeafNode(None, "deep")
+        for _ in range(sys.getrecursionlimit() * 2):
+            node = ParentNode("div", [node])
+        self.assertEqual(load_tree(dump_tree(node)).to_html(), node.to_html())
+
+
+    def test_invalid(self):
+        for data in [b"", b"not marshal", dump_tree(LeafNode(None, "a"))[:-2]]:
+            with self.assertRaises(ValueError):
+                load_tree(data)
+
+
+class TestASTCache(TempDirMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = os.path.join(self.tmp.name, "cache")
+
+
+    def test_get_and_put(self):
+        cache = ASTCache(self.directory)
+        self.assertIsNone(cache.get(MARKDOWN))
+        node = cache.markdown_to_html_node(MARKDOWN)
+        cached = ASTCache(self.directory).get(MARKDOWN)
+        self.assertEqual(cached.to_html(), node.to_html())
+        self.assertIsNone(cache.get(MARKDOWN + "changed"))
+        self.assertEqual((cache.hits, cache.misses), (0, 3))
+
+
+    def test_corrupt_file_is_a_miss(self):
+        cache = ASTCache(self.directory)
+        cache.markdown_to_html_node(MARKDOWN)
+        with open(cache.path_for(MARKDOWN), 'wb') as f:
+            f.write(b"garbage")
+        self.assertIsNone(cache.get(MARKDOWN))
+
+
+    def test_prune_least_recently_used(self):
+        cache = ASTCache(self.directory)
+        sources = [f"# Page {i}\n\ntext" for i in range(3)]
+        for i, source in enumerate(sources):
+            cache.markdown_to_html_node(source)
+            os.utime(cache.path_for(source), ns=(i * 10**9, i * 10**9))
+        # reading the oldest one makes it the most recently used
+        cache.get(sources[0])
+        size = os.path.getsize(cache.path_for(sources[0]))
+        self.assertEqual(cache.prune(max_bytes=2 * size), 1)
+        self.assertFalse(os.path.exists(cache.path_for(sources[1])))
+        self.assertIsNotNone(cache.get(sources[0]))
+        self.assertIsNotNone(cache.get(sources[2]))
+
+
+    def test_size_bound(self):
+        cache = ASTCache(self.directory, max_bytes=1000)
+        for i in range(50):
+            cache.markdown_to_html_node(f"# Page {i}\n\ntext")
+        total = sum(entry.stat().st_size for entry in os.scandir(self.directory))
+        self.assertLessEqual(total, 1000)
+
+
+    def test_put_again_keeps_size(self):
+        cache = ASTCache(self.directory)
+        node = markdown_to_html_node(MARKDOWN)
+        for _ in range(5):
+            cache.put(MARKDOWN, node)
+        self.assertEqual(cache._size, os.path.getsize(cache.path_for(MARKDOWN)))
+        self.assertEqual(cache._size, cache._scan_size())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,227 @@
+import io
+import os
+import sys
+import time
+import asyncio
+import subprocess
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+from fixtures import TempDirMixin
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT_DIR, "bench")
+if BENCH_DIR not in sys.path:
+    sys.path.insert(0, BENCH_DIR)
+
+import load  # noqa: E402
+import suite  # noqa: E402
+from corpus import (  # noqa: E402
+    PageGenerator, generate_corpus, parse_mix
+)
+
+
+def read_tree(dir_path) -> dict:
+    tree = {}
+    for parent, _, file_names in os.walk(dir_path):
+        for name in file_names:
+            path = os.path.join(parent, name)
+            with open(path, 'r') as f:
+                tree[os.path.relpath(path, dir_path)] = f.read()
+    return tree
+
+
+class TestCorpus(TempDirMixin, unittest.TestCase):
+    def test_same_seed_same_tree(self):
+        options = {"seed": 7, "blocks": 10, "words": 12}
+        first = generate_corpus(self.path("first"), pages=25,
+                                pages_per_dir=10, **options)
+        generate_corpus(self.path("second"), pages=25, pages_per_dir=10,
+                        **options)
+        self.assertEqual(len(first), 25)
+        self.assertEqual(read_tree(self.path("first")),
+                         read_tree(self.path("second")))
+        self.assertIn(os.path.join("section2", "page24.md"),
+                      read_tree(self.path("first")))
+
+        generate_corpus(self.path("other"), pages=25, pages_per_dir=10,
+                        **dict(options, seed=8))
+        self.assertNotEqual(read_tree(self.path("first")),
+                            read_tree(self.path("other")))
+
+
+    def test_pages_are_valid_markdown(self):
+        import markdown
+        generator = PageGenerator(seed=3, blocks=30)
+        for _ in range(5):
+            page = generator.page()
+            self.assertTrue(page.startswith("# "))
+            markdown.render_html(page)
+
+
+    def test_parse_mix(self):
+        self.assertEqual(parse_mix("paragraph=6,code=1"),
+                         {"paragraph": 6.0, "code": 1.0})
+        # a block type without weight counts once
+        self.assertEqual(parse_mix(" quote , heading=2.5"),
+                         {"quote": 1.0, "heading": 2.5})
+        with self.assertRaises(ValueError):
+            parse_mix("paragraph=6,table=1")
+        with self.assertRaises(ValueError):
+            parse_mix("paragraph=lots")
+
+
+    def run_bench(self, *args):
+        return subprocess.run([sys.executable, "-m", "bench", *args],
+                              cwd=ROOT_DIR, capture_output=True, text=True)
+
+
+    def test_mix_option(self):
+        result = self.run_bench("--generate", self.path("code"), "--pages",
+                                "3", "--blocks", "5", "--mix", "code=1")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        pages = read_tree(self.path("code"))
+        self.assertEqual(len(pages), 3)
+        for page in pages.values():
+            blocks = page.strip().split("\n\n")
+            self.assertEqual(len(blocks), 6)
+            self.assertTrue(all(block.startswith("```")
+                                for block in blocks[1:]))
+
+        result = self.run_bench("--generate", self.path("bad"),
+                                "--mix", "table=1")
+        self.assertEqual(result.returncode, 2)
+        self.assertIn("--mix", result.stderr)
+        self.assertFalse(os.path.exists(self.path("bad")))
+
+
+class TestCompare(TempDirMixin, unittest.TestCase):
+    def report(self, seconds, peak_kib, params=None):
+        return {
+            "meta": {"params": params or {"pages": 10, "seed": 0}},
+            "results": {name: {"best_s": best_s}
+                        for name, best_s in seconds.items()},
+            "memory": {name: {"peak_kib": peak}
+                       for name, peak in peak_kib.items()},
+        }
+
+
+    def compare(self, baseline, report):
+        path = self.path("results", "baseline.json")
+        suite.save(baseline, path)
+        with redirect_stdout(io.StringIO()) as out:
+            suite.compare(report, path)
+        return out.getvalue().splitlines()
+
+
+    def test_compare(self):
+        baseline = self.report({"render_html": 0.002, "old": 1.0},
+                               {"render_html": 100.0})
+        report = self.report({"render_html": 0.001, "new": 1.0},
+                             {"render_html": 150.0})
+        lines = self.compare(baseline, report)
+        self.assertEqual(lines[0], "")
+        self.assertEqual(lines[1].split(),
+                         ["benchmark", "baseline", "current", "change"])
+        # benchmarks missing from either report are left out
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[2].split(),
+                         ["render_html", "2.000ms", "1.000ms", "-50.0%"])
+        self.assertEqual(lines[3].split(),
+                         ["peak", "render_html", "100.0KiB", "150.0KiB",
+                          "+50.0%"])
+
+
+    def test_compare_different_params(self):
+        baseline = self.report({"render_html": 0.001}, {})
+        report = self.report({"render_html": 0.001}, {},
+                             params={"pages": 20, "seed": 0})
+        lines = self.compare(baseline, report)
+        self.assertEqual(lines[0],
+                         "warning: the baseline was run with different "
+                         "parameters")
+        self.assertEqual(lines[-1].split()[-1], "+0.0%")
+
+
+class FakeConnection:
+    """Stands for load.Connection, answering every request after delay
+    seconds and keeping the time each one was sent."""
+    sent = []
+    delay = 0.0
+
+    def __init__(self, host, port, headers):
+        pass
+
+
+    async def request(self, path):
+        FakeConnection.sent.append(time.perf_counter())
+        await asyncio.sleep(self.delay)
+        return 200, len(path)
+
+
+    def close(self):
+        pass
+
+
+class TestLoad(TempDirMixin, unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(load.percentile(values, 0.50), 50)
+        self.assertEqual(load.percentile(values, 0.99), 99)
+        self.assertEqual(load.percentile(values, 1.0), 100)
+        self.assertEqual(load.percentile(values, 0.0), 1)
+        self.assertEqual(load.percentile([7], 0.95), 7)
+        self.assertIsNone(load.percentile([], 0.5))
+
+
+    def test_collect_urls(self):
+        for name in ["index.html", "index.html.gz", "style.css",
+                     "blog/index.html", "blog/post.html", "blog/post.html.br",
+                     "blog/draft.html.tmp", "images/logo.png"]:
+            self.write(os.path.join("public", name), "x")
+        self.assertEqual(load.collect_urls(self.path("public")), [
+            "/", "/blog/", "/blog/index.html", "/blog/post.html",
+            "/images/logo.png", "/index.html", "/style.css",
+        ])
+
+
+    def run_load(self, delay, **options):
+        FakeConnection.sent = []
+        FakeConnection.delay = delay
+        with mock.patch("load.Connection", FakeConnection):
+            return load.run_load(["/a", "/b"], **options)
+
+
+    def test_rate(self):
+        results = self.run_load(0.0, rate=50, requests=20, concurrency=4)
+        self.assertEqual(results["requests"], 20)
+        self.assertEqual(results["statuses"], {"200": 20})
+        # one every 20 ms whatever the response times
+        start = FakeConnection.sent[0]
+        for i, sent in enumerate(FakeConnection.sent):
+            self.assertGreaterEqual(sent - start, i / 50 - 0.005)
+        self.assertGreaterEqual(results["elapsed_s"], 19 / 50)
+
+
+    def test_rate_counts_queueing(self):
+        # a single connection answering at 20 requests per second can't
+        # keep up with 100, requests wait and their latency shows it
+        results = self.run_load(0.05, rate=100, requests=10, concurrency=1)
+        self.assertEqual(results["requests"], 10)
+        # the last one is due after 90 ms and answered after 500 ms
+        self.assertGreater(results["latency_ms"]["max"], 500 - 90 - 20)
+        self.assertLess(results["latency_ms"]["p50"],
+                        results["latency_ms"]["max"])
+
+
+    def test_timeout(self):
+        results = self.run_load(1.0, concurrency=2, requests=2, timeout=0.05)
+        self.assertEqual(results["requests"], 2)
+        self.assertEqual(results["errors"], 2)
+        self.assertEqual(results["connection_errors"], {"TimeoutError": 2})
+        self.assertIsNone(results["latency_ms"]["p50"])
+        self.assertLess(results["elapsed_s"], 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
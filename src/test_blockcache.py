@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+from blockcache import BlockCache
+from markdown import markdown_to_html_node, render_html
+
+
+class TestBlockCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = BlockCache(max_entries=2)
+        cache.put("a", "<p>a</p>")
+        cache.put("b", "<p>b</p>")
+        self.assertEqual(cache.get("a"), "<p>a</p>")
+        cache.put("c", "<p>c</p>")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(list(cache.entries), ["a", "c"])
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+
+    def test_render_html(self):
+        cache = BlockCache()
+        md = "# Title\n\nShared **notice**\n\nShared **notice**"
+        self.assertEqual(render_html(md, cache=cache), render_html(md))
+        self.assertEqual(cache.stats(), {
+            "hits": 1, "misses": 2, "entries": 2, "hit_rate": 1 / 3,
+        })
+        node = markdown_to_html_node(md, cache=cache)
+        self.assertEqual(node.to_html(), render_html(md))
+        self.assertEqual(cache.hits, 4)
+
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.json")
+            cache = BlockCache(path=path)
+            render_html("one\n\ntwo\n\nthree", cache=cache)
+            cache.save()
+            loaded = BlockCache.load(path, max_entries=2)
+            self.assertEqual(list(loaded.entries), ["two", "three"])
+            self.assertEqual(loaded.get("three"), "<p>three</p>")
+            with open(path, 'w') as f:
+                f.write('{"version": "0", "entries": [["a", "<p>b</p>"]]}')
+            self.assertEqual(len(BlockCache.load(path).entries), 0)
+
+
+    def test_export_and_merge(self):
+        worker = BlockCache()
+        worker.track_added()
+        render_html("a\n\na", cache=worker)
+        cache = BlockCache()
+        cache.merge(worker.export_state())
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.get("a"), "<p>a</p>")
+        self.assertEqual(worker.export_state()["entries"], {})
+        self.assertEqual(cache.export_state()["entries"], {})
+
+
+    def test_bounded_without_export(self):
+        # rendering in the process of the cache keeps only max_entries
+        cache = BlockCache(max_entries=10)
+        for i in range(5000):
+            cache.put(f"block {i}", f"<p>{i}</p>")
+        self.assertEqual(len(cache.entries), 10)
+        self.assertIsNone(cache._added)
+        self.assertEqual(cache.export_state()["entries"], {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import gzip
+import io
+import os
+import unittest
+from contextlib import redirect_stdout
+from compress import MIN_COMPRESS_SIZE, available_encoders, compress_outputs
+from fixtures import TempDirMixin
+
+PAGE = "<p>" + "Some text " * MIN_COMPRESS_SIZE + "</p>"
+
+
+class TestCompressOutputs(TempDirMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.root = self.tmp.name
+        self.page = self.write("blog/index.html", PAGE)
+        self.write("small.css", "p {}")
+        self.write("image.png", PAGE)
+
+
+    def compress(self):
+        with redirect_stdout(io.StringIO()):
+            return compress_outputs(self.root, jobs=2,
+                                    encoders={".gz": gzip.compress})
+
+
+    def test_only_changed_files(self):
+        self.assertEqual(self.compress(), [self.page + ".gz"])
+        with open(self.page + ".gz", 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()).decode(), PAGE)
+        self.assertEqual(self.compress(), [])
+        self.write("blog/index.html", PAGE + "<p>more</p>")
+        self.assertEqual(self.compress(), [self.page + ".gz"])
+
+
+    def test_stale_copies_removed(self):
+        self.compress()
+        os.remove(self.page)
+        self.write("small.css.gz", "left over")
+        self.compress()
+        self.assertEqual(sorted(os.listdir(self.root)),
+                         ["blog", "image.png", "small.css"])
+        self.assertEqual(os.listdir(os.path.join(self.root, "blog")), [])
+
+
+    def test_static_compressed_files_kept(self):
+        # copied from static/, like a sitemap.xml.gz, not written by compress
+        sitemap = self.write("sitemap.xml.gz", "static")
+        page_copy = self.write("blog/index.html.gz", "static")
+        with redirect_stdout(io.StringIO()):
+            written = compress_outputs(self.root,
+                                       encoders={".gz": gzip.compress},
+                                       keep=[sitemap, page_copy])
+        self.assertEqual(written, [])
+        self.assertEqual(self.read("sitemap.xml.gz"), "static")
+        self.assertEqual(self.read("blog/index.html.gz"), "static")
+
+
+    def test_available_encoders(self):
+        encoders = available_encoders()
+        self.assertIn(".gz", encoders)
+        data = PAGE.encode()
+        self.assertEqual(gzip.decompress(encoders[".gz"](data)), data)
+        self.assertEqual(encoders[".gz"](data), encoders[".gz"](data))
+
+
+if __name__ == "__main__":
+    unittest.main()
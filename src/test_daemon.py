@@ -0,0 +1,149 @@
+import os
+import signal
+import socket
+import threading
+import unittest
+from unittest import mock
+from daemon import (BuildDaemon, DaemonRequestHandler, DaemonServer,
+                    claim_socket, send_request)
+from fixtures import TempDirMixin
+
+
+class TestBuildDaemon(TempDirMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.template = self.write("template.html", "{{ Title }}|{{ Content }}")
+        self.write("content/index.md", "# Home\n\nWelcome")
+        self.write("content/blog/post.md", "# Post\n\nSome **bold** text")
+        self.write("static/style.css", "body {}")
+        self.daemon = BuildDaemon(
+            self.path("content"), self.path("static"), self.template,
+            self.path("public"), self.path("manifest.json")
+        )
+        self.socket_path = self.path("daemon.sock")
+        self.server = DaemonServer(self.socket_path, self.daemon)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        self.daemon.close()
+
+
+    def test_build_and_rebuild(self):
+        response = send_request({"command": "build"}, self.socket_path)
+        self.assertTrue(response["ok"])
+        self.assertEqual(self.read("public/index.html"),
+                         "Home|<div><h1>Home</h1><p>Welcome</p></div>")
+        self.assertEqual(self.read("public/style.css"), "body {}")
+        self.assertIn("Generated page from", response["output"])
+
+        response = send_request({"command": "build"}, self.socket_path)
+        self.assertIn("Skipping 2 unchanged pages", response["output"])
+
+        self.write("content/index.md", "# Home\n\nChanged")
+        response = send_request(
+            {"command": "rebuild", "paths": [self.path("content/index.md")]},
+            self.socket_path
+        )
+        self.assertTrue(response["ok"])
+        self.assertEqual(self.read("public/index.html"),
+                         "Home|<div><h1>Home</h1><p>Changed</p></div>")
+
+        status = send_request({"command": "status"}, self.socket_path)
+        self.assertEqual(status["builds"], 3)
+        self.assertEqual(status["pages"], 2)
+        self.assertEqual(status["last_build"]["command"], "rebuild")
+
+
+    def test_template_change_between_builds(self):
+        send_request({"command": "build"}, self.socket_path)
+        self.write("template.html", "<title>{{ Title }}</title>")
+        send_request({"command": "build"}, self.socket_path)
+        self.assertEqual(self.read("public/index.html"), "<title>Home</title>")
+
+
+    def test_errors(self):
+        self.write("content/broken.md", "No title here")
+        response = send_request({"command": "build"}, self.socket_path)
+        self.assertFalse(response["ok"])
+        self.assertEqual([path for path, _ in response["errors"]],
+                         [self.path("content/broken.md")])
+        response = send_request({"command": "nope"}, self.socket_path)
+        self.assertEqual(response, {"ok": False,
+                                    "error": "unknown command 'nope'"})
+
+
+    def test_stop(self):
+        self.assertEqual(send_request({"command": "stop"}, self.socket_path),
+                         {"ok": True})
+        self.thread.join(timeout=5)
+        self.assertFalse(self.thread.is_alive())
+
+
+    def test_worker_pool_reused(self):
+        daemon = BuildDaemon(
+            self.path("content"), self.path("static"), self.template,
+            self.path("public"), self.path("manifest.json"), jobs=2
+        )
+        self.addCleanup(daemon.close)
+        self.assertTrue(daemon.handle({"command": "build"})["ok"])
+        executor = daemon._executor
+        workers = set(executor._processes)
+        self.write("template.html", "<title>{{ Title }}</title>")
+        response = daemon.handle({"command": "build"})
+        self.assertTrue(response["ok"])
+        self.assertEqual(response["output"].count("Generated page"), 2)
+        self.assertEqual(self.read("public/index.html"), "<title>Home</title>")
+        self.assertIs(daemon._executor, executor)
+        self.assertEqual(set(executor._processes), workers)
+
+
+    def test_dead_worker(self):
+        daemon = BuildDaemon(
+            self.path("content"), self.path("static"), self.template,
+            self.path("public"), self.path("manifest.json"), jobs=2
+        )
+        self.addCleanup(daemon.close)
+        self.assertTrue(daemon.handle({"command": "build"})["ok"])
+        executor = daemon._executor
+        for pid in list(executor._processes):
+            os.kill(pid, signal.SIGKILL)
+        response = daemon.handle({"command": "build", "force": True})
+        self.assertTrue(response["ok"], response.get("error"))
+        self.assertEqual(response["errors"], [])
+        self.assertIsNot(daemon._executor, executor)
+        self.write("content/index.md", "# Welcome")
+        response = daemon.handle({"command": "build"})
+        self.assertTrue(response["ok"], response.get("error"))
+        self.assertEqual(self.read("public/index.html"),
+                         "Welcome|<div><h1>Welcome</h1></div>")
+
+
+    def test_stuck_client(self):
+        stuck = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(stuck.close)
+        with mock.patch.object(DaemonRequestHandler, "timeout", 0.1):
+            stuck.connect(self.socket_path)
+            response = send_request({"command": "status"}, self.socket_path,
+                                    timeout=5)
+        self.assertTrue(response["ok"])
+
+
+    def test_claim_socket(self):
+        with self.assertRaises(OSError):
+            claim_socket(self.socket_path)
+        # left behind by a daemon that died
+        stale = self.path("stale.sock")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(stale)
+        sock.close()
+        claim_socket(stale)
+        self.assertFalse(os.path.exists(stale))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,9 @@
+import io
+import sys
+import pickle
 import unittest
 
-from htmlnode import HTMLNode, LeafNode, ParentNode
+from htmlnode import HTMLNode, LeafNode, ParentNode, FrozenLeafNode
 
 
 class TestHTMLNode(unittest.TestCase):
@@ -21,6 +24,14 @@ class TestHTMLNode(unittest.TestCase):
         self.assertEqual(node2.props_to_html(), props2)
 
 
+    def test_repr(self):
+        node = HTMLNode("a", "link", None, {"href": "boot.dev"})
+        self.assertEqual(
+            repr(node),
+            "tag: a\nvalue: link\nchildren: None\nprops: {'href': 'boot.dev'}\n"
+        )
+
+
 class TestLeafNode(unittest.TestCase):
     def test_to_html(self):
         node = LeafNode("p", "This is a paragraph of text.")
@@ -31,6 +42,16 @@ class TestLeafNode(unittest.TestCase):
         self.assertEqual(node2.to_html(), node2_html)
 
 
+    def test_frozen(self):
+        node = FrozenLeafNode("b", "bold")
+        self.assertEqual(node.to_html(), "<b>bold</b>")
+        self.assertIsInstance(node, LeafNode)
+        with self.assertRaises(AttributeError):
+            node.tag = "i"
+        copy = pickle.loads(pickle.dumps(node))
+        self.assertEqual(copy.to_html(), "<b>bold</b>")
+
+
 class TestParentNode(unittest.TestCase):
     def test_to_html(self):
         node = ParentNode(
@@ -76,6 +97,42 @@ class TestParentNode(unittest.TestCase):
         self.assertEqual(node3.to_html(), node3_html)
 
 
+    def test_iter_html(self):
+        node = ParentNode(
+            "p",
+            [
+                LeafNode("b", "Bold text"),
+                LeafNode(None, "Normal text"),
+            ],
+            {"class": "intro"},
+        )
+        self.assertEqual(
+            "".join(node.iter_html()),
+            '<p class="intro"><b>Bold text</b>Normal text</p>'
+        )
+        f = io.StringIO()
+        node.write_html(f)
+        self.assertEqual(f.getvalue(), node.to_html())
+
+
+    def test_deep_nesting(self):
+        node = LeafNode("b", "deep")
+        for _ in range(sys.getrecursionlimit() * 2):
+            node = ParentNode("div", [node])
+        html = node.to_html()
+        self.assertTrue(html.startswith("<div><div>"))
+        self.assertIn("<b>deep</b></div></div>", html)
+        chunks = list(node.iter_html())
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("".join(chunks), html)
+
+
+    def test_no_children(self):
+        node = ParentNode("div", [ParentNode("p", [])])
+        with self.assertRaises(ValueError):
+            node.to_html()
+
+
 if __name__ == "__main__":
     unittest.main()
  
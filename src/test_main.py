@@ -0,0 +1,237 @@
+import io
+import os
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from fixtures import TempDirMixin
+from unittest import mock
+from main import (
+    collect_pages, generate_page, generate_pages, generate_pages_recursive,
+    rebuild_changed, update_outputs, watch_and_rebuild
+)
+from blockcache import BlockCache
+from manifest import BuildManifest
+from profiler import Profiler
+from template import Template
+from watch import RESCAN
+
+
+class TestGeneratePages(TempDirMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.content = os.path.join(self.tmp.name, "content")
+        self.public = os.path.join(self.tmp.name, "public")
+        self.template = self.write("template.html", "{{ Title }}|{{ Content }}")
+        self.write("content/index.md", "# Home\n\nWelcome")
+        self.write("content/blog/post.md", "# Post\n\nSome **bold** text")
+
+
+    def test_collect_pages(self):
+        pages = collect_pages(self.content, self.public)
+        self.assertEqual(sorted(pages), [
+            (os.path.join(self.content, "blog", "post.md"),
+             os.path.join(self.public, "blog", "post.html")),
+            (os.path.join(self.content, "index.md"),
+             os.path.join(self.public, "index.html")),
+        ])
+
+
+    def test_generate_pages_parallel(self):
+        pages = collect_pages(self.content, self.public)
+        with redirect_stdout(io.StringIO()):
+            errors = generate_pages(pages, self.template, jobs=2)
+        self.assertEqual(errors, [])
+        self.assertEqual(
+            self.read("public/index.html"),
+            "Home|<div><h1>Home</h1><p>Welcome</p></div>"
+        )
+        self.assertEqual(
+            self.read("public/blog/post.html"),
+            "Post|<div><h1>Post</h1><p>Some <b>bold</b> text</p></div>"
+        )
+
+
+    def test_generate_pages_block_cache(self):
+        self.write("content/blog/other.md", "# Other\n\nSome **bold** text")
+        pages = collect_pages(self.content, self.public)
+        cache = BlockCache()
+        with redirect_stdout(io.StringIO()):
+            errors = generate_pages(pages, self.template, jobs=2, cache=cache)
+        self.assertEqual(errors, [])
+        self.assertIn("Some **bold** text", cache.entries)
+        self.assertEqual(cache.hits + cache.misses, 6)
+        self.assertEqual(
+            self.read("public/blog/other.html"),
+            "Other|<div><h1>Other</h1><p>Some <b>bold</b> text</p></div>"
+        )
+
+
+    def test_generate_pages_collects_errors(self):
+        self.write("content/broken.md", "no title")
+        self.write("content/blog/broken.md", "no title")
+        pages = collect_pages(self.content, self.public)
+        with redirect_stdout(io.StringIO()):
+            errors = generate_pages(pages, self.template, jobs=2)
+        self.assertEqual(
+            sorted(from_path for from_path, _ in errors),
+            [os.path.join(self.content, "blog", "broken.md"),
+             os.path.join(self.content, "broken.md")]
+        )
+        self.assertIn("ValueError", errors[0][1])
+        self.assertTrue(os.path.exists(os.path.join(self.public, "index.html")))
+
+
+    def test_generate_page_content_twice(self):
+        template = self.write("twice.html", "{{ Content }}{{ Content }}")
+        generate_page(os.path.join(self.content, "index.md"), template,
+                      os.path.join(self.public, "index.html"))
+        self.assertEqual(self.read("public/index.html"),
+                         "<div><h1>Home</h1><p>Welcome</p></div>" * 2)
+
+
+    def test_generate_page_profile(self):
+        profiler = Profiler()
+        generate_page(os.path.join(self.content, "blog", "post.md"),
+                      self.template, os.path.join(self.public, "post.html"),
+                      profiler)
+        stages = profiler.summary()
+        self.assertEqual(sorted(stages), ["page", "read", "render", "write"])
+        # the writes of a page add up to one call, within its rendering
+        self.assertEqual(stages["write"]["calls"], 1)
+        self.assertLessEqual(stages["write"]["total_ms"],
+                             stages["render"]["total_ms"])
+        self.assertEqual(
+            self.read("public/post.html"),
+            "Post|<div><h1>Post</h1><p>Some <b>bold</b> text</p></div>"
+        )
+
+
+    def test_generate_page_keeps_error(self):
+        real_open = open
+
+        def failing_open(path, *args, **kwargs):
+            if path.endswith(".tmp"):
+                raise PermissionError(path)
+            return real_open(path, *args, **kwargs)
+
+        # the temporary file was never created, nothing to clean up
+        with mock.patch("main.open", side_effect=failing_open, create=True):
+            with self.assertRaises(PermissionError):
+                generate_page(os.path.join(self.content, "index.md"),
+                              self.template,
+                              os.path.join(self.public, "index.html"))
+
+
+class TestRebuildChanged(TempDirMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.write("template.html", "{{ Content }}")
+        self.write("content/index.md", "# Home")
+        self.write("content/blog/post.md", "# Post")
+        self.write("static/index.css", "body {}")
+        self.manifest = BuildManifest(self.path("manifest.json"))
+        self.manifest.start_build(self.path("template.html"))
+        with redirect_stdout(io.StringIO()):
+            generate_pages_recursive(self.path("content"),
+                                     self.path("template.html"),
+                                     self.path("public"), self.manifest)
+
+
+    def rebuild(self, *names):
+        template = Template.from_file(self.path("template.html"))
+        with redirect_stdout(io.StringIO()) as out:
+            rebuild_changed([self.path(name) for name in names], template,
+                            self.manifest, self.path("content"),
+                            self.path("static"), self.path("public"))
+        return out.getvalue()
+
+
+    def test_page_change(self):
+        self.write("content/index.md", "# Welcome")
+        out = self.rebuild("content/index.md")
+        self.assertEqual(out.count("Generated page"), 1)
+        self.assertEqual(self.read("public/index.html"),
+                         "<div><h1>Welcome</h1></div>")
+
+
+    def test_page_deleted(self):
+        os.remove(self.path("content/blog/post.md"))
+        self.rebuild("content/blog/post.md")
+        self.assertFalse(os.path.exists(self.path("public/blog/post.html")))
+
+
+    def test_template_change(self):
+        self.write("template.html", "<main>{{ Content }}</main>")
+        out = self.rebuild("template.html")
+        self.assertEqual(out.count("Generated page"), 2)
+        self.assertEqual(self.read("public/blog/post.html"),
+                         "<main><div><h1>Post</h1></div></main>")
+
+
+    def test_static_change(self):
+        self.rebuild("static/index.css")
+        self.assertEqual(self.read("public/index.css"), "body {}")
+        os.remove(self.path("static/index.css"))
+        self.rebuild("static/index.css")
+        self.assertFalse(os.path.exists(self.path("public/index.css")))
+
+
+    def test_rescan(self):
+        # changes the watcher lost, found by a whole incremental build
+        self.write("content/index.md", "# Welcome")
+        os.remove(self.path("content/blog/post.md"))
+        self.write("static/new.css", "p {}")
+        template = Template.from_file(self.path("template.html"))
+        with redirect_stdout(io.StringIO()) as out:
+            update_outputs([RESCAN], template, self.manifest,
+                           self.path("content"), self.path("static"),
+                           self.path("public"))
+        self.assertEqual(out.getvalue().count("Generated page"), 1)
+        self.assertEqual(self.read("public/index.html"),
+                         "<div><h1>Welcome</h1></div>")
+        self.assertFalse(os.path.exists(self.path("public/blog/post.html")))
+        self.assertEqual(self.read("public/new.css"), "p {}")
+
+
+    def test_compress(self):
+        self.write("content/index.md", "# Welcome\n\n" + "text " * 100)
+        template = Template.from_file(self.path("template.html"))
+        with redirect_stdout(io.StringIO()):
+            update_outputs([self.path("content/index.md")], template,
+                           self.manifest, self.path("content"),
+                           self.path("static"), self.path("public"),
+                           compress=True)
+        self.assertTrue(os.path.exists(self.path("public/index.html.gz")))
+
+
+    def test_watch_survives_failed_rebuilds(self):
+        test = self
+
+        class FakeWatcher:
+            # deletes the template, then changes a page, then stops
+            calls = 0
+
+            def wait(self):
+                self.calls += 1
+                if self.calls == 1:
+                    os.remove(test.path("template.html"))
+                    return {test.path("template.html")}
+                if self.calls == 2:
+                    test.write("content/index.md", "# Welcome")
+                    return {test.path("content/index.md")}
+                raise KeyboardInterrupt
+
+            def close(self):
+                pass
+
+        with mock.patch("main.make_watcher", return_value=FakeWatcher()), \
+             redirect_stdout(io.StringIO()), \
+             redirect_stderr(io.StringIO()) as err:
+            watch_and_rebuild(self.manifest, self.path("template.html"),
+                              self.path("content"), self.path("static"),
+                              self.path("public"))
+        self.assertIn("FileNotFoundError", err.getvalue())
+        self.assertEqual(self.read("public/index.html"),
+                         "<div><h1>Welcome</h1></div>")
+
+if __name__ == "__main__":
+    unittest.main()
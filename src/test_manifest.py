@@ -0,0 +1,60 @@
+import os
+import unittest
+from fixtures import TempDirMixin
+from manifest import BuildManifest
+
+
+class TestBuildManifest(TempDirMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.dir = self.tmp.name
+        self.manifest_path = os.path.join(self.dir, "manifest.json")
+        self.template = self.write("template.html", "{{ Content }}")
+        self.source = self.write("index.md", "# Title")
+        self.dest = self.write("index.html", "<h1>Title</h1>")
+
+
+    def build(self):
+        manifest = BuildManifest.load(self.manifest_path)
+        manifest.start_build(self.template)
+        built = manifest.needs_build(self.source, self.dest)
+        if built:
+            manifest.record(self.source, self.dest)
+        manifest.save()
+        return built
+
+
+    def test_unchanged_is_skipped(self):
+        self.assertTrue(self.build())
+        self.assertFalse(self.build())
+
+
+    def test_source_change(self):
+        self.build()
+        self.write("index.md", "# Other title")
+        self.assertTrue(self.build())
+
+
+    def test_template_change(self):
+        self.build()
+        self.write("template.html", "<div>{{ Content }}</div>")
+        self.assertTrue(self.build())
+
+
+    def test_missing_output(self):
+        self.build()
+        os.remove(self.dest)
+        self.assertTrue(self.build())
+
+
+    def test_prune(self):
+        self.build()
+        manifest = BuildManifest.load(self.manifest_path)
+        manifest.start_build(self.template)
+        self.assertEqual(manifest.prune(), [self.dest])
+        self.assertFalse(os.path.exists(self.dest))
+        self.assertEqual(manifest.pages, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
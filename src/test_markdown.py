@@ -1,6 +1,9 @@
+import io
+import random
 import unittest
 from textnode import TextNode
 from markdown import *
+from blockcache import BlockCache
 
 
 class SplitNodes(unittest.TestCase):
@@ -276,6 +279,53 @@ class SplitNodes(unittest.TestCase):
             TextNode("link", "link", "https://boot.dev"),
         ]
         self.assertEqual(text_to_textnode(text), results)
+        self.assertEqual(text_to_textnode(text, tokenizer="split"), results)
+
+
+class InlineTokenizers(unittest.TestCase):
+    def assertSameNodes(self, text):
+        try:
+            expected = text_to_textnode_split(text)
+        except ValueError as e:
+            with self.assertRaises(ValueError) as cm:
+                text_to_textnode_scan(text)
+            self.assertEqual(str(cm.exception), str(e))
+            return
+        self.assertEqual(text_to_textnode_scan(text), expected, repr(text))
+
+
+    def test_same_nodes(self):
+        texts = [
+            "",
+            "plain text",
+            "**bold** and *italic* and `code`",
+            "**bold with *star* and `tick`** after",
+            "`code with [link](url) and ![img](src)`",
+            "***mixed*** markers",
+            "a ![image](cat.png)[link](boot.dev)![b](c) z",
+            "[x](![y](z)) and [a](b",
+            "links [one](1)[two](2) then **[bold](link)**",
+            "first line\nsecond [line](x)\n> more",
+        ]
+        for text in texts:
+            self.assertSameNodes(text)
+
+
+    def test_same_errors(self):
+        for text in ["**unclosed", "*unclosed", "`unclosed", "*a`b*`",
+                     "`a*b*`", "**a** *b ` c", "`**`**"]:
+            self.assertSameNodes(text)
+
+
+    def test_same_nodes_random(self):
+        rng = random.Random(0)
+        pieces = ["*", "**", "`", "!", "[", "]", "(", ")", "a", " ", "\n",
+                  "![x](y)", "[l](u)"]
+        for _ in range(5000):
+            text = "".join(
+                rng.choice(pieces) for _ in range(rng.randint(0, 12))
+            )
+            self.assertSameNodes(text)
 
 
 class ExtractMarkdown(unittest.TestCase):
@@ -438,6 +488,121 @@ but this is not
         self.assertEqual(block_to_block_type(block), result)
 
 
+class IterBlocks(unittest.TestCase):
+    def test_iter_blocks(self):
+        lines = [
+            "  # Heading  \n",
+            "\n",
+            "\n",
+            "\n",
+            "> quote\n",
+            ">more\n",
+            "   \n",
+            "\n",
+            "1. one\n",
+            "2. two\n",
+            "\n",
+            "- item\n",
+            "text\n",
+        ]
+        self.assertEqual(list(iter_blocks(lines)), [
+            ("# Heading", "heading"),
+            ("> quote\n>more", "quote"),
+            ("1. one\n2. two", "ordered_list"),
+            ("- item\ntext", "paragraph"),
+        ])
+
+
+    def test_same_as_split_blocks(self):
+        md = "a\n\n\nb  \n \n\n\n\n  c\n- d\n\n\n"
+        self.assertEqual(
+            ["\n".join(lines) for lines in iter_block_lines(md.split("\n"))],
+            [block.strip() for block in md.split("\n\n") if block.strip()]
+        )
+
+
+    def test_markdown_to_html_node_from_file(self):
+        md = "# Title\n\nSome *text*\n\n* a\n* b\n"
+        self.assertEqual(
+            markdown_to_html_node(io.StringIO(md)).to_html(),
+            markdown_to_html_node(md).to_html()
+        )
+
+
+class RenderHtml(unittest.TestCase):
+    def setUp(self):
+        # shared by every markdown of a test, so repeated blocks hit it
+        self.cache = BlockCache(max_entries=64)
+
+
+    def assertSameHtml(self, md):
+        renderers = [
+            render_html,
+            lambda md: render_html(md, cache=self.cache),
+            lambda md: markdown_to_html_node(md, cache=self.cache).to_html(),
+            lambda md: "".join(iter_render_html(md, cache=self.cache)),
+        ]
+        try:
+            expected = markdown_to_html_node(md).to_html()
+        except ValueError as e:
+            for render in renderers:
+                with self.assertRaises(ValueError) as cm:
+                    render(md)
+                self.assertEqual(str(cm.exception), str(e))
+            return
+        for render in renderers:
+            self.assertEqual(render(md), expected, repr(md))
+
+
+    def test_same_html(self):
+        md = """# Tolkien *Fan* Club
+
+Some **bold**, `code`, a [link](/majesty) and ![image](/rivendell.png)
+
+> All that is gold
+> does not glitter
+
+* first
+- second
+
+1. one
+2. two
+
+```
+code block
+```
+
+###### small heading
+"""
+        self.assertSameHtml(md)
+        self.assertEqual(render_html(io.StringIO(md)), render_html(md))
+
+
+    def test_same_errors(self):
+        for md in ["", "> a\n>", "```\n```", "- a\n- ", "text **bold"]:
+            self.assertSameHtml(md)
+
+
+    def test_same_html_random(self):
+        rng = random.Random(0)
+        pieces = ["\n", "\n\n", " ", "a", "> ", "- ", "* ", "1. ", "2. ",
+                  "# ", "### ", "```", "**", "*", "`", "[l](u)", "![i](s)"]
+        for _ in range(2000):
+            md = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 16)))
+            self.assertSameHtml(md)
+        self.assertGreater(self.cache.hits, 0)
+
+
+    def test_iter_render_html_chunks(self):
+        md = "\n\n".join(f"Paragraph *{i}*" for i in range(1000))
+        chunks = iter_render_html(md)
+        first = next(chunks)
+        self.assertTrue(first.startswith("<div><p>Paragraph <i>0</i></p>"))
+        # the blocks after the first chunk were not rendered yet
+        self.assertNotIn("999", first)
+        self.assertEqual(first + "".join(chunks), render_html(md))
+
+
 class ExtractTitle(unittest.TestCase):
     def test_extract_title(self):
         md = """
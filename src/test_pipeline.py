@@ -0,0 +1,207 @@
+import io
+import os
+import threading
+import tracemalloc
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+from blockcache import BlockCache
+from fixtures import TempDirMixin
+from main import collect_pages, generate_pages
+from pipeline import MemoryBudget, StreamingPipeline
+
+
+class TestMemoryBudget(unittest.TestCase):
+    def test_reserve_waits_for_release(self):
+        budget = MemoryBudget(10)
+        budget.reserve(8)
+        reserved = threading.Event()
+
+        def reserve():
+            budget.reserve(5)
+            reserved.set()
+
+        thread = threading.Thread(target=reserve)
+        thread.start()
+        self.assertFalse(reserved.wait(0.05))
+        budget.release(8)
+        self.assertTrue(reserved.wait(5))
+        thread.join()
+        self.assertEqual(budget.used, 5)
+        self.assertEqual(budget.peak, 8)
+
+
+    def test_oversized_reservation(self):
+        budget = MemoryBudget(10)
+        # alone in the pipeline, or it could never go through
+        budget.reserve(25)
+        budget.grow(5)
+        self.assertEqual(budget.used, 30)
+
+
+class TestStreamingPipeline(TempDirMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.content = os.path.join(self.tmp.name, "content")
+        self.template = self.write(
+            "template.html", "<title>{{ Title }}</title>{{ Content }}<hr>"
+        )
+        self.write("content/index.md", "# Home\n\nWelcome")
+        self.write("content/blog/post.md",
+                   "# Post\n\n- one\n- *two*\n\n```\ncode\n```\n\n> quote")
+        self.write("content/big.md", "# Big\n\n" + "\n\n".join(
+            f"## Part {i}\n\nSome **bold** text {i}\n\n1. first\n2. second"
+            for i in range(500)
+        ))
+
+
+    def read_outputs(self, dest_dir):
+        outputs = {}
+        for dir_path, _, file_names in os.walk(dest_dir):
+            for name in file_names:
+                path = os.path.join(dir_path, name)
+                with open(path, 'r') as f:
+                    outputs[os.path.relpath(path, dest_dir)] = f.read()
+        return outputs
+
+
+    def build(self, dest_name, streaming, **kwargs):
+        dest_dir = os.path.join(self.tmp.name, dest_name)
+        pages = sorted(collect_pages(self.content, dest_dir))
+        with redirect_stdout(io.StringIO()):
+            if streaming:
+                pipeline = StreamingPipeline(self.template, **kwargs)
+                errors = pipeline.run(pages)
+            else:
+                errors = generate_pages(pages, self.template)
+        return errors, self.read_outputs(dest_dir)
+
+
+    def test_same_output_as_generate_pages(self):
+        _, expected = self.build("expected", False)
+        for chunk_size in [None, 1, 200]:
+            errors, outputs = self.build(f"stream{chunk_size}", True,
+                                         chunk_size=chunk_size,
+                                         memory_budget=1000)
+            self.assertEqual(errors, [])
+            self.assertEqual(outputs, expected)
+
+
+    def test_block_cache(self):
+        _, expected = self.build("expected", False)
+        cache = BlockCache()
+        errors, outputs = self.build("stream", True, chunk_size=100,
+                                     cache=cache)
+        self.assertEqual(outputs, expected)
+        self.assertGreater(cache.hits, 0)
+
+
+    def test_failed_pages(self):
+        self.write("content/untitled.md", "No title")
+        # an empty paragraph only fails once the page is rendered
+        self.write("content/empty.md", "# Empty\n\n" + "text\n\n" * 50 + "****")
+        errors, outputs = self.build("stream", True, chunk_size=20)
+        self.assertEqual(
+            sorted(os.path.basename(path) for path, _ in errors),
+            ["empty.md", "untitled.md"]
+        )
+        self.assertIn("ValueError", errors[0][1])
+        self.assertEqual(sorted(outputs),
+                         ["big.html", "blog/post.html", "index.html"])
+
+
+    def test_bounded_memory(self):
+        paragraph = "Some *text* about nothing in particular. " * 20
+        self.write("content/huge.md", "# Huge\n\n" + "\n\n".join(
+            f"## {i}\n\n{paragraph}" for i in range(2000)
+        ))
+        size = os.path.getsize(os.path.join(self.content, "huge.md"))
+        pipeline = StreamingPipeline(self.template, memory_budget=64 * 1024)
+        dest_dir = os.path.join(self.tmp.name, "stream")
+        pages = [(os.path.join(self.content, "huge.md"),
+                  os.path.join(dest_dir, "huge.html"))]
+        tracemalloc.start()
+        try:
+            with redirect_stdout(io.StringIO()):
+                errors = pipeline.run(pages)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(errors, [])
+        # the page, let alone its html, never was in memory at once
+        self.assertLess(peak, size / 4)
+        self.assertLess(pipeline.budget.peak, 2 * 64 * 1024)
+        self.assertEqual(pipeline.budget.used, 0)
+
+
+    def test_budget_counts_objects(self):
+        # a short line takes several times its length in memory
+        self.write("content/list.md", "# List\n\n" + "\n\n".join(
+            "".join(f"- item {i}\n" for i in range(50)) for _ in range(1000)
+        ))
+        pipeline = StreamingPipeline(self.template, memory_budget=256 * 1024)
+        pages = [(os.path.join(self.content, "list.md"),
+                  os.path.join(self.tmp.name, "stream", "list.html"))]
+        tracemalloc.start()
+        try:
+            with redirect_stdout(io.StringIO()):
+                errors = pipeline.run(pages)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(errors, [])
+        self.assertLess(peak, 2 * 256 * 1024)
+        self.assertLess(pipeline.budget.peak, 2 * 256 * 1024)
+
+
+    def run_failing(self, pipeline, target, side_effect):
+        # fails the test instead of hanging it if the pipeline deadlocks
+        pages = sorted(collect_pages(self.content, self.path("stream")))
+        result = {}
+
+        def run():
+            try:
+                with mock.patch(target, side_effect=side_effect, create=True), \
+                     redirect_stdout(io.StringIO()):
+                    pipeline.run(pages)
+            except BaseException as e:
+                result["error"] = e
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive(), "the pipeline hangs")
+        return result.get("error")
+
+
+    def test_writer_failure(self):
+        # like a closed stdout under python src/main.py --stream | head -1
+        pipeline = StreamingPipeline(self.template, memory_budget=100,
+                                     chunk_size=10)
+        error = self.run_failing(pipeline, "pipeline.print", BrokenPipeError)
+        self.assertIsInstance(error, BrokenPipeError)
+        leftovers = [name for _, _, names in os.walk(self.path("stream"))
+                     for name in names if name.endswith(".tmp")]
+        self.assertEqual(leftovers, [])
+        # the next run starts over
+        pages = sorted(collect_pages(self.content, self.path("stream")))
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(pipeline.run(pages), [])
+        self.assertEqual(len(self.read_outputs(self.path("stream"))), 3)
+
+
+    def test_renderer_failure(self):
+        pipeline = StreamingPipeline(self.template, memory_budget=100,
+                                     chunk_size=10)
+        error = self.run_failing(pipeline, "markdown.render_block_html",
+                                 KeyboardInterrupt)
+        self.assertIsInstance(error, KeyboardInterrupt)
+
+
+    def test_template_without_content_slot(self):
+        with self.assertRaises(ValueError):
+            StreamingPipeline(self.write("other.html", "{{ Title }}"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import json
+import os
+import tempfile
+import unittest
+import markdown
+from profiler import Profiler
+
+
+class TestProfiler(unittest.TestCase):
+    def test_stages_per_page(self):
+        profiler = Profiler()
+        for page in ["a.md", "b.md"]:
+            profiler.page = page
+            with profiler.stage("page"):
+                with profiler.stage("read"):
+                    pass
+        self.assertEqual(profiler.summary()["read"]["calls"], 2)
+        self.assertEqual(sorted(profiler.pages), ["a.md", "b.md"])
+        self.assertEqual(len(profiler.events), 4)
+        self.assertEqual(
+            sorted(page for page, _ in profiler.slowest_pages(5)),
+            ["a.md", "b.md"]
+        )
+
+
+    def test_instrument_restores_functions(self):
+        profiler = Profiler()
+        original = markdown.scan_inline
+        with profiler.instrument(markdown):
+            self.assertIsNot(markdown.scan_inline, original)
+            markdown.render_html("# Title\n\nSome *text*")
+        self.assertIs(markdown.scan_inline, original)
+        summary = profiler.summary()
+        self.assertEqual(summary["inline"]["calls"], 2)
+        self.assertEqual(summary["block_to_block_type"]["calls"], 2)
+        self.assertEqual(summary["markdown_to_blocks"]["calls"], 1)
+
+
+    def test_merge(self):
+        worker = Profiler()
+        worker.page = "a.md"
+        with worker.stage("page"):
+            pass
+        profiler = Profiler()
+        profiler.merge(worker.export_state())
+        profiler.merge({"events": [], "pages": {"a.md": {"page": [5, 1]}}})
+        self.assertEqual(profiler.pages["a.md"]["page"][1], 2)
+        self.assertEqual(len(profiler.events), 1)
+        self.assertEqual(worker.pages, {})
+
+
+    def test_exports(self):
+        profiler = Profiler()
+        profiler.page = "a.md"
+        with profiler.stage("write"):
+            pass
+        with tempfile.TemporaryDirectory() as tmp:
+            profiler.write_json(os.path.join(tmp, "profile.json"))
+            profiler.write_chrome_trace(os.path.join(tmp, "trace.json"))
+            with open(os.path.join(tmp, "profile.json")) as f:
+                data = json.load(f)
+            with open(os.path.join(tmp, "trace.json")) as f:
+                trace = json.load(f)
+        self.assertEqual(data["pages"]["a.md"]["write"]["calls"], 1)
+        self.assertEqual(trace["traceEvents"][0]["name"], "write")
+        self.assertEqual(trace["traceEvents"][0]["ph"], "X")
+
+
+if __name__ == "__main__":
+    unittest.main()
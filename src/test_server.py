@@ -0,0 +1,508 @@
+import errno
+import gzip
+import json
+import os
+import sys
+import socket
+import tempfile
+import threading
+import time
+import unittest
+import http.client
+from http.server import SimpleHTTPRequestHandler
+from unittest import mock
+from fixtures import TempDirMixin
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from server import (  # noqa: E402
+    FDCache, FileCache, Metrics, PageRenderer, accepted_encodings,
+    make_server, path_class
+)
+
+
+class ServerTestCase(TempDirMixin, unittest.TestCase):
+    production = True
+
+    def setUp(self):
+        super().setUp()
+        self.write("index.html", "<h1>Home</h1>")
+        self.write("blog/post.html", "<p>Post</p>")
+        self.server = self.make_server()
+        # the access log would clutter the test output
+        patcher = mock.patch.object(SimpleHTTPRequestHandler, "log_message")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+
+    def make_server(self):
+        return make_server(0, self.tmp.name, production=self.production,
+                           threads=4)
+
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+    def connect(self):
+        conn = http.client.HTTPConnection("localhost", self.port, timeout=5)
+        self.addCleanup(conn.close)
+        return conn
+
+
+    def get(self, conn, path, headers={}):
+        conn.request("GET", path, headers=headers)
+        response = conn.getresponse()
+        return response, response.read()
+
+
+class TestProductionServer(ServerTestCase):
+    def test_keep_alive(self):
+        conn = self.connect()
+        response, body = self.get(conn, "/index.html")
+        self.assertEqual(response.status, 200)
+        self.assertEqual(body, b"<h1>Home</h1>")
+        sock = conn.sock
+        response, body = self.get(conn, "/blog/post.html")
+        self.assertEqual(body, b"<p>Post</p>")
+        self.assertIs(conn.sock, sock)
+        response, body = self.get(conn, "/blog/post.html/")
+        self.assertEqual(response.status, 404)
+        response, body = self.get(conn, "/")
+        self.assertEqual(body, b"<h1>Home</h1>")
+
+
+    def test_cache_invalidated_by_mtime(self):
+        conn = self.connect()
+        self.get(conn, "/index.html")
+        self.get(conn, "/index.html")
+        self.assertEqual(self.server.file_cache.hits, 1)
+        path = self.write("index.html", "<h1>Changed home</h1>")
+        os.utime(path, ns=(0, 10**9))
+        response, body = self.get(conn, "/index.html")
+        self.assertEqual(body, b"<h1>Changed home</h1>")
+
+
+    def test_not_modified(self):
+        conn = self.connect()
+        response, _ = self.get(conn, "/index.html")
+        response, body = self.get(conn, "/index.html", {
+            "If-Modified-Since": response.getheader("Last-Modified")
+        })
+        self.assertEqual(response.status, 304)
+        self.assertEqual(body, b"")
+
+
+    def test_slow_client_does_not_block(self):
+        slow = socket.create_connection(("localhost", self.port))
+        self.addCleanup(slow.close)
+        response, body = self.get(self.connect(), "/blog/post.html")
+        self.assertEqual(body, b"<p>Post</p>")
+
+
+    def test_idle_connections_do_not_hold_threads(self):
+        # twice as many idle keep-alive connections as threads, new ones
+        # and ones that already made a request
+        for i in range(8):
+            if i % 2:
+                self.get(self.connect(), "/index.html")
+            else:
+                idle = socket.create_connection(("localhost", self.port))
+                self.addCleanup(idle.close)
+        start = time.monotonic()
+        response, body = self.get(self.connect(), "/blog/post.html")
+        self.assertEqual(body, b"<p>Post</p>")
+        self.assertLess(time.monotonic() - start, 1)
+
+
+    def test_pipelined_requests(self):
+        sock = socket.create_connection(("localhost", self.port), timeout=5)
+        self.addCleanup(sock.close)
+        sock.sendall(b"GET /index.html HTTP/1.1\r\nHost: a\r\n\r\n"
+                     b"GET /blog/post.html HTTP/1.1\r\nHost: a\r\n\r\n")
+        data = b""
+        while not data.endswith(b"<p>Post</p>"):
+            chunk = sock.recv(4096)
+            self.assertTrue(chunk)
+            data += chunk
+        self.assertEqual(data.count(b"HTTP/1.1 200"), 2)
+
+
+    def test_idle_connections_closed(self):
+        self.server.keep_alive_timeout = 0.1
+        conn = self.connect()
+        self.get(conn, "/index.html")
+        conn.sock.settimeout(5)
+        self.assertEqual(conn.sock.recv(1), b"")
+
+
+class TestConditionalRequests(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write("images/big.bin", "0123456789" * 200000)
+
+
+    def test_etag(self):
+        conn = self.connect()
+        response, _ = self.get(conn, "/index.html")
+        etag = response.getheader("ETag")
+        self.assertEqual(response.getheader("Cache-Control"), "no-cache")
+        response, body = self.get(conn, "/index.html",
+                                  {"If-None-Match": f'"other", W/{etag}'})
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.getheader("ETag"), etag)
+        self.write("index.html", "<h1>New home</h1>")
+        os.utime(os.path.join(self.tmp.name, "index.html"), ns=(0, 10**9))
+        response, body = self.get(conn, "/index.html", {"If-None-Match": etag})
+        self.assertEqual(response.status, 200)
+        self.assertNotEqual(response.getheader("ETag"), etag)
+        response, body = self.get(conn, "/")
+        self.assertEqual(body, b"<h1>New home</h1>")
+        self.assertEqual(response.getheader("Cache-Control"), "no-cache")
+
+
+    def test_range(self):
+        conn = self.connect()
+        response, body = self.get(conn, "/images/big.bin",
+                                  {"Range": "bytes=5-14"})
+        self.assertEqual(response.status, 206)
+        self.assertEqual(body, b"5678901234")
+        self.assertEqual(response.getheader("Content-Range"),
+                         "bytes 5-14/2000000")
+        self.assertEqual(response.getheader("Cache-Control"),
+                         "public, max-age=86400")
+        etag = response.getheader("ETag")
+        response, body = self.get(conn, "/images/big.bin",
+                                  {"Range": "bytes=-3", "If-Range": etag})
+        self.assertEqual(body, b"789")
+        response, body = self.get(conn, "/index.html",
+                                  {"Range": "bytes=4-"})
+        self.assertEqual(body, b"Home</h1>")
+        response, body = self.get(conn, "/images/big.bin",
+                                  {"Range": "bytes=0-1", "If-Range": '"old"'})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(len(body), 2000000)
+        response, body = self.get(conn, "/index.html",
+                                  {"Range": "bytes=100-"})
+        self.assertEqual(response.status, 416)
+        self.assertEqual(response.getheader("Content-Range"), "bytes */13")
+        # the connection is still usable after all of these
+        response, body = self.get(conn, "/blog/post.html")
+        self.assertEqual(body, b"<p>Post</p>")
+
+
+class TestSendfile(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.data = os.urandom(3 * 1024 * 1024)
+        with open(os.path.join(self.tmp.name, "video.bin"), 'wb') as f:
+            f.write(self.data)
+
+
+    def test_sendfile(self):
+        conn = self.connect()
+        for _ in range(2):
+            response, body = self.get(conn, "/video.bin")
+            self.assertEqual(body, self.data)
+        self.assertEqual(self.server.fd_cache.hits, 1)
+        response, body = self.get(conn, "/video.bin",
+                                  {"Range": "bytes=1000000-1000009"})
+        self.assertEqual(body, self.data[1000000:1000010])
+
+
+    def test_fallback_copy(self):
+        unsupported = OSError(errno.EINVAL, "sendfile not supported")
+        with mock.patch("os.sendfile", side_effect=unsupported):
+            response, body = self.get(self.connect(), "/video.bin",
+                                      {"Range": "bytes=5-"})
+        self.assertEqual(body, self.data[5:])
+
+
+class TestFDCache(unittest.TestCase):
+    def test_reuse_and_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for name in "ab":
+                paths.append(os.path.join(tmp, name))
+                with open(paths[-1], 'wb') as f:
+                    f.write(b"data")
+            cache = FDCache(max_open=1)
+            first = cache.acquire(paths[0])
+            first.close()
+            self.assertIs(cache.acquire(paths[0]), first)
+            # evicted while in use, so closed only once released
+            second = cache.acquire(paths[1])
+            self.assertEqual(os.pread(first.fd, 4, 0), b"data")
+            first.close()
+            with self.assertRaises(OSError):
+                os.fstat(first.fd)
+            second.close()
+            with open(paths[1], 'ab') as f:
+                f.write(b"more")
+            self.assertIsNot(cache.acquire(paths[1]), second)
+            self.assertIsNone(cache.acquire(tmp))
+            cache.close()
+
+
+class TestPrecompressed(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        path = os.path.join(self.tmp.name, "index.html")
+        with open(path + ".gz", 'wb') as f:
+            f.write(gzip.compress(b"<h1>Home</h1>"))
+        st = os.stat(path)
+        os.utime(path + ".gz", ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+    def test_negotiation(self):
+        conn = self.connect()
+        response, body = self.get(conn, "/", {"Accept-Encoding": "gzip, br"})
+        self.assertEqual(response.getheader("Content-Encoding"), "gzip")
+        self.assertEqual(response.getheader("Content-type"), "text/html")
+        self.assertEqual(response.getheader("Vary"), "Accept-Encoding")
+        self.assertEqual(gzip.decompress(body), b"<h1>Home</h1>")
+        gzip_etag = response.getheader("ETag")
+        response, body = self.get(conn, "/",
+                                  {"Accept-Encoding": "gzip;q=0, br"})
+        self.assertIsNone(response.getheader("Content-Encoding"))
+        self.assertEqual(response.getheader("Vary"), "Accept-Encoding")
+        self.assertEqual(body, b"<h1>Home</h1>")
+        self.assertNotEqual(response.getheader("ETag"), gzip_etag)
+        response, body = self.get(conn, "/blog/post.html",
+                                  {"Accept-Encoding": "gzip"})
+        self.assertIsNone(response.getheader("Vary"))
+
+
+    def test_stale_copy_ignored(self):
+        path = self.write("index.html", "<h1>New home</h1>")
+        os.utime(path, ns=(0, 10**9))
+        response, body = self.get(self.connect(), "/index.html",
+                                  {"Accept-Encoding": "gzip"})
+        self.assertIsNone(response.getheader("Content-Encoding"))
+        self.assertEqual(body, b"<h1>New home</h1>")
+
+
+    def test_accepted_encodings(self):
+        self.assertEqual(accepted_encodings("gzip, deflate;q=0.5, br;q=0"),
+                         {"gzip", "deflate"})
+        self.assertEqual(accepted_encodings("*, gzip;q=0"), {"*", "br", "zstd"})
+        self.assertEqual(accepted_encodings(""), set())
+
+
+class TestMetrics(ServerTestCase):
+    def test_metrics_endpoint(self):
+        conn = self.connect()
+        self.get(conn, "/index.html")
+        self.get(conn, "/index.html")
+        # a 404 closes the connection, which the server only does once the
+        # request is counted, but http.client wouldn't wait for it
+        missing = socket.create_connection(("localhost", self.port), timeout=5)
+        self.addCleanup(missing.close)
+        missing.sendall(b"GET /missing.css HTTP/1.1\r\nHost: a\r\n\r\n")
+        while missing.recv(4096):
+            pass
+        response, body = self.get(conn, "/__metrics")
+        self.assertEqual(response.status, 200)
+        self.assertTrue(response.getheader("Content-type").startswith(
+            "text/plain; version=0.0.4"
+        ))
+        lines = body.decode().splitlines()
+        self.assertIn(
+            'ssg_http_requests_total{status="200",path_class="page"} 2', lines
+        )
+        self.assertIn(
+            'ssg_http_requests_total{status="404",path_class="asset"} 1', lines
+        )
+        self.assertIn(
+            'ssg_http_response_bytes_total{path_class="page"} 26', lines
+        )
+        self.assertIn('ssg_http_request_duration_seconds_count'
+                      '{path_class="page"} 2', lines)
+        # the metrics request itself
+        self.assertIn("ssg_http_requests_in_flight 1", lines)
+        self.assertIn("ssg_file_cache_hits_total 1", lines)
+
+
+    def test_histogram(self):
+        metrics = Metrics()
+        for duration in [0.0001, 0.003, 0.003, 60]:
+            metrics.request_started()
+            metrics.request_finished("200", "page", 10, duration)
+        lines = metrics.render().splitlines()
+        self.assertIn('ssg_http_request_duration_seconds_bucket'
+                      '{path_class="page",le="0.0005"} 1', lines)
+        self.assertIn('ssg_http_request_duration_seconds_bucket'
+                      '{path_class="page",le="0.005"} 3', lines)
+        self.assertIn('ssg_http_request_duration_seconds_bucket'
+                      '{path_class="page",le="10.0"} 3', lines)
+        self.assertIn('ssg_http_request_duration_seconds_bucket'
+                      '{path_class="page",le="+Inf"} 4', lines)
+        self.assertIn("ssg_http_requests_in_flight 0", lines)
+
+
+    def test_path_class(self):
+        self.assertEqual(path_class("/blog/"), "page")
+        self.assertEqual(path_class("/images/rivendell.PNG"), "image")
+        self.assertEqual(path_class("/index.css"), "asset")
+        self.assertEqual(path_class("/archive.zip"), "other")
+
+
+class TestAccessLog(ServerTestCase):
+    def setUp(self):
+        self.log_path = os.path.join(tempfile.gettempdir(),
+                                     f"access-{os.getpid()}.log")
+        self.addCleanup(os.remove, self.log_path)
+        super().setUp()
+
+
+    def make_server(self):
+        return make_server(0, self.tmp.name, production=True, threads=4,
+                           access_log=self.log_path)
+
+
+    def test_access_log(self):
+        conn = self.connect()
+        self.get(conn, "/blog/post.html", {"User-Agent": "test-agent"})
+        conn.close()
+        # the record is written once the response is sent
+        self.server.executor.shutdown(wait=True)
+        with open(self.log_path, 'r') as f:
+            record = json.loads(f.readline())
+        self.assertEqual(record["path"], "/blog/post.html")
+        self.assertEqual(record["status"], 200)
+        self.assertEqual(record["bytes"], 11)
+        self.assertEqual(record["user_agent"], "test-agent")
+
+
+class TestOnDemand(ServerTestCase):
+    def make_server(self):
+        self.write("content/index.md", "# Home\n\nWelcome")
+        self.write("content/blog/index.md", "# Blog\n\nPosts")
+        self.write("content/blog/post.md", "# Post\n\nSome **bold** text")
+        self.write("static/index.css", "p {}")
+        self.template = self.write("template.html", "{{ Title }}|{{ Content }}")
+        return make_server(0, os.path.join(self.tmp.name, "static"),
+                           on_demand=True,
+                           content_dir=os.path.join(self.tmp.name, "content"),
+                           template_path=self.template)
+
+
+    def test_render_on_demand(self):
+        conn = self.connect()
+        response, body = self.get(conn, "/")
+        self.assertEqual(body, b"Home|<div><h1>Home</h1><p>Welcome</p></div>")
+        response, body = self.get(conn, "/blog/post.html")
+        self.assertEqual(
+            body, b"Post|<div><h1>Post</h1><p>Some <b>bold</b> text</p></div>"
+        )
+        response, body = self.get(conn, "/index.css")
+        self.assertEqual(body, b"p {}")
+        response, body = self.get(conn, "/blog")
+        self.assertEqual(response.status, 301)
+        self.assertEqual(response.getheader("Location"), "/blog/")
+        response, body = self.get(conn, "/missing.html")
+        self.assertEqual(response.status, 404)
+
+
+    def test_invalidation(self):
+        conn = self.connect()
+        self.get(conn, "/blog/post.html")
+        path = self.write("content/blog/post.md", "# Post\n\nEdited")
+        os.utime(path, ns=(0, 10**9))
+        response, body = self.get(conn, "/blog/post.html")
+        self.assertEqual(body, b"Post|<div><h1>Post</h1><p>Edited</p></div>")
+        self.write("template.html", "<title>{{ Title }}</title>")
+        os.utime(self.template, ns=(0, 10**9))
+        response, body = self.get(conn, "/blog/post.html")
+        self.assertEqual(body, b"<title>Post</title>")
+        self.write("content/new.md", "# New\n\nPage")
+        response, body = self.get(conn, "/new.html")
+        self.assertEqual(body, b"<title>New</title>")
+
+
+    def test_static_requests_do_not_scan(self):
+        renderer = self.server.renderer
+        conn = self.connect()
+        self.get(conn, "/")
+        with mock.patch.object(renderer, "scan", wraps=renderer.scan) as scan:
+            for _ in range(5):
+                response, body = self.get(conn, "/index.css")
+                self.assertEqual(body, b"p {}")
+                response, body = self.get(conn, "/missing.html")
+                self.assertEqual(response.status, 404)
+                response, body = self.get(conn, "/missing")
+                self.assertEqual(response.status, 404)
+            self.assertEqual(scan.call_count, 0)
+            # until a page is added
+            self.write("content/blog/new.md", "# New\n\nPage")
+            response, body = self.get(conn, "/blog/new.html")
+            self.assertEqual(body, b"New|<div><h1>New</h1><p>Page</p></div>")
+            self.get(conn, "/missing.html")
+            self.assertEqual(scan.call_count, 1)
+
+
+    def test_ast_cache(self):
+        renderer = PageRenderer(self.path("content"), self.template,
+                                ast_cache_dir=self.path("ast"))
+        html = b"Post|<div><h1>Post</h1><p>Some <b>bold</b> text</p></div>"
+        self.assertEqual(renderer.render("/blog/post.html"), html)
+        self.assertEqual((renderer.ast_cache.hits,
+                          renderer.ast_cache.misses), (0, 1))
+        # the template changed, the page is not parsed again
+        self.write("template.html", "<title>{{ Title }}</title>{{ Content }}")
+        os.utime(self.template, ns=(0, 10**9))
+        self.assertEqual(renderer.render("/blog/post.html"),
+                         b"<title>Post</title>" + html[5:])
+        self.assertEqual((renderer.ast_cache.hits,
+                          renderer.ast_cache.misses), (1, 1))
+        # nor after a restart
+        renderer = PageRenderer(self.path("content"), self.template,
+                                ast_cache_dir=self.path("ast"))
+        renderer.render("/blog/post.html")
+        self.assertEqual((renderer.ast_cache.hits,
+                          renderer.ast_cache.misses), (1, 0))
+
+
+    def test_build_error(self):
+        self.write("content/broken.md", "no title")
+        response, body = self.get(self.connect(), "/broken.html")
+        self.assertEqual(response.status, 500)
+        self.assertIn(b"ValueError", body)
+
+
+class TestDevelopmentServer(ServerTestCase):
+    production = False
+
+    def test_get(self):
+        response, body = self.get(self.connect(), "/blog/post.html")
+        self.assertEqual(body, b"<p>Post</p>")
+
+
+class TestFileCache(unittest.TestCase):
+    def test_size_bound(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for name in "abc":
+                paths.append(os.path.join(tmp, name))
+                with open(paths[-1], 'wb') as f:
+                    f.write(b"x" * 10)
+            cache = FileCache(max_size=25, max_file_size=10)
+            for path in paths:
+                self.assertEqual(cache.get(path).data, b"x" * 10)
+            self.assertEqual(list(cache.entries), paths[1:])
+            self.assertEqual(cache.size, 20)
+            with open(paths[0], 'ab') as f:
+                f.write(b"x")
+            self.assertIsNone(cache.get(paths[0]))
+            self.assertIsNone(cache.get(tmp))
+
+
+if __name__ == "__main__":
+    unittest.main()
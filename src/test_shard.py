@@ -0,0 +1,145 @@
+import io
+import os
+import filecmp
+import unittest
+from contextlib import redirect_stdout
+from fixtures import TempDirMixin
+from main import collect_pages, generate_pages_recursive
+from manifest import BuildManifest
+from shard import (Shard, merge_shards, parse_shard, plan_shards,
+                   shard_manifest_path, shard_output_dir)
+
+
+class TestShardSelection(unittest.TestCase):
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("2/4"), (2, 4))
+        self.assertEqual(parse_shard("1/1"), (1, 1))
+        for text in ["0/4", "5/4", "2", "a/b", "1/0", "2/4/1"]:
+            with self.assertRaises(ValueError):
+                parse_shard(text)
+
+
+    def test_split_covers_every_page_once(self):
+        pages = [(os.path.join("content", f"p{i}.md"),
+                  os.path.join("public", f"p{i}.html")) for i in range(100)]
+        selected = [Shard(i, 3).select(pages, "content") for i in (1, 2, 3)]
+        self.assertEqual(sorted(sum(selected, [])), sorted(pages))
+        self.assertTrue(all(selected))
+        # the same split on every run and for any order of the pages
+        self.assertEqual(Shard(2, 3).select(list(reversed(pages)), "content"),
+                         list(reversed(selected[1])))
+
+
+    def test_plan_balances_times(self):
+        timings = {"slow.md": 90.0, "a.md": 30.0, "b.md": 30.0, "c.md": 30.0}
+        plan = plan_shards(sorted(timings) + ["new.md"], 2, timings)
+        loads = [0.0, 0.0]
+        for path, shard in plan.items():
+            # a page without timing counts as the average of the others
+            loads[shard] += timings.get(path, 45.0)
+        self.assertEqual(sorted(loads), [105.0, 120.0])
+        self.assertEqual(plan["slow.md"], 0)
+
+
+class TestMergeShards(TempDirMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.content = os.path.join(self.tmp.name, "content")
+        self.public = os.path.join(self.tmp.name, "public")
+        self.manifest_path = os.path.join(self.tmp.name, "manifest.json")
+        self.template = self.write("template.html", "{{ Title }}|{{ Content }}")
+        for i in range(6):
+            self.write(f"content/blog/post{i}.md", f"# Post {i}\n\nText {i}")
+        self.write("content/index.md", "# Home\n\nWelcome")
+
+
+    def build(self, dest_dir_path, manifest_path, shard=None):
+        manifest = BuildManifest.load(manifest_path)
+        manifest.start_build(self.template)
+        os.makedirs(dest_dir_path, exist_ok=True)
+        with redirect_stdout(io.StringIO()):
+            errors = generate_pages_recursive(self.content, self.template,
+                                              dest_dir_path, manifest,
+                                              shard=shard)
+            manifest.prune()
+        manifest.save()
+        self.assertEqual(errors, [])
+
+
+    def build_shards(self, count):
+        for index in range(1, count + 1):
+            self.build(shard_output_dir(self.public, index, count),
+                       shard_manifest_path(index, count, self.manifest_path),
+                       Shard(index, count))
+
+
+    def merge(self, count):
+        with redirect_stdout(io.StringIO()):
+            return merge_shards(count, self.public,
+                                collect_pages(self.content, self.public),
+                                self.manifest_path)
+
+
+    def assertNothingMerged(self):
+        self.assertFalse(os.path.exists(self.public))
+        self.assertFalse(os.path.exists(self.manifest_path))
+
+
+    def test_merge_matches_full_build(self):
+        full = os.path.join(self.tmp.name, "full")
+        self.build(full, os.path.join(self.tmp.name, "full.json"))
+        self.build_shards(3)
+        self.assertEqual(self.merge(3), [])
+        comparison = filecmp.dircmp(self.public, full)
+        self.assertEqual(comparison.left_only + comparison.right_only, [])
+        self.assertEqual(comparison.subdirs["blog"].diff_files, [])
+        self.assertEqual(comparison.diff_files, [])
+
+        # the merged manifest lets a plain build skip every page
+        manifest = BuildManifest.load(self.manifest_path)
+        manifest.start_build(self.template)
+        pages = collect_pages(self.content, self.public)
+        self.assertFalse(any(manifest.needs_build(*page) for page in pages))
+
+
+    def test_missing_shard(self):
+        self.build_shards(2)
+        os.remove(shard_manifest_path(2, 2, self.manifest_path))
+        problems = self.merge(2)
+        self.assertEqual(len(problems), 1)
+        self.assertIn("shard 2/2", problems[0])
+        self.assertNothingMerged()
+
+
+    def test_differing_duplicate(self):
+        self.build_shards(2)
+        for index in (1, 2):
+            self.write(f"public.shard-{index}-of-2/extra.txt", str(index))
+        problems = self.merge(2)
+        self.assertEqual(len(problems), 1)
+        self.assertIn("extra.txt differs", problems[0])
+        self.assertNothingMerged()
+
+
+    def test_page_not_built(self):
+        self.build_shards(2)
+        self.write("content/late.md", "# Late")
+        problems = self.merge(2)
+        self.assertEqual(problems,
+                         [f"no shard built {os.path.join(self.content, 'late.md')}"])
+        self.assertNothingMerged()
+
+
+    def test_other_template(self):
+        self.build(shard_output_dir(self.public, 1, 2),
+                   shard_manifest_path(1, 2, self.manifest_path), Shard(1, 2))
+        self.write("template.html", "<title>{{ Title }}</title>{{ Content }}")
+        self.build(shard_output_dir(self.public, 2, 2),
+                   shard_manifest_path(2, 2, self.manifest_path), Shard(2, 2))
+        problems = self.merge(2)
+        self.assertEqual(problems, ["shard 2/2 was built with another "
+                                    "template or generator version"])
+        self.assertNothingMerged()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import io
+import os
+import unittest
+from contextlib import redirect_stdout
+from fixtures import TempDirMixin
+from sync import files_differ, sync_static
+
+
+class TestSyncStatic(TempDirMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.static = os.path.join(self.tmp.name, "static")
+        self.public = os.path.join(self.tmp.name, "public")
+        self.write("static/index.css", "body {}")
+        self.write("static/images/cat.png", "not really a png")
+
+
+    def sync(self, previous=(), checksum=False):
+        with redirect_stdout(io.StringIO()):
+            return sync_static(self.static, self.public, previous, checksum)
+
+
+    def test_copies_new_files(self):
+        synced = self.sync()
+        self.assertEqual(sorted(synced), [
+            os.path.join(self.public, "images", "cat.png"),
+            os.path.join(self.public, "index.css"),
+        ])
+        with open(os.path.join(self.public, "index.css"), 'r') as f:
+            self.assertEqual(f.read(), "body {}")
+
+
+    def test_unchanged_files_keep_mtime(self):
+        self.sync()
+        css = os.path.join(self.public, "index.css")
+        os.utime(css, ns=(0, 0))
+        os.utime(os.path.join(self.static, "index.css"), ns=(0, 0))
+        self.sync()
+        self.assertEqual(os.stat(css).st_mtime_ns, 0)
+
+
+    def test_changed_file_is_copied(self):
+        self.sync()
+        self.write("static/index.css", "body { margin: 0 }")
+        self.sync()
+        with open(os.path.join(self.public, "index.css"), 'r') as f:
+            self.assertEqual(f.read(), "body { margin: 0 }")
+
+
+    def test_checksum(self):
+        self.sync()
+        src = self.write("static/index.css", "body {{}")
+        dest = self.write("public/index.css", "body {}}")
+        os.utime(src, ns=(0, 0))
+        os.utime(dest, ns=(0, 0))
+        self.assertFalse(files_differ(src, dest))
+        self.assertTrue(files_differ(src, dest, checksum=True))
+
+
+    def test_stale_files_are_removed(self):
+        synced = self.sync()
+        page = self.write("public/index.html", "<p>page</p>")
+        os.remove(os.path.join(self.static, "index.css"))
+        self.sync(previous=synced)
+        self.assertFalse(os.path.exists(os.path.join(self.public, "index.css")))
+        # files that were never synced from static are left alone
+        self.assertTrue(os.path.exists(page))
+
+
+if __name__ == "__main__":
+    unittest.main()
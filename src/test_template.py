@@ -0,0 +1,69 @@
+import io
+import pickle
+import unittest
+from template import Template
+
+
+class TestTemplate(unittest.TestCase):
+    def test_compile(self):
+        template = Template("<title>{{ Title }}</title><main>{{ Content }}</main>")
+        self.assertEqual(template.slots, ["Title", "Content"])
+        self.assertEqual(
+            template.fragments, ["<title>", "</title><main>", "</main>"]
+        )
+
+
+    def test_render(self):
+        template = Template("<title> {{ Title }} </title>{{ Content }}")
+        self.assertEqual(
+            template.render(Title="Home", Content="<p>hi</p>"),
+            "<title> Home </title><p>hi</p>"
+        )
+
+
+    def test_repeated_and_missing_slots(self):
+        template = Template("{{ Title }}|{{ Title }}|{{ Author }}")
+        self.assertEqual(
+            template.render(Title="Home"), "Home|Home|{{ Author }}"
+        )
+
+
+    def test_no_slots(self):
+        template = Template("<p>static</p>")
+        self.assertEqual(template.render(Title="Home"), "<p>static</p>")
+
+
+    def test_values_are_not_rescanned(self):
+        template = Template("{{ Title }}{{ Content }}")
+        self.assertEqual(
+            template.render(Title="{{ Content }}", Content="body"),
+            "{{ Content }}body"
+        )
+
+
+    def test_write(self):
+        template = Template("<title>{{ Title }}</title>{{ Content }}")
+        f = io.StringIO()
+        template.write(f, Title="Home", Content=iter(["<p>", "hi", "</p>"]))
+        self.assertEqual(f.getvalue(), "<title>Home</title><p>hi</p>")
+
+
+    def test_split(self):
+        template = Template("<title>{{ Title }}</title><main>{{ Content }}"
+                            "</main>{{ Author }}")
+        self.assertEqual(template.split("Content", Title="Home"),
+                         ("<title>Home</title><main>", "</main>{{ Author }}"))
+        for text in ["{{ Title }}", "{{ Content }}{{ Content }}"]:
+            with self.assertRaises(ValueError):
+                Template(text).split("Content")
+
+
+    def test_picklable(self):
+        template = Template("<h1>{{ Title }}</h1>", path="template.html")
+        copy = pickle.loads(pickle.dumps(template))
+        self.assertEqual(copy.render(Title="Home"), "<h1>Home</h1>")
+        self.assertEqual(copy.path, "template.html")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -43,6 +43,30 @@ class TestTextNodetoHTMLNode(unittest.TestCase):
         self.assertEqual(text_node_to_html_node(text_node).to_html(), html)
 
 
+    def test_invalid_type(self):
+        with self.assertRaises(ValueError):
+            text_node_to_html_node(TextNode("text", "underline"))
+
+
+    def test_short_leaves_are_shared(self):
+        first = text_node_to_html_node(TextNode(" and ", "text"))
+        second = text_node_to_html_node(TextNode(" and ", "text"))
+        self.assertIs(first, second)
+        with self.assertRaises(AttributeError):
+            first.value = "changed"
+        long_text = "a" * 100
+        self.assertIsNot(
+            text_node_to_html_node(TextNode(long_text, "bold")),
+            text_node_to_html_node(TextNode(long_text, "bold"))
+        )
+
+
+    def test_slots(self):
+        node = TextNode("text", "bold")
+        self.assertFalse(hasattr(node, "__dict__"))
+        self.assertFalse(hasattr(text_node_to_html_node(node), "__dict__"))
+
+
 if __name__ == "__main__":
     unittest.main()
 
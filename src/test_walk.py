@@ -0,0 +1,76 @@
+import os
+import sys
+import tempfile
+import unittest
+from walk import walk_tree
+
+
+class TestWalkTree(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+
+    def touch(self, *parts):
+        path = os.path.join(self.root, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write("")
+        return path
+
+
+    def test_order(self):
+        self.touch("b.md")
+        self.touch("a.md")
+        self.touch("sub2", "d.md")
+        self.touch("sub1", "inner", "c.md")
+        walked = [
+            (rel_dir, [entry.name for entry in files])
+            for _, rel_dir, files in walk_tree(self.root)
+        ]
+        self.assertEqual(walked, [
+            ("", ["a.md", "b.md"]),
+            ("sub1", []),
+            (os.path.join("sub1", "inner"), ["c.md"]),
+            ("sub2", ["d.md"]),
+        ])
+
+
+    def test_deeper_than_recursion_limit(self):
+        # os.makedirs recurses once per missing directory, so the tree is
+        # created one level at a time
+        dir_path = self.root
+        for _ in range(sys.getrecursionlimit() + 100):
+            dir_path = os.path.join(dir_path, "d")
+            os.mkdir(dir_path)
+        path = os.path.join(dir_path, "page.md")
+        with open(path, 'w') as f:
+            f.write("")
+        files = [
+            entry.path for _, _, entries in walk_tree(self.root)
+            for entry in entries
+        ]
+        self.assertEqual(files, [path])
+        # shutil.rmtree recurses too, so remove the tree bottom up
+        os.remove(path)
+        while dir_path != self.root:
+            os.rmdir(dir_path)
+            dir_path = os.path.dirname(dir_path)
+
+
+    def test_symlink_cycle(self):
+        self.touch("sub", "page.md")
+        os.symlink(self.root, os.path.join(self.root, "sub", "loop"))
+        files = [
+            entry.name for _, _, entries in walk_tree(self.root)
+            for entry in entries
+        ]
+        self.assertEqual(files, ["page.md"])
+
+
+if __name__ == "__main__":
+    unittest.main()
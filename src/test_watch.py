@@ -0,0 +1,76 @@
+import os
+import unittest
+from fixtures import TempDirMixin
+from watch import (EVENT_HEADER, IN_Q_OVERFLOW, RESCAN, InotifyWatcher,
+                   PollingWatcher, _load_inotify)
+
+
+class WatcherTests(TempDirMixin):
+    def setUp(self):
+        super().setUp()
+        self.content = os.path.join(self.tmp.name, "content")
+        self.template = self.write("template.html", "{{ Content }}")
+        self.page = self.write("content/index.md", "# Home")
+        self.watcher = self.make_watcher([self.content], [self.template])
+
+
+    def tearDown(self):
+        self.watcher.close()
+
+
+    def test_modified_file(self):
+        self.write("content/index.md", "# Home page")
+        self.assertEqual(self.watcher.wait(timeout=2), {self.page})
+
+
+    def test_new_file_in_new_dir(self):
+        page = self.write("content/blog/post.md", "# Post")
+        self.assertEqual(self.watcher.wait(timeout=2), {page})
+
+
+    def test_deleted_file(self):
+        os.remove(self.page)
+        self.assertEqual(self.watcher.wait(timeout=2), {self.page})
+
+
+    def test_single_file(self):
+        self.write("template.html", "<div>{{ Content }}</div>")
+        self.write("other.html", "not watched")
+        self.assertEqual(self.watcher.wait(timeout=2), {self.template})
+
+
+    def test_timeout(self):
+        self.assertEqual(self.watcher.wait(timeout=0.05), set())
+
+
+class TestPollingWatcher(WatcherTests, unittest.TestCase):
+    def make_watcher(self, dirs, files):
+        return PollingWatcher(dirs, files, interval=0.01)
+
+
+    def write(self, name, text):
+        path = super().write(name, text)
+        # make every write visible even on filesystems with coarse mtimes
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        return path
+
+
+@unittest.skipIf(_load_inotify() is None, "inotify is not available")
+class TestInotifyWatcher(WatcherTests, unittest.TestCase):
+    def make_watcher(self, dirs, files):
+        return InotifyWatcher(dirs, files)
+
+
+    def test_overflow(self):
+        # a queue overflow asks for a rescan and picks up new directories
+        os.makedirs(os.path.join(self.content, "new"))
+        changed = set()
+        self.watcher._handle_events(EVENT_HEADER.pack(-1, IN_Q_OVERFLOW, 0, 0),
+                                    changed)
+        self.assertEqual(changed, {RESCAN})
+        self.assertIn(os.path.join(self.content, "new"),
+                      self.watcher._watches.values())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,8 @@
-from htmlnode import LeafNode
+from htmlnode import LeafNode, FrozenLeafNode
 
 class TextNode:
+    __slots__ = ("text", "text_type", "url")
+
     def __init__(self, text, text_type, url=None):
         self.text = text
         self.text_type = text_type
@@ -21,24 +23,46 @@ class TextNode:
         return f"TextNode({self.text}, {self.text_type}, {self.url})"
 
 
+# leaves of at most this many characters are shared between text nodes
+SHARED_LEAF_MAX_LENGTH = 32
+SHARED_LEAF_MAX_COUNT = 4096
+_shared_leaves = {}
+
+
+def _text_leaf(tag, text):
+    if len(text) > SHARED_LEAF_MAX_LENGTH:
+        return LeafNode(tag, text)
+    key = (tag, text)
+    leaf = _shared_leaves.get(key)
+    if leaf is None:
+        leaf = FrozenLeafNode(tag, text)
+        if len(_shared_leaves) < SHARED_LEAF_MAX_COUNT:
+            _shared_leaves[key] = leaf
+    return leaf
+
+
+TEXT_TYPES_TO_HTML_NODES = {
+    "text": lambda node: _text_leaf(None, node.text),
+    "bold": lambda node: _text_leaf("b", node.text),
+    "italic": lambda node: _text_leaf("i", node.text),
+    "code": lambda node: _text_leaf("code", node.text),
+    "link": lambda node: LeafNode(
+        tag="a", props={"href": node.url}, value=node.text
+    ),
+    "image": lambda node: LeafNode(
+        tag="img", props={"src": node.url, "alt": node.text}, value=""
+    ),
+}
+
+
 def text_node_to_html_node(text_node: TextNode) -> LeafNode:
-    text_types_to_html_args = {
-        "text": {"value": text_node.text},
-        "bold": {"tag": "b", "value": text_node.text},
-        "italic": {"tag": "i", "value": text_node.text},
-        "code": {"tag": "code", "value": text_node.text},
-        "link": {
-            "tag": "a",
-            "props": {"href": text_node.url}, "value": text_node.text
-        },
-        "image": {"tag": "img",
-                  "props": {"src": text_node.url, "alt": text_node.text},
-                  "value": ""
-        },
-    }
-
-    if not text_node.text_type in text_types_to_html_args:
-        raise ValueError(f"{text_node.text_type} is not a valid text type")
-    html_node = LeafNode(**text_types_to_html_args[text_node.text_type])
-    return html_node
+    """Convert a TextNode to the LeafNode that renders it.
 
+    Leaves of short plain, bold, italic and code text are shared
+    FrozenLeafNode instances and can't be modified.
+    """
+    try:
+        to_html_node = TEXT_TYPES_TO_HTML_NODES[text_node.text_type]
+    except KeyError:
+        raise ValueError(f"{text_node.text_type} is not a valid text type")
+    return to_html_node(text_node)
@@ -0,0 +1,40 @@
+import os
+
+
+def walk_tree(root):
+    """Yield (dir_path, rel_dir, files) for root and every directory under it.
+
+    files are the os.DirEntry objects of the directory's non-directory
+    entries, sorted by name, and rel_dir is the directory relative to root
+    ("" for root itself). Directories come before their subdirectories,
+    in sorted order. The walk uses an explicit stack and the entry types
+    reported by os.scandir, so it doesn't recurse or stat every entry
+    again, however deep the tree is. Symlinked directories are followed,
+    but each directory is only visited once.
+    """
+    stack = [(root, "")]
+    visited = set()
+    while stack:
+        dir_path, rel_dir = stack.pop()
+        try:
+            stat = os.stat(dir_path)
+        except FileNotFoundError:
+            continue
+        if (stat.st_dev, stat.st_ino) in visited:
+            continue
+        visited.add((stat.st_dev, stat.st_ino))
+        try:
+            with os.scandir(dir_path) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except FileNotFoundError:
+            continue
+        files = []
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir():
+                subdirs.append(entry)
+            else:
+                files.append(entry)
+        yield dir_path, rel_dir, files
+        for entry in reversed(subdirs):
+            stack.append((entry.path, os.path.join(rel_dir, entry.name)))
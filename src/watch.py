@@ -0,0 +1,225 @@
+import os
+import sys
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+from walk import walk_tree
+
+# inotify event flags, see inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM
+              | IN_MOVED_TO | IN_CREATE | IN_DELETE)
+EVENT_HEADER = struct.Struct("iIII")
+
+# time to keep collecting events after the first one, so that an editor
+# saving a file in several writes triggers a single rebuild
+DEBOUNCE_SECONDS = 0.02
+# returned among the changed paths when changes were lost, in which case
+# everything has to be checked again
+RESCAN = "<rescan>"
+
+
+class PollingWatcher:
+    """Detects changes by comparing (mtime, size) snapshots of the tree.
+
+    Works everywhere; a snapshot costs one stat per watched file.
+    """
+    def __init__(self, dirs, files=(), interval=0.25):
+        self.dirs = [os.path.normpath(path) for path in dirs]
+        self.files = [os.path.normpath(path) for path in files]
+        self.interval = interval
+        self._snapshot = self._take_snapshot()
+
+
+    def _take_snapshot(self) -> dict:
+        paths = list(self.files)
+        for root in self.dirs:
+            for _, _, files in walk_tree(root):
+                paths.extend(entry.path for entry in files)
+        snapshot = {}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+
+    def poll(self) -> set:
+        snapshot = self._take_snapshot()
+        changed = {
+            path for path in snapshot.keys() | self._snapshot.keys()
+            if snapshot.get(path) != self._snapshot.get(path)
+        }
+        self._snapshot = snapshot
+        return changed
+
+
+    def wait(self, timeout=None) -> set:
+        """Block until something changed and return the changed file paths."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = self.poll()
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            time.sleep(self.interval)
+
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Detects changes through Linux inotify, without scanning the tree.
+
+    Every directory under dirs gets its own watch, and directories created
+    later are added as their events arrive. Single files are watched
+    through their parent directory so that editors replacing the file on
+    save don't drop the watch.
+    """
+    def __init__(self, dirs, files=()):
+        self._libc = _load_inotify()
+        if self._libc is None:
+            raise OSError("inotify is not available")
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watches = {}
+        self._recursive = set()
+        self.dirs = [os.path.normpath(path) for path in dirs]
+        self.files = {os.path.normpath(path) for path in files}
+        for dir_path in self.dirs:
+            self._add_tree(dir_path)
+        for path in self.files:
+            self._add_watch(os.path.dirname(path) or ".")
+
+
+    def _add_watch(self, dir_path):
+        wd = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(dir_path), WATCH_MASK
+        )
+        if wd >= 0:
+            self._watches[wd] = dir_path
+        return wd
+
+
+    def _add_tree(self, root, changed=None):
+        for dir_path, _, files in walk_tree(root):
+            if self._add_watch(dir_path) < 0:
+                continue
+            self._recursive.add(dir_path)
+            if changed is not None:
+                # files that were in the directory before its watch existed
+                changed.update(entry.path for entry in files)
+
+
+    def _remove_tree(self, dir_path):
+        prefix = dir_path + os.sep
+        for wd, path in list(self._watches.items()):
+            if path == dir_path or path.startswith(prefix):
+                self._libc.inotify_rm_watch(self._fd, wd)
+                del self._watches[wd]
+                self._recursive.discard(path)
+
+
+    def _read_events(self, changed):
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return
+        self._handle_events(data, changed)
+
+
+    def _handle_events(self, data, changed):
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # events were dropped, directories created meanwhile among
+                # them: watch whatever is missing and have everything checked
+                for dir_path in self.dirs:
+                    self._add_tree(dir_path)
+                changed.add(RESCAN)
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            dir_path = self._watches.get(wd)
+            if dir_path is None or not name:
+                continue
+            path = os.path.normpath(os.path.join(dir_path, name))
+            if dir_path not in self._recursive:
+                # parent directory of a single watched file
+                if path in self.files:
+                    changed.add(path)
+                continue
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_tree(path, changed)
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    # the directory itself is reported, its files produce
+                    # no events of their own when it is moved away
+                    self._remove_tree(path)
+                    changed.add(path)
+                continue
+            changed.add(path)
+
+
+    def wait(self, timeout=None) -> set:
+        """Block until something changed and return the changed file paths,
+        or RESCAN among them if the kernel dropped events."""
+        changed = set()
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return changed
+        self._read_events(changed)
+        while select.select([self._fd], [], [], DEBOUNCE_SECONDS)[0]:
+            self._read_events(changed)
+        return changed
+
+
+    def close(self):
+        os.close(self._fd)
+
+
+def _load_inotify():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [
+            ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32
+        ]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+def make_watcher(dirs, files=()):
+    """Return an InotifyWatcher where supported, else a PollingWatcher."""
+    try:
+        return InotifyWatcher(dirs, files)
+    except OSError:
+        return PollingWatcher(dirs, files)